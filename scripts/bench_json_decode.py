@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+WebSocket 消息解码基准测试
+对比"路由解码一次 + 处理函数再解码一次"的旧路径与"只解码一次"的新路径，
+并列出本机可用的各个解码器的单条消息耗时；
+再对比"解码为 dict 后构建事件对象"与 msgspec "直接解码为事件对象"（events.decode_event）
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src', 'multi_bot'))
+import fastjson
+import events
+
+BOOK_TICKER = json.dumps({
+    "e": "bookTicker", "u": 400900217, "E": 1568014460893, "T": 1568014460891,
+    "s": "BTCUSDT", "b": "25.35190000", "B": "31.21000000", "a": "25.36520000", "A": "40.66000000",
+})
+
+ORDER_TRADE_UPDATE = json.dumps({
+    "e": "ORDER_TRADE_UPDATE", "E": 1568879465651, "T": 1568879465650,
+    "o": {
+        "s": "BTCUSDT", "c": "x-TBzTen1X-1a2b3c4d", "S": "SELL", "o": "LIMIT", "f": "GTC",
+        "q": "0.001", "p": "64000.10", "ap": "0", "sp": "0", "x": "NEW", "X": "NEW",
+        "i": 8886774, "l": "0", "z": "0", "L": "0", "T": 1568879465650, "t": 0,
+        "b": "0", "a": "9.91", "m": False, "R": True, "wt": "CONTRACT_PRICE", "ot": "LIMIT",
+        "ps": "LONG", "cp": False, "rp": "0", "pP": False, "si": 0, "ss": 0,
+    },
+})
+
+
+def _route(data):
+    """模拟接收端按事件类型分发"""
+    return data.get("e")
+
+
+def bench(decoder, messages, number):
+    """返回旧路径和新路径的单条消息平均耗时（微秒）"""
+    def old_path():
+        for message in messages:
+            _route(decoder(message))
+            decoder(message)
+
+    def new_path():
+        for message in messages:
+            _route(decoder(message))
+
+    old = min(timeit.repeat(old_path, number=number, repeat=5)) / (number * len(messages))
+    new = min(timeit.repeat(new_path, number=number, repeat=5)) / (number * len(messages))
+    return old * 1e6, new * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WebSocket 消息解码基准测试')
+    parser.add_argument('--number', type=int, default=20000, help='每轮解码次数')
+    args = parser.parse_args()
+
+    messages = [BOOK_TICKER, ORDER_TRADE_UPDATE]
+    print(f"当前默认解码器: {fastjson.BACKEND}")
+    print(f"{'解码器':<10}{'旧路径(us/条)':>16}{'新路径(us/条)':>16}{'节省':>10}")
+
+    baseline = None
+    for name in ('json', 'orjson', 'msgspec'):
+        try:
+            decoder = fastjson.DECODERS[name]()
+        except ImportError:
+            print(f"{name:<10}{'未安装':>16}")
+            continue
+        old, new = bench(decoder, messages, args.number)
+        if baseline is None:
+            baseline = old
+        print(f"{name:<10}{old:>16.2f}{new:>16.2f}{(1 - new / baseline) * 100:>9.1f}%")
+
+    main_events(messages, args.number)
+
+
+def bench_events(decoder, messages, number):
+    """返回"解码为 dict 再构建事件对象"的单条消息平均耗时（微秒）"""
+    builders = [events.decode_book_ticker, events.decode_order_update]
+
+    def dict_path():
+        for message, build in zip(messages, builders):
+            build(decoder(message))
+
+    return min(timeit.repeat(dict_path, number=number, repeat=5)) / (number * len(messages)) * 1e6
+
+
+def bench_typed(messages, number):
+    """返回 msgspec 直接解码为事件对象的单条消息平均耗时（微秒）"""
+    def typed_path():
+        for message in messages:
+            events.decode_event(message)
+
+    return min(timeit.repeat(typed_path, number=number, repeat=5)) / (number * len(messages)) * 1e6
+
+
+def main_events(messages, number):
+    print()
+    print("事件对象构建（解码 + BookTicker/OrderUpdate）")
+    print(f"{'路径':<24}{'us/条':>10}")
+    for name in ('json', 'orjson', 'msgspec'):
+        try:
+            decoder = fastjson.DECODERS[name]()
+        except ImportError:
+            continue
+        print(f"{name + ' dict + 对象':<24}{bench_events(decoder, messages, number):>10.2f}")
+    if events.msgspec is None:
+        print(f"{'msgspec 直接解码':<24}{'未安装':>10}")
+    else:
+        print(f"{'msgspec 直接解码':<24}{bench_typed(messages, number):>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
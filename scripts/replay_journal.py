@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+流量日志回放
+把 CAPTURE_DIR 录制的 .asgj 日志离线喂回 BinanceGridBot（REST 由录制的响应作答），
+用于复现线上延迟问题、对比改动前后的吞吐，以及确认下单决策没有变化
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+# 回放不发通知、不再录制，状态文件写到临时目录，避免影响实盘状态
+os.environ['ENABLE_NOTIFICATIONS'] = 'false'
+os.environ['TELEGRAM_BOT_TOKEN'] = ''
+os.environ['CAPTURE_DIR'] = ''
+os.environ.setdefault('STATE_DIR', tempfile.mkdtemp(prefix='asgrid_replay_'))
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src', 'multi_bot'))
+from replay import replay
+
+
+def main():
+    parser = argparse.ArgumentParser(description='流量日志回放')
+    parser.add_argument('journal', help='录制的 .asgj 文件')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放倍速，0 表示尽可能快（默认 1）')
+    parser.add_argument('--tick-interval-ms', type=int, default=None, help='覆盖行情决策最小间隔')
+    args = parser.parse_args()
+
+    overrides = {}
+    if args.tick_interval_ms is not None:
+        overrides['tick_interval_ms'] = args.tick_interval_ms
+
+    result = asyncio.run(replay(args.journal, args.speed, overrides))
+
+    print(f"交易对: {result['symbol']}  状态目录: {os.environ['STATE_DIR']}")
+    print(f"推送: {result['frames']} 条，用时 {result['elapsed']:.2f}s，{result['frames_per_second']:.0f} 条/秒，"
+          f"决策 {result['decisions']} 次")
+    print(f"下单/撤单请求: 录制 {result['recorded_orders']}，回放 {result['replayed_orders']}，"
+          f"相似度 {result['order_similarity'] * 100:.1f}%，未匹配请求 {result['unmatched_requests']}")
+    if result['orders_identical']:
+        print("决策一致")
+    else:
+        print(f"决策不一致，第一处差异: {result['first_difference']}")
+    for span, stats in sorted(result['latency'].items()):
+        if stats.get('count'):
+            print(f"  {span:<32} n={stats['count']:<8} p50={stats[0.5] * 1000:.2f}ms "
+                  f"p99={stats[0.99] * 1000:.2f}ms p999={stats[0.999] * 1000:.2f}ms")
+    return 0 if result['orders_identical'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
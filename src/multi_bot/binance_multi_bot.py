@@ -7,25 +7,46 @@ import hashlib
 import time
 import ccxt
 import math
+import functools
+import contextvars
+import threading
+import concurrent.futures
+from urllib.parse import urlsplit
 from decimal import Decimal, ROUND_HALF_UP
 import os
 from dotenv import load_dotenv
 import aiohttp
 
-# 加载环境变量
+# 加载环境变量（先于下面的模块导入，它们在导入时读取环境变量）
 load_dotenv()
 
+from rate_limiter import get_shared_budget, request_priority, PRIORITY_CRITICAL
+from stream_queue import StreamQueue, OVERFLOW_BLOCK
+from events import BookTicker, OrderUpdate, decode_book_ticker, decode_order_update, decode_event, event_message
+from order_registry import TERMINAL_STATUSES, OrderRegistry
+import market_cache
+from latency import LatencyTracer, use_tracer, record_current
+import profiler
+import loop_watchdog
+import traffic_journal
+
 # Telegram 通知配置
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
 ENABLE_NOTIFICATIONS = os.getenv("ENABLE_NOTIFICATIONS", "true").lower() == "true"
 NOTIFICATION_INTERVAL = int(os.getenv("NOTIFICATION_INTERVAL", "3600"))
 
+# 本地交易所模拟器地址（如 http://127.0.0.1:8090，见 exchange_sim.py），设置后 REST 和 WebSocket 都连接模拟器
+EXCHANGE_SIM_URL = os.getenv("EXCHANGE_SIM_URL", "").rstrip("/")
+BINANCE_FUTURES_API = "https://fapi.binance.com"
+
 # 固定配置
-WEBSOCKET_URL = "wss://fstream.binance.com/ws"
+WEBSOCKET_URL = f"{EXCHANGE_SIM_URL.replace('http', 'ws', 1)}/ws" if EXCHANGE_SIM_URL else "wss://fstream.binance.com/ws"
 ORDER_COOLDOWN_TIME = 60
 SYNC_TIME = 3
 ORDER_FIRST_TIME = 1
+# 热重启快照格式版本，字段含义变化时递增，旧快照不再恢复
+SNAPSHOT_VERSION = 1
 
 # 使用优化的日志配置
 try:
@@ -72,11 +93,116 @@ except ImportError:
     threshold_logger = None
 
 
+# 已确认为双向持仓模式的账户（按 API Key）。持仓模式是账户级设置，启动时由第一个机器人（或启动流程的预加载阶段）检查一次
+_hedge_mode_confirmed = set()
+_hedge_mode_lock = threading.Lock()
+
+
+def ensure_hedge_mode(exchange, symbol=None):
+    """检查并启用双向持仓模式；同一账户已确认过则直接返回，并发调用时只有一个线程访问交易所"""
+    with _hedge_mode_lock:
+        if exchange.apiKey in _hedge_mode_confirmed:
+            return
+        if _check_and_enable_hedge_mode(exchange, symbol):
+            _hedge_mode_confirmed.add(exchange.apiKey)
+
+
+def _check_and_enable_hedge_mode(exchange, symbol=None):
+    """检查并启用双向持仓模式，返回是否已确认为双向持仓"""
+    try:
+        try:
+            position_mode = exchange.fetch_position_mode(symbol=symbol)
+            if not position_mode['hedged']:
+                logger.info("当前不是双向持仓模式，尝试自动启用双向持仓模式...")
+                _enable_hedge_mode(exchange)
+                logger.info("双向持仓模式已成功启用，程序继续运行。")
+            else:
+                logger.info("当前已是双向持仓模式，程序继续运行。")
+            return True
+        except AttributeError:
+            logger.info("无法检查当前持仓模式，尝试启用双向持仓模式...")
+            _enable_hedge_mode(exchange)
+            logger.info("双向持仓模式已启用，程序继续运行。")
+            return True
+        except Exception as e:
+            logger.warning(f"检查持仓模式时出现异常: {e}")
+            logger.info("程序将继续运行，请确保已在币安手动启用双向持仓模式")
+            return False
+
+    except Exception as e:
+        if "No need to change position side" in str(e):
+            logger.info("双向持仓模式已经启用，程序继续运行。")
+            return True
+        else:
+            logger.error(f"启用双向持仓模式失败: {e}")
+            logger.error("请手动在币安交易所启用双向持仓模式后再运行程序")
+            raise e
+
+
+def _enable_hedge_mode(exchange):
+    """启用双向持仓模式"""
+    try:
+        params = {
+            'dualSidePosition': 'true',
+        }
+        response = exchange.fapiPrivatePostPositionSideDual(params)
+        logger.info(f"启用双向持仓模式: {response}")
+    except AttributeError:
+        try:
+            response = exchange.fapiPrivatePostPositionSideDual({'dualSidePosition': 'true'})
+            logger.info(f"启用双向持仓模式: {response}")
+        except Exception as e:
+            logger.error(f"启用双向持仓模式失败: {e}")
+            logger.error("请手动在币安交易所启用双向持仓模式")
+            raise e
+    except Exception as e:
+        if "No need to change position side" in str(e):
+            logger.info("双向持仓模式已经启用，无需切换")
+            return
+        else:
+            logger.error(f"启用双向持仓模式失败: {e}")
+            logger.error("请手动在币安交易所启用双向持仓模式")
+            raise e
+
+
 class CustomBinance(ccxt.binance):
+    def __init__(self, config={}):
+        super().__init__(config)
+        # 机器人只交易 U 本位合约，市场信息只加载 linear（默认还会加载现货和币本位）
+        self.options['fetchMarkets'] = ['linear']
+        if EXCHANGE_SIM_URL:
+            self.use_simulator(EXCHANGE_SIM_URL)
+
+    def use_simulator(self, base_url):
+        """把 U 本位合约 REST 地址指向本地模拟器（模拟器只提供 U 本位合约市场，不提供现货的币种信息接口）"""
+        for name, url in self.urls['api'].items():
+            if isinstance(url, str) and url.startswith(BINANCE_FUTURES_API):
+                self.urls['api'][name] = base_url + url[len(BINANCE_FUTURES_API):]
+        self.options['fetchCurrencies'] = False
+
     def fetch(self, url, method='GET', headers=None, body=None):
         if headers is None:
             headers = {}
-        return super().fetch(url, method, headers, body)
+        # 所有实例共用账户级请求预算：发送前按权重排队，收到响应后按响应头校准
+        budget = get_shared_budget()
+        budget.acquire(method, url, body)
+        started = time.monotonic()
+        response = None
+        failure = None
+        try:
+            response = super().fetch(url, method, headers, body)
+            return response
+        except Exception as e:
+            failure = e
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            budget.record_latency(method, url, elapsed, failure is not None)
+            record_current(f"rest {method.upper()} {urlsplit(url).path}", elapsed)
+            budget.update_from_headers(self.last_response_headers)
+            journal = traffic_journal.current_journal()
+            if journal is not None:
+                journal.write_rest(method, url, body, response, failure)
 
 
 class BinanceGridBot:
@@ -97,6 +223,9 @@ class BinanceGridBot:
             p = Path(base).resolve()
         else:
             p = Path(__file__).resolve().parent / "state"
+        if self.paper:
+            # 纸面交易的状态与实盘分开，同一交易对的多个纸面机器人按 id 区分
+            p = p / "paper" / str(self.config.get('id') or self.symbol)
         p.mkdir(parents=True, exist_ok=True)
         return p
 
@@ -210,6 +339,136 @@ class BinanceGridBot:
         except Exception as e:
             logger.error(f"读取装死状态失败: {e} @ {path}", exc_info=True)
 
+    # ===== 热重启快照 =====
+    # 网格价位：仅在持仓和网格参数与快照一致时恢复
+    _SNAPSHOT_GRID_FIELDS = (
+        'mid_price_long', 'lower_price_long', 'upper_price_long',
+        'mid_price_short', 'lower_price_short', 'upper_price_short',
+        'long_initial_quantity', 'short_initial_quantity', '_ladder_anchor',
+    )
+    # 冷却时间、紧急减仓计数、日内封盘和通知状态：快照未过期即恢复。
+    # 不包含 _emg_in_progress 等进行中标志：重启后对应的任务已不存在，恢复后无人清除
+    _SNAPSHOT_STATE_FIELDS = (
+        'last_long_order_time', 'last_short_order_time', 'last_summary_time',
+        '_emg_last_ts', '_emg_trigger_count_today', '_grid_pause_until_ts',
+        '_day_fuse_on', '_emg_day',
+        'long_threshold_alerted', 'short_threshold_alerted', 'risk_reduction_alerted',
+        'long_double_profit_alerted', 'short_double_profit_alerted',
+    )
+
+    def _snapshot_path(self):
+        safe_symbol = str(self.symbol).replace("/", "_")
+        return self._state_dir() / f"snapshot_{safe_symbol}.json"
+
+    def _load_snapshot(self):
+        """读取热重启快照，不存在、损坏或已关闭快照时返回 None"""
+        if self.snapshot_interval_s <= 0:
+            return None
+        path = self._snapshot_path()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取快照失败: {e} @ {path}")
+            return None
+
+    def _capture_snapshot(self):
+        """在事件循环中复制一份运行状态（只做浅拷贝，序列化和写文件交给线程池）"""
+        grid = {name: getattr(self, name) for name in self._SNAPSHOT_GRID_FIELDS}
+        grid.update({
+            'grid_spacing': self.grid_spacing,
+            'grid_levels': self.grid_levels,
+            'ladder_center': dict(self._ladder_center),
+            'ladder_entry_prices': {side: list(prices) for side, prices in self.ladder_entry_prices.items()},
+        })
+        return {
+            'version': SNAPSHOT_VERSION,
+            'ts': time.time(),
+            'positions': {'long': self.long_position, 'short': self.short_position},
+            'grid': grid,
+            'state': {name: getattr(self, name) for name in self._SNAPSHOT_STATE_FIELDS},
+            'vol_prices': list(self._vol_prices),
+            'registry': self.order_registry.checkpoint(),
+        }
+
+    def _apply_snapshot(self, snapshot):
+        """
+        用快照恢复运行状态（启动时在持仓和挂单同步之后调用）
+
+        Returns:
+            bool: 是否恢复了网格价位
+        """
+        age = time.time() - float(snapshot.get('ts', 0))
+        if snapshot.get('version') != SNAPSHOT_VERSION or not 0 <= age <= self.snapshot_max_age_s:
+            logger.info(f"快照已过期或版本不符（{age:.0f} 秒前），不恢复运行状态")
+            return False
+
+        state = snapshot.get('state') or {}
+        for name in self._SNAPSHOT_STATE_FIELDS:
+            if name in state:
+                setattr(self, name, state[name])
+        self._vol_prices.extend(float(price) for price in snapshot.get('vol_prices') or [])
+        self._reset_emg_daily_counter_if_new_day()
+
+        # 停机期间有成交或网格参数已修改时，网格价位按当前行情重建
+        positions = snapshot.get('positions') or {}
+        grid = snapshot.get('grid') or {}
+        precision = self.amount_precision
+        same_positions = all(
+            round(float(positions.get(side, -1)), precision) == round(float(getattr(self, f"{side}_position")), precision)
+            for side in ('long', 'short'))
+        same_params = grid.get('grid_spacing') == self.grid_spacing and grid.get('grid_levels') == self.grid_levels
+        if not (same_positions and same_params):
+            logger.info(f"已从快照恢复冷却和风控状态（{age:.0f} 秒前），持仓或网格参数有变化，网格价位重建")
+            return False
+
+        for name in self._SNAPSHOT_GRID_FIELDS:
+            if name in grid:
+                setattr(self, name, grid[name])
+        self._ladder_center = {'long': None, 'short': None}
+        self._ladder_center.update(grid.get('ladder_center') or {})
+        self.ladder_entry_prices = {side: list((grid.get('ladder_entry_prices') or {}).get(side, []))
+                                    for side in ('long', 'short')}
+        logger.info(f"已从快照恢复运行状态（{age:.0f} 秒前）: 多头中间价 {self.mid_price_long}, "
+                    f"空头中间价 {self.mid_price_short}, 今日紧急减仓 {self._emg_trigger_count_today} 次")
+        return True
+
+    def _foreign_loop(self):
+        """机器人事件循环仍在运行且当前不在该循环线程中时返回它，否则返回 None"""
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        loop = self._loop
+        if loop is None or loop is running_loop or loop.is_closed() or not loop.is_running():
+            return None
+        return loop
+
+    def _write_final_snapshot(self):
+        """停止时写最后一次快照：状态在机器人自己的事件循环中复制，避免与仍在运行的任务交错"""
+        loop = self._foreign_loop()
+        if loop is None:
+            snapshot = self._capture_snapshot()
+        else:
+            async def _capture():
+                return self._capture_snapshot()
+            snapshot = asyncio.run_coroutine_threadsafe(_capture(), loop).result(timeout=5)
+        self._atomic_write_json(self._snapshot_path(), snapshot)
+
+    async def _snapshot_loop(self):
+        """每 snapshot_interval_s 秒写一次快照"""
+        path = self._snapshot_path()
+        while self.running:
+            await asyncio.sleep(self.snapshot_interval_s)
+            if not self.running:
+                break
+            try:
+                await self._run_blocking(self._atomic_write_json, path, self._capture_snapshot())
+            except Exception as e:
+                logger.warning(f"写入快照失败: {e}")
+
     def _should_reuse_lock(self, side: str) -> bool:
         # Decide whether to reuse previous lockdown anchor upon re-entry (sticky).
         try:
@@ -273,7 +532,8 @@ class BinanceGridBot:
         except Exception as e:
             logger.error(f"退出装死持久化失败: {e}", exc_info=True)
 
-    def __init__(self, symbol, api_key, api_secret, config):
+    def __init__(self, symbol, api_key, api_secret, config, market_hub=None, user_hub=None,
+                 exchange=None, executor=None):
         """
         初始化 BinanceGridBot
         
@@ -286,11 +546,24 @@ class BinanceGridBot:
                 - initial_quantity: 初始交易数量
                 - leverage: 杠杆倍数
                 - contract_type: 合约类型 (USDT/USDC)
+            market_hub: 共享行情数据中心 (MarketDataHub)，为 None 时自行订阅 bookTicker
+            user_hub: 账户级用户数据流 (UserDataHub)，为 None 时自行获取 listenKey 并订阅订单推送
+            exchange: 共享的 CustomBinance 实例（已加载市场信息），为 None 时自行创建
+            executor: 执行阻塞 REST 调用的线程池，为 None 时使用事件循环默认线程池
         """
         self.symbol = symbol
         self.api_key = api_key
         self.api_secret = api_secret
         self.config = config
+        # 纸面交易模式（symbols.yaml 中 mode: paper）：下单、撤单、查询和订单推送由进程内撮合引擎提供
+        self.paper = str(config.get('mode', 'live')).lower() == 'paper'
+        self.market_hub = market_hub
+        self.user_hub = user_hub
+        self.executor = executor
+        
+        # 流量录制（CAPTURE_DIR 非空时开启）：构造期间的 REST 调用（市场信息、持仓模式等）也写入日志，供回放使用
+        self.journal = traffic_journal.open_capture(symbol, config)
+        journal_token = traffic_journal.use_journal(self.journal) if self.journal is not None else None
         
         # 从配置中提取参数
         self.grid_spacing = config.get('grid_spacing', 0.001)
@@ -304,12 +577,43 @@ class BinanceGridBot:
         self.position_threshold = self.position_threshold_factor * self.initial_quantity / self.grid_spacing * 2 / 100
         self.position_limit = self.position_limit_factor * self.initial_quantity / self.grid_spacing * 2 / 100
         
-        # 初始化交易所
-        self.exchange = self._init_exchange()
         self.ccxt_symbol = f"{symbol.replace('USDT', '').replace('USDC', '')}/{self.contract_type}:{self.contract_type}"
+        # 交易所推送中的交易对名称，如 BTCUSDT
+        self.exchange_symbol = f"{symbol.replace('USDT', '').replace('USDC', '')}{self.contract_type}".upper()
+        if self.paper:
+            from paper import PaperExchange
+            # 纸面交易所同时充当本机器人的用户数据流
+            self.exchange = PaperExchange(self.exchange_symbol, config)
+            self.user_hub = self.exchange
+        else:
+            # 初始化交易所（单事件循环模式下所有机器人共用同一实例，避免重复加载市场信息）
+            self.exchange = exchange if exchange is not None else self._init_exchange()
+
+        # 热重启快照：运行中每 snapshot_interval_s 秒（0 为关闭）写入 state/snapshot_<交易对>.json，
+        # 启动时恢复网格价位、冷却时间、紧急减仓计数等，并作为订单注册表的检查点
+        self.snapshot_interval_s = float(self.config.get('snapshot_interval_s', 5))
+        self.snapshot_max_age_s = float(self.config.get('snapshot_max_age_s', 900))
+        self._snapshot = self._load_snapshot()
+        self._snapshot_task = None
+        # 机器人运行所在的事件循环（start() 中记录），停止时在其中复制快照
+        self._loop = None
+        # 启动同步完成后才写快照，避免未同步的初始状态覆盖上一次的快照
+        self._synced = False
+
+        # 订单注册表：按 clientOrderId 跟踪本机器人的订单，状态变化和成交追加写入 state/orders_<交易对>.jsonl
+        self.order_registry = OrderRegistry(
+            self.exchange_symbol, str(self._state_dir() / f"orders_{self.exchange_symbol}.jsonl"))
+        try:
+            restored = self.order_registry.restore((self._snapshot or {}).get('registry'))
+            if restored:
+                logger.info(f"从订单日志恢复 {restored} 笔未完成订单")
+        except Exception as e:
+            logger.warning(f"回放订单日志失败: {e}")
         
         # 获取价格精度
         self._get_price_precision()
+        if self.journal is not None:
+            self.journal.write_meta({'market': self.exchange.market(self.ccxt_symbol)})
         
         # 初始化状态变量
         # === 紧急减仓配置与状态（Simple Plan, Fixed Quantity） ===
@@ -322,6 +626,23 @@ class BinanceGridBot:
         self.emg_batch_sleep_ms = int(self.config.get('emg_batch_sleep_ms', 300))
         self.emg_slip_cap_bp = int(self.config.get('emg_slip_cap_bp', 15))
         self.emg_daily_fuse_count = int(self.config.get('emg_daily_fuse_count', 3))
+        # 紧急减仓优先使用本地报价/持仓，超过以下时限未更新才回退 REST
+        # （订单推送连续时本地持仓由成交推送累加，不受该时限限制）
+        self.emg_quote_max_age_ms = int(self.config.get('emg_quote_max_age_ms', 1000))
+        self.emg_position_max_age_s = float(self.config.get('emg_position_max_age_s', 5))
+        # 限价减仓单等待成交的时限，超时未成交部分撤单后改市价
+        self.emg_fill_timeout_ms = int(self.config.get('emg_fill_timeout_ms', 1500))
+        # 按 clientOrderId 等待订单终态推送的 Future
+        self._order_waiters = {}
+
+        # 重挂时使用批量撤单/批量下单接口（失败时回退到逐笔撤挂）
+        self.use_batch_orders = bool(self.config.get('use_batch_orders', True))
+
+        # 多档网格：每个方向同时挂 grid_levels 档补仓单，价格取自以锚点为基准的等比格点
+        self.grid_levels = max(1, int(self.config.get('grid_levels', 1)))
+        self._ladder_anchor = None
+        self._ladder_center = {'long': None, 'short': None}
+        self.ladder_entry_prices = {'long': [], 'short': []}
 
         self._emg_last_ts = 0.0
         self._emg_in_progress = False
@@ -347,8 +668,54 @@ class BinanceGridBot:
         self.buy_short_orders = 0.0
         self.last_position_update_time = 0
         self.last_orders_update_time = 0
+        # 对账：推送正常时间隔逐次翻倍到 reconcile_max_interval_s，发现不一致、重连或漏推送时立即对账并回到 SYNC_TIME
+        self.reconcile_max_interval_s = float(self.config.get('reconcile_max_interval_s', 60))
+        self._reconcile_interval = SYNC_TIME
+        self._reconcile_due_ts = 0.0
+        self._seen_user_hub_reconnects = 0
+        # 重连或漏推送后置位，直到对账成功：期间本地持仓不可信
+        self._order_stream_gap = False
+        # 自建连接时订单推送是否已订阅（使用用户数据流中心时看其连接状态）
+        self._order_stream_up = False
+        self.reconcile_stats = {
+            'runs': 0,
+            'failures': 0,
+            'position_mismatches': 0,
+            'order_count_mismatches': 0,
+            'registry_mismatches': 0,
+            'stream_gaps': 0,
+            'reconnects': 0,
+            'last_run_ts': 0.0,
+        }
         self.last_ticker_update_time = 0
         self.latest_price = 0
+        # 行情合并：接收端只覆盖最新报价，决策任务每 tick_interval_ms 至多处理一次，
+        # 价格相对上次决策变动超过 tick_move_threshold_bp 时立即处理
+        self.tick_interval_ms = int(self.config.get('tick_interval_ms', 500))
+        self.tick_move_threshold_bp = float(self.config.get('tick_move_threshold_bp', self.grid_spacing * 10000 / 4))
+        self._decision_price = 0
+        self._last_decision_ts = 0.0
+        self._quote_event = None
+        self._urgent_event = None
+        self._decision_task = None
+        # 行情合并槽位的指标：收到/被合并的报价数，以及报价到被决策任务取走的延迟
+        self._ticks_received = 0
+        self._ticks_coalesced = 0
+        self._tick_lag = 0.0
+        self._tick_max_lag = 0.0
+        # 决策耗时（一次 _on_quote 的执行时间）
+        self._decision_count = 0
+        self._decision_seconds_total = 0.0
+        self._decision_last_seconds = 0.0
+        # 热路径各阶段耗时直方图（接收、解析、决策、各检查步骤、REST 调用、行情到下单）
+        self.tracer = LatencyTracer()
+        self._last_tick_perf = 0.0
+        self._decision_tick_perf = None
+        # 订单推送队列（不丢弃，满时阻塞接收端）及其消费任务
+        self.order_queue_size = int(self.config.get('order_queue_size', 1000))
+        self._order_queue = None
+        self._order_task = None
+        self._watchdog_task = None
         self.best_bid_price = None
         self.best_ask_price = None
         self.balance = {}
@@ -358,10 +725,13 @@ class BinanceGridBot:
         self.mid_price_short = 0
         self.lower_price_short = 0
         self.upper_price_short = 0
-        self.listenKey = self._get_listen_key()
+        # 使用账户级用户数据流时由其统一维护 listenKey
+        self.listenKey = self._get_listen_key() if self.user_hub is None else None
         
         # 检查持仓模式
         self._check_and_enable_hedge_mode()
+        if journal_token is not None:
+            traffic_journal.reset_journal(journal_token)
         
         # Telegram通知相关变量
         self.last_summary_time = 0
@@ -382,6 +752,9 @@ class BinanceGridBot:
         
         # 运行状态
         self.running = False
+        # 启动完成信号：持仓和挂单已同步、推送已订阅后 set_result(True)，启动失败时为异常。
+        # 可在其他线程 ready.result(timeout) 等待，或在事件循环中 await asyncio.wrap_future(ready)
+        self.ready = concurrent.futures.Future()
         
         # 装死模式状态记录（新增）
         self.lockdown_mode = {
@@ -398,13 +771,19 @@ class BinanceGridBot:
                 "defaultType": "future",
             },
         })
-        exchange.load_markets(reload=False)
+        # 市场信息来自进程内共享缓存（必要时下载一次或从磁盘加载）
+        market_cache.load_markets(exchange)
         return exchange
 
+    async def _run_blocking(self, fn, *args, **kwargs):
+        """在线程池中执行阻塞的 REST 调用，避免阻塞事件循环（携带当前上下文，如请求优先级）"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, fn, *args, **kwargs))
+
     def _get_price_precision(self):
         """获取交易对的价格精度、数量精度和最小下单数量"""
-        markets = self.exchange.fetch_markets()
-        symbol_info = next(market for market in markets if market["symbol"] == self.ccxt_symbol)
+        symbol_info = self.exchange.market(self.ccxt_symbol)
 
         # 获取价格精度
         price_precision = symbol_info["precision"]["price"]
@@ -468,60 +847,12 @@ class BinanceGridBot:
             raise e
 
     def _check_and_enable_hedge_mode(self):
-        """检查并启用双向持仓模式"""
-        try:
-            try:
-                position_mode = self.exchange.fetch_position_mode(symbol=self.ccxt_symbol)
-                if not position_mode['hedged']:
-                    logger.info("当前不是双向持仓模式，尝试自动启用双向持仓模式...")
-                    self._enable_hedge_mode()
-                    logger.info("双向持仓模式已成功启用，程序继续运行。")
-                else:
-                    logger.info("当前已是双向持仓模式，程序继续运行。")
-            except AttributeError:
-                logger.info("无法检查当前持仓模式，尝试启用双向持仓模式...")
-                self._enable_hedge_mode()
-                logger.info("双向持仓模式已启用，程序继续运行。")
-            except Exception as e:
-                logger.warning(f"检查持仓模式时出现异常: {e}")
-                logger.info("程序将继续运行，请确保已在币安手动启用双向持仓模式")
-                
-        except Exception as e:
-            if "No need to change position side" in str(e):
-                logger.info("双向持仓模式已经启用，程序继续运行。")
-            else:
-                logger.error(f"启用双向持仓模式失败: {e}")
-                logger.error("请手动在币安交易所启用双向持仓模式后再运行程序")
-                raise e
-
-    def _enable_hedge_mode(self):
-        """启用双向持仓模式"""
-        try:
-            params = {
-                'dualSidePosition': 'true',
-            }
-            response = self.exchange.fapiPrivatePostPositionSideDual(params)
-            logger.info(f"启用双向持仓模式: {response}")
-        except AttributeError:
-            try:
-                response = self.exchange.fapiPrivatePostPositionSideDual({'dualSidePosition': 'true'})
-                logger.info(f"启用双向持仓模式: {response}")
-            except Exception as e:
-                logger.error(f"启用双向持仓模式失败: {e}")
-                logger.error("请手动在币安交易所启用双向持仓模式")
-                raise e
-        except Exception as e:
-            if "No need to change position side" in str(e):
-                logger.info("双向持仓模式已经启用，无需切换")
-                return
-            else:
-                logger.error(f"启用双向持仓模式失败: {e}")
-                logger.error("请手动在币安交易所启用双向持仓模式")
-                raise e
+        """检查并启用双向持仓模式（账户级设置，同一账户只检查一次）"""
+        ensure_hedge_mode(self.exchange, self.ccxt_symbol)
 
     async def _send_telegram_message(self, message, urgent=False, silent=False):
         """发送Telegram消息"""
-        if not ENABLE_NOTIFICATIONS or not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
+        if not ENABLE_NOTIFICATIONS or not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID or self.paper:
             return
 
         try:
@@ -728,7 +1059,7 @@ class BinanceGridBot:
     async def _get_balance_info(self):
         """获取余额信息"""
         try:
-            balance = self.exchange.fetch_balance(params={"type": "future"})
+            balance = await self._run_blocking(self.exchange.fetch_balance, params={"type": "future"})
             balance_info = []
             
             if 'info' in balance and 'assets' in balance['info']:
@@ -830,6 +1161,16 @@ class BinanceGridBot:
         """检查当前所有挂单的状态，并更新多头和空头的挂单数量"""
         orders = self.exchange.fetch_open_orders(symbol=self.ccxt_symbol)
 
+        totals = self._aggregate_open_orders(orders)
+        self.buy_long_orders = totals['buy_long_orders']
+        self.sell_long_orders = totals['sell_long_orders']
+        self.buy_short_orders = totals['buy_short_orders']
+        self.sell_short_orders = totals['sell_short_orders']
+
+        self._reconcile_registry(orders)
+
+    def _aggregate_open_orders(self, orders):
+        """按方向汇总挂单数量"""
         buy_long_orders = 0.0
         sell_long_orders = 0.0
         buy_short_orders = 0.0
@@ -849,18 +1190,91 @@ class BinanceGridBot:
             elif side == 'sell' and position_side == 'SHORT':
                 sell_short_orders += orig_quantity
 
-        self.buy_long_orders = buy_long_orders
-        self.sell_long_orders = sell_long_orders
-        self.buy_short_orders = buy_short_orders
-        self.sell_short_orders = sell_short_orders
+        return {
+            'buy_long_orders': buy_long_orders,
+            'sell_long_orders': sell_long_orders,
+            'buy_short_orders': buy_short_orders,
+            'sell_short_orders': sell_short_orders,
+        }
+
+    # 对账比较的本地字段：持仓和各方向挂单数量
+    _RECONCILE_FIELDS = ('long_position', 'short_position',
+                         'buy_long_orders', 'sell_long_orders', 'buy_short_orders', 'sell_short_orders')
+
+    async def _reconcile_with_exchange(self):
+        """
+        拉取持仓和挂单快照与本地模型比较，只修正不一致的部分。
+        REST 查询在线程池中执行，比较和修正回到事件循环并持有 self.lock；
+        查询期间已被订单推送改动的字段以推送为准，不修正也不计为不一致
+
+        Returns:
+            int: 本次发现的不一致项数
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        started = {name: getattr(self, name) for name in self._RECONCILE_FIELDS}
+        (long_position, short_position), orders = await asyncio.gather(
+            self._run_blocking(self._get_position),
+            self._run_blocking(self.exchange.fetch_open_orders, symbol=self.ccxt_symbol))
+        remote = dict(self._aggregate_open_orders(orders), long_position=long_position, short_position=short_position)
+
+        mismatches = 0
+        precision = self.amount_precision
+        async with self.lock:
+            for name in self._RECONCILE_FIELDS:
+                local = getattr(self, name)
+                if local != started[name]:
+                    continue
+                if round(float(local), precision) != round(float(remote[name]), precision):
+                    logger.warning(f"[对账] {name} 本地 {local} 与交易所 {remote[name]} 不一致，已修正")
+                    setattr(self, name, remote[name])
+                    if name.endswith('_position'):
+                        self.reconcile_stats['position_mismatches'] += 1
+                    else:
+                        self.reconcile_stats['order_count_mismatches'] += 1
+                    mismatches += 1
+
+        # 注册表线程安全；其中按 clientOrderId 查询终态是阻塞调用
+        registry_mismatches = await self._run_blocking(self._reconcile_registry, orders)
+        self.reconcile_stats['registry_mismatches'] += registry_mismatches
+        return mismatches + registry_mismatches
+
+    def _request_reconcile(self, reason):
+        """要求在下一次行情决策时立即对账"""
+        logger.info(f"[对账] {reason}，立即对账")
+        self._reconcile_interval = SYNC_TIME
+        self._reconcile_due_ts = 0.0
+        self._order_stream_gap = True
+
+    async def _reconcile(self):
+        """执行一次对账并安排下一次：无不一致时间隔翻倍，否则回到 SYNC_TIME"""
+        try:
+            mismatches = await self._reconcile_with_exchange()
+        except Exception as e:
+            logger.error(f"[对账] 失败: {e}")
+            self.reconcile_stats['failures'] += 1
+            mismatches = None
+
+        now = time.time()
+        if mismatches == 0:
+            self._reconcile_interval = min(self._reconcile_interval * 2, self.reconcile_max_interval_s)
+        else:
+            self._reconcile_interval = SYNC_TIME
+        self._reconcile_due_ts = now + self._reconcile_interval
+        self.reconcile_stats['runs'] += 1
+        self.reconcile_stats['last_run_ts'] = now
+        if mismatches is not None:
+            self.last_position_update_time = now
+            self.last_orders_update_time = now
+            self._order_stream_gap = False
 
     async def _keep_listen_key_alive(self):
         """定期更新 listenKey"""
         while self.running:
             try:
                 await asyncio.sleep(1800)  # 每 30 分钟更新一次
-                self.exchange.fapiPrivatePutListenKey()
-                self.listenKey = self._get_listen_key()
+                await self._run_blocking(self.exchange.fapiPrivatePutListenKey)
+                self.listenKey = await self._run_blocking(self._get_listen_key)
                 logger.info(f"listenKey 已更新: {self.listenKey}")
             except Exception as e:
                 logger.error(f"更新 listenKey 失败: {e}")
@@ -870,17 +1284,26 @@ class BinanceGridBot:
         """连接 WebSocket 并订阅 ticker 和持仓数据"""
         try:
             async with websockets.connect(WEBSOCKET_URL) as websocket:
-                await self._subscribe_ticker(websocket)
-                await self._subscribe_orders(websocket)
+                # 使用共享数据中心时，本连接只订阅共享数据中心未提供的数据
+                if self.market_hub is None:
+                    await self._subscribe_ticker(websocket)
+                if self.user_hub is None:
+                    await self._subscribe_orders(websocket)
+                    # 断线期间可能漏掉订单推送
+                    self.reconcile_stats['reconnects'] += 1
+                    self._request_reconcile('WebSocket 已连接')
+                    self._order_stream_up = True
                 logger.info("WebSocket 连接成功，开始接收消息")
                 while self.running:
                     try:
+                        # 接收端只解析和入队，网格决策与订单处理在各自的任务中进行
                         message = await websocket.recv()
-                        data = json.loads(message)
-                        if data.get("e") == "bookTicker":
-                            await self._handle_ticker_update(message)
-                        elif data.get("e") == "ORDER_TRADE_UPDATE":
-                            await self._handle_order_update(message)
+                        with self.tracer.span('parse'):
+                            event = decode_event(message)
+                        if isinstance(event, BookTicker):
+                            await self._handle_ticker_update(event)
+                        elif isinstance(event, OrderUpdate):
+                            await self._enqueue_order_update(event)
                     except websockets.exceptions.ConnectionClosed:
                         logger.warning("WebSocket 连接已关闭，尝试重新连接...")
                         break
@@ -890,13 +1313,19 @@ class BinanceGridBot:
         except Exception as e:
             logger.error(f"WebSocket 连接失败: {e}")
             raise e
+        finally:
+            self._order_stream_up = False
+
+    def _book_ticker_stream(self):
+        """bookTicker 的 stream 名称"""
+        coin_name = self.symbol.replace('USDT', '').replace('USDC', '')
+        return f"{coin_name.lower()}{self.contract_type.lower()}@bookTicker"
 
     async def _subscribe_ticker(self, websocket):
         """订阅 ticker 数据"""
-        coin_name = self.symbol.replace('USDT', '').replace('USDC', '')
         payload = {
             "method": "SUBSCRIBE",
-            "params": [f"{coin_name.lower()}{self.contract_type.lower()}@bookTicker"],
+            "params": [self._book_ticker_stream()],
             "id": 1
         }
         await websocket.send(json.dumps(payload))
@@ -917,97 +1346,199 @@ class BinanceGridBot:
         logger.info(f"已发送挂单订阅请求: {payload}")
 
     async def _handle_ticker_update(self, message):
-        """处理 ticker 更新"""
-        current_time = time.time()
-        if current_time - self.last_ticker_update_time < 0.5:
+        """
+        处理 ticker 更新（message 可以是 BookTicker、原始字符串，或行情数据中心已解析的 dict）。
+        只覆盖最新报价并唤醒决策任务，不做任何阻塞操作
+        """
+        received = time.perf_counter()
+        if self.journal is not None:
+            self.journal.write_ws(event_message(message))
+        if isinstance(message, BookTicker):
+            tick = message
+        else:
+            try:
+                tick = decode_book_ticker(message)
+            except ValueError as e:
+                logger.error(f"解析价格失败: {e}")
+                return
+            if tick is None:
+                return
+            self.tracer.record('decode', time.perf_counter() - received)
+
+        self.best_bid_price = tick.bid
+        self.best_ask_price = tick.ask
+        if self.paper:
+            # 先按新报价撮合模拟挂单，再交给决策任务
+            self.exchange.on_quote(tick.bid, tick.ask)
+        self.latest_price = (tick.bid + tick.ask) / 2
+        self.last_ticker_update_time = time.time()
+        self._last_tick_perf = received
+        self._ticks_received += 1
+        if tick.event_time:
+            # 交易所推送时间到本地收到的延迟（含两端时钟偏差）
+            self.tracer.record('receive', self.last_ticker_update_time - tick.event_time / 1000)
+
+        if self._quote_event is None:
             return
+        if self._quote_event.is_set():
+            # 上一条报价尚未被决策任务取走，直接覆盖
+            self._ticks_coalesced += 1
+        self._quote_event.set()
+        if self._decision_price and abs(self.latest_price / self._decision_price - 1.0) * 10000 >= self.tick_move_threshold_bp:
+            self._urgent_event.set()
+
+    async def _decision_loop(self):
+        """决策任务：按最新报价驱动网格逻辑，期间到达的行情只覆盖报价，不会积压"""
+        interval = self.tick_interval_ms / 1000
+        while self.running:
+            await self._quote_event.wait()
+            if not self.running:
+                break
 
-        self.last_ticker_update_time = current_time
-        data = json.loads(message)
-        if data.get("e") == "bookTicker":
-            best_bid_price = data.get("b")
-            best_ask_price = data.get("a")
-
-            if best_bid_price is None or best_ask_price is None:
-                logger.warning("bookTicker 消息中缺少最佳买价或最佳卖价")
+            # 距上次决策不足 interval 时等待剩余时间，价格大幅变动则立即处理
+            remaining = self._last_decision_ts + interval - time.time()
+            if remaining > 0 and not self._urgent_event.is_set():
+                try:
+                    await asyncio.wait_for(self._urgent_event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            self._quote_event.clear()
+            self._urgent_event.clear()
+            self._last_decision_ts = time.time()
+            self._tick_lag = self._last_decision_ts - self.last_ticker_update_time
+            self._tick_max_lag = max(self._tick_max_lag, self._tick_lag)
+            self.tracer.record('queue', self._tick_lag)
+            self._decision_price = self.latest_price
+            self._decision_tick_perf = self._last_tick_perf
+            try:
+                await self._on_quote()
+            except Exception as e:
+                logger.error(f"处理行情失败: {e}")
+            finally:
+                self._decision_tick_perf = None
+                elapsed = time.time() - self._last_decision_ts
+                self._decision_count += 1
+                self._decision_seconds_total += elapsed
+                self._decision_last_seconds = elapsed
+                self.tracer.record('decision', elapsed)
+
+    async def _enqueue_order_update(self, message):
+        """订单推送解码为 OrderUpdate 后入队，由 _order_worker 按顺序处理"""
+        if self.journal is not None:
+            self.journal.write_ws(event_message(message))
+        if not isinstance(message, OrderUpdate):
+            message = decode_order_update(message)
+            if message is None:
                 return
+        if self._order_queue is None:
+            await self._handle_order_update(message)
+            return
+        await self._order_queue.put(message)
 
+    async def _order_worker(self):
+        """订单推送消费任务"""
+        while self.running:
+            message = await self._order_queue.get()
             try:
-                self.best_bid_price = float(best_bid_price)
-                self.best_ask_price = float(best_ask_price)
-                self.latest_price = (self.best_bid_price + self.best_ask_price) / 2
-            except ValueError as e:
-                logger.error(f"解析价格失败: {e}")
+                await self._handle_order_update(message)
+            except Exception as e:
+                logger.error(f"处理订单推送失败: {e}")
+
+    def pipeline_metrics(self):
+        """行情/订单流水线指标：队列深度、丢弃（合并）数、排队延迟（毫秒）和各阶段耗时分位数（秒）"""
+        return {
+            'ticker': {
+                'depth': 1 if self._quote_event is not None and self._quote_event.is_set() else 0,
+                'received': self._ticks_received,
+                'coalesced': self._ticks_coalesced,
+                'lag_ms': round(self._tick_lag * 1000, 2),
+                'max_lag_ms': round(self._tick_max_lag * 1000, 2),
+            },
+            'orders': self._order_queue.metrics() if self._order_queue is not None else {},
+            'reconcile': dict(self.reconcile_stats, interval_s=self._reconcile_interval),
+            'latency': self.tracer.summary(),
+        }
 
-            if time.time() - self.last_position_update_time > SYNC_TIME:
-                self.long_position, self.short_position = self._get_position()
-                self.last_position_update_time = time.time()
+    async def _on_quote(self):
+        """按最新报价（必要时先对账）执行一轮网格逻辑"""
+        if self.user_hub is not None and self.user_hub.reconnects != self._seen_user_hub_reconnects:
+            self._seen_user_hub_reconnects = self.user_hub.reconnects
+            self.reconcile_stats['reconnects'] += 1
+            self._request_reconcile('用户数据流重连')
 
-            if time.time() - self.last_orders_update_time > SYNC_TIME:
-                self._check_orders_status()
-                self.last_orders_update_time = time.time()
+        if time.time() >= self._reconcile_due_ts:
+            with self.tracer.span('reconcile'):
+                await self._reconcile()
 
+        with self.tracer.span('grid_loop'):
             await self._grid_loop()
+        with self.tracer.span('summary_notification'):
             await self._send_summary_notification()
 
     async def _handle_order_update(self, message):
-        """处理订单更新和持仓更新"""
+        """处理订单更新和持仓更新（message 可以是 OrderUpdate、原始字符串，或用户数据流已解析的 dict）"""
         # 延迟初始化锁
         if self.lock is None:
             self.lock = asyncio.Lock()
         
         async with self.lock:
-            data = json.loads(message)
-
-            if data.get("e") == "ORDER_TRADE_UPDATE":
-                order = data.get("o", {})
-                symbol = order.get("s")
-                if symbol == self.symbol:
-                    side = order.get("S")
-                    position_side = order.get("ps")
-                    reduce_only = order.get("R")
-                    status = order.get("X")
-                    quantity = float(order.get("q", 0))
-                    filled = float(order.get("z", 0))
-                    remaining = quantity - filled
-
-                    if status == "NEW":
-                        if side == "BUY":
-                            if position_side == "LONG":
-                                self.buy_long_orders += remaining
-                            elif position_side == "SHORT":
-                                self.buy_short_orders += remaining
-                        elif side == "SELL":
-                            if position_side == "LONG":
-                                self.sell_long_orders += remaining
-                            elif position_side == "SHORT":
-                                self.sell_short_orders += remaining
-                    elif status == "FILLED":
-                        if side == "BUY":
-                            if position_side == "LONG":
-                                self.long_position += filled
-                                self.buy_long_orders = max(0.0, self.buy_long_orders - filled)
-                            elif position_side == "SHORT":
-                                self.short_position = max(0.0, self.short_position - filled)
-                                self.buy_short_orders = max(0.0, self.buy_short_orders - filled)
-                        elif side == "SELL":
-                            if position_side == "LONG":
-                                self.long_position = max(0.0, self.long_position - filled)
-                                self.sell_long_orders = max(0.0, self.sell_long_orders - filled)
-                            elif position_side == "SHORT":
-                                self.short_position += filled
-                                self.sell_short_orders = max(0.0, self.sell_short_orders - filled)
-                    elif status == "CANCELED":
-                        if side == "BUY":
-                            if position_side == "LONG":
-                                self.buy_long_orders = max(0.0, self.buy_long_orders - quantity)
-                            elif position_side == "SHORT":
-                                self.buy_short_orders = max(0.0, self.buy_short_orders - quantity)
-                        elif side == "SELL":
-                            if position_side == "LONG":
-                                self.sell_long_orders = max(0.0, self.sell_long_orders - quantity)
-                            elif position_side == "SHORT":
-                                self.sell_short_orders = max(0.0, self.sell_short_orders - quantity)
+            order = message if isinstance(message, OrderUpdate) else decode_order_update(message)
+
+            if order is not None and order.symbol == self.exchange_symbol:
+                side = order.side
+                position_side = order.position_side
+                status = order.status
+                quantity = order.quantity
+                filled = order.filled
+                remaining = quantity - filled
+
+                if status == "NEW":
+                    if side == "BUY":
+                        if position_side == "LONG":
+                            self.buy_long_orders += remaining
+                        elif position_side == "SHORT":
+                            self.buy_short_orders += remaining
+                    elif side == "SELL":
+                        if position_side == "LONG":
+                            self.sell_long_orders += remaining
+                        elif position_side == "SHORT":
+                            self.sell_short_orders += remaining
+                elif status == "FILLED":
+                    if side == "BUY":
+                        if position_side == "LONG":
+                            self.long_position += filled
+                            self.buy_long_orders = max(0.0, self.buy_long_orders - filled)
+                        elif position_side == "SHORT":
+                            self.short_position = max(0.0, self.short_position - filled)
+                            self.buy_short_orders = max(0.0, self.buy_short_orders - filled)
+                    elif side == "SELL":
+                        if position_side == "LONG":
+                            self.long_position = max(0.0, self.long_position - filled)
+                            self.sell_long_orders = max(0.0, self.sell_long_orders - filled)
+                        elif position_side == "SHORT":
+                            self.short_position += filled
+                            self.sell_short_orders = max(0.0, self.sell_short_orders - filled)
+                elif status == "CANCELED":
+                    if side == "BUY":
+                        if position_side == "LONG":
+                            self.buy_long_orders = max(0.0, self.buy_long_orders - quantity)
+                        elif position_side == "SHORT":
+                            self.buy_short_orders = max(0.0, self.buy_short_orders - quantity)
+                    elif side == "SELL":
+                        if position_side == "LONG":
+                            self.sell_long_orders = max(0.0, self.sell_long_orders - quantity)
+                        elif position_side == "SHORT":
+                            self.sell_short_orders = max(0.0, self.sell_short_orders - quantity)
+
+                if (self.order_registry.owns(order.client_order_id)
+                        and order.status != "NEW"
+                        and not self.order_registry.is_known(order.client_order_id)):
+                    # 本机器人的订单却从未见过 NEW：推送有遗漏
+                    self.reconcile_stats['stream_gaps'] += 1
+                    self._request_reconcile(f"订单 {order.client_order_id} 推送不连续")
+                self.order_registry.on_update(order.client_order_id, order.status, order.filled, order.order_id)
+                self._resolve_order_waiter(order)
 
     def _get_take_profit_quantity(self, position, side):
         """调整止盈单的交易数量"""
@@ -1034,8 +1565,8 @@ class BinanceGridBot:
             logger.info(f"距离上次多头挂单时间不足 {ORDER_FIRST_TIME} 秒，跳过本次挂单")
             return
 
-        self._cancel_orders_for_side('long')
-        self._place_order('buy', self.best_bid_price, self.initial_quantity, False, 'long')
+        await self._run_blocking(self._cancel_orders_for_side, 'long')
+        await self._run_blocking(self._place_order, 'buy', self.best_bid_price, self.initial_quantity, False, 'long')
         logger.info(f"挂出多头开仓单: 买入 @ {self.latest_price}")
 
         self.last_long_order_time = time.time()
@@ -1048,8 +1579,8 @@ class BinanceGridBot:
             logger.info(f"距离上次空头挂单时间不足 {ORDER_FIRST_TIME} 秒，跳过本次挂单")
             return
 
-        self._cancel_orders_for_side('short')
-        self._place_order('sell', self.best_ask_price, self.initial_quantity, False, 'short')
+        await self._run_blocking(self._cancel_orders_for_side, 'short')
+        await self._run_blocking(self._place_order, 'sell', self.best_ask_price, self.initial_quantity, False, 'short')
         logger.info(f"挂出空头开仓单: 卖出 @ {self.latest_price}")
 
         self.last_short_order_time = time.time()
@@ -1092,14 +1623,14 @@ class BinanceGridBot:
         except ccxt.BaseError as e:
             logger.error(f"撤单失败: {e}")
 
-    def _place_order(self, side, price, quantity, is_reduce_only=False, position_side=None, order_type='limit'):
+    def _place_order(self, side, price, quantity, is_reduce_only=False, position_side=None, order_type='limit', client_order_id=None):
         """挂单函数"""
         try:
             quantity = round(quantity, self.amount_precision)
             quantity = max(quantity, self.min_order_amount)
 
-            import uuid
-            client_order_id = f"x-TBzTen1X-{uuid.uuid4().hex[:8]}"
+            if client_order_id is None:
+                client_order_id = self._new_client_order_id()
 
             if order_type == 'market':
                 params = {
@@ -1108,8 +1639,7 @@ class BinanceGridBot:
                 }
                 if position_side is not None:
                     params['positionSide'] = position_side.upper()
-                order = self.exchange.create_order(self.ccxt_symbol, 'market', side, quantity, params=params)
-                return order
+                return self._submit_order(client_order_id, 'market', side, quantity, None, params)
             else:
                 if price is None:
                     logger.error("限价单必须提供 price 参数")
@@ -1123,13 +1653,94 @@ class BinanceGridBot:
                 }
                 if position_side is not None:
                     params['positionSide'] = position_side.upper()
-                order = self.exchange.create_order(self.ccxt_symbol, 'limit', side, quantity, price, params)
-                return order
+                return self._submit_order(client_order_id, 'limit', side, quantity, price, params)
 
         except ccxt.BaseError as e:
             logger.error(f"下单报错: {e}")
             return None
 
+    def _new_client_order_id(self):
+        """生成 clientOrderId（由订单注册表按会话号 + 序号分配）"""
+        return self.order_registry.next_client_order_id()
+
+    def _submit_order(self, client_order_id, order_type, side, quantity, price, params):
+        """
+        登记并提交订单。网络异常时先按 clientOrderId 查询订单是否已被接受，查不到再用同一 ID 重试一次；
+        交易所会拒绝重复的 clientOrderId，因此重试不会重复下单
+        """
+        self.order_registry.register(client_order_id, side.upper(), params.get('positionSide'), price,
+                                     quantity, bool(params.get('reduce_only')), order_type)
+        for attempt in range(2):
+            try:
+                order = self.exchange.create_order(self.ccxt_symbol, order_type, side, quantity, price, params)
+                self.order_registry.on_ack(client_order_id, order.get('id'))
+                self._record_tick_to_order()
+                return order
+            except ccxt.NetworkError as e:
+                try:
+                    order = self.exchange.fetch_order(None, self.ccxt_symbol, {'origClientOrderId': client_order_id})
+                except ccxt.OrderNotFound:
+                    order = None
+                except ccxt.BaseError as lookup_error:
+                    # 查询同样失败（如仍在断网），按未被接受处理；若实际已下单，重试会因 clientOrderId 重复被拒，之后由对账纳入跟踪
+                    logger.warning(f"按 clientOrderId 查询订单失败: {client_order_id} {lookup_error}")
+                    order = None
+                if order is not None:
+                    self.order_registry.on_ack(client_order_id, order.get('id'))
+                    return order
+                if attempt == 1:
+                    self.order_registry.on_reject(client_order_id, e)
+                    raise e
+                logger.warning(f"下单网络异常，使用同一 clientOrderId 重试: {client_order_id} {e}")
+            except ccxt.BaseError as e:
+                self.order_registry.on_reject(client_order_id, e)
+                raise
+
+    def _record_tick_to_order(self):
+        """记录从触发本轮决策的行情到达到下单请求返回的耗时（仅行情驱动的下单）"""
+        tick_perf = self._decision_tick_perf
+        if tick_perf:
+            self.tracer.record('tick_to_order', time.perf_counter() - tick_perf)
+
+    def _reconcile_registry(self, orders):
+        """
+        订单注册表与交易所挂单对账：交易所上本地未登记的本机器人订单纳入跟踪，
+        本地未完成但交易所已没有的订单逐笔按 clientOrderId 查询终态
+
+        Returns:
+            int: 不一致的订单数
+        """
+        missing_remote, unknown_local = self.order_registry.diff(orders)
+        for order in unknown_local:
+            if self.order_registry.owns(order.get('clientOrderId')):
+                self.order_registry.adopt(order)
+
+        for client_order_id in missing_remote:
+            try:
+                order = self.exchange.fetch_order(None, self.ccxt_symbol, {'origClientOrderId': client_order_id})
+                info = order.get('info', {})
+                self.order_registry.on_update(client_order_id, info.get('status'),
+                                              float(order.get('filled') or 0), order.get('id'))
+            except ccxt.OrderNotFound:
+                self.order_registry.on_reject(client_order_id, '交易所无此订单')
+            except ccxt.BaseError as e:
+                logger.warning(f"对账查询订单失败: {client_order_id} {e}")
+        return len(missing_remote) + len(unknown_local)
+
+    def _track_order(self, client_order_id):
+        """登记一个等待订单终态（FILLED/CANCELED/EXPIRED/EXPIRED_IN_MATCH/REJECTED）推送的 Future"""
+        future = asyncio.get_running_loop().create_future()
+        self._order_waiters[client_order_id] = future
+        return future
+
+    def _resolve_order_waiter(self, order):
+        """订单推送到达终态时唤醒对应的等待者"""
+        if order.status not in TERMINAL_STATUSES:
+            return
+        future = self._order_waiters.pop(order.client_order_id, None)
+        if future is not None and not future.done():
+            future.set_result(order)
+
     def _place_take_profit_order(self, ccxt_symbol, side, price, quantity):
         """挂止盈单"""
         # 先按精度 round
@@ -1163,19 +1774,17 @@ class BinanceGridBot:
             qty = round(float(quantity), self.amount_precision)
             qty = max(qty, self.min_order_amount)
             if side == 'long':
-                import uuid
-                client_order_id = f"x-TBzTen1X-{uuid.uuid4().hex[:8]}"
+                client_order_id = self._new_client_order_id()
                 params = {
                     'newClientOrderId': client_order_id,
                     'reduce_only': True,
                     'positionSide': 'LONG'
                 }
-                order = self.exchange.create_order(ccxt_symbol, 'limit', 'sell', qty, price, params)
+                order = self._submit_order(client_order_id, 'limit', 'sell', qty, price, params)
                 logger.info(f"成功挂 long 止盈单: 卖出 {qty} {ccxt_symbol} @ {price}")
             elif side == 'short':
-                import uuid
-                client_order_id = f"x-TBzTen1X-{uuid.uuid4().hex[:8]}"
-                order = self.exchange.create_order(ccxt_symbol, 'limit', 'buy', qty, price, {
+                client_order_id = self._new_client_order_id()
+                order = self._submit_order(client_order_id, 'limit', 'buy', qty, price, {
                     'newClientOrderId': client_order_id,
                     'reduce_only': True,
                     'positionSide': 'SHORT'
@@ -1212,7 +1821,7 @@ class BinanceGridBot:
                     
                     # 装死模式下使用固定的止盈价，基于装死时的价格计算
                     fixed_tp_price = self.lockdown_mode['long']['tp_price']
-                    placed_any |= self._ensure_lockdown_take_profit(
+                    placed_any |= await self._run_blocking(self._ensure_lockdown_take_profit,
                         side='long',
                         target_price=fixed_tp_price,
                         quantity=self.long_initial_quantity
@@ -1234,20 +1843,33 @@ class BinanceGridBot:
                         logger.info("多头退出装死模式，恢复正常交易")
                     
                     self._update_mid_price('long', latest_price)
-                    self._cancel_open_orders_for_side('long')
-
-                    # 止盈（可能重挂）：用 long_initial_quantity（可能=2*initial_quantity）
-                    placed_any |= self._ensure_take_profit_at(
-                        side='long',
-                        target_price=self.upper_price_long,
-                        quantity=self.long_initial_quantity,
-                        tol_ratio=max(self.grid_spacing * 0.2, 0.001),
-                    )
-
                     # 补仓：始终使用基础数量 initial_quantity，而不是"加倍后"的 long_initial_quantity
                     open_qty = max(self.min_order_amount, round(self.initial_quantity, self.amount_precision))
-                    if self._place_order('buy', self.lower_price_long, open_qty, False, 'long'):
-                        placed_any = True
+                    tol_ratio = max(self.grid_spacing * 0.2, 0.001)
+                    entry_prices = self.ladder_entry_prices['long'] if self.grid_levels > 1 else [self.lower_price_long]
+
+                    requoted = None
+                    if self.use_batch_orders:
+                        requoted = await self._run_blocking(self._requote_side, 'long',
+                            self.upper_price_long, self.long_initial_quantity,
+                            entry_prices, open_qty, tol_ratio)
+
+                    if requoted is not None:
+                        placed_any |= requoted
+                    else:
+                        await self._run_blocking(self._cancel_open_orders_for_side, 'long')
+
+                        # 止盈（可能重挂）：用 long_initial_quantity（可能=2*initial_quantity）
+                        placed_any |= await self._run_blocking(self._ensure_take_profit_at,
+                            side='long',
+                            target_price=self.upper_price_long,
+                            quantity=self.long_initial_quantity,
+                            tol_ratio=tol_ratio,
+                        )
+
+                        for entry_price in entry_prices:
+                            if await self._run_blocking(self._place_order, 'buy', entry_price, open_qty, False, 'long'):
+                                placed_any = True
                     logger.info("挂多头止盈，挂多头补仓")
 
                 # 若本轮确实有挂出新单/重挂，则更新冷却时间戳
@@ -1284,7 +1906,7 @@ class BinanceGridBot:
                     
                     # 装死模式下使用固定的止盈价，基于装死时的价格计算
                     fixed_tp_price = self.lockdown_mode['short']['tp_price']
-                    placed_any |= self._ensure_lockdown_take_profit(
+                    placed_any |= await self._run_blocking(self._ensure_lockdown_take_profit,
                         side='short',
                         target_price=fixed_tp_price,
                         quantity=self.short_initial_quantity
@@ -1305,18 +1927,31 @@ class BinanceGridBot:
                         logger.info("空头退出装死模式，恢复正常交易")
                     
                     self._update_mid_price('short', latest_price)
-                    self._cancel_open_orders_for_side('short')
+                    open_qty = max(self.min_order_amount, round(self.initial_quantity, self.amount_precision))
+                    tol_ratio = max(self.grid_spacing * 0.2, 0.001)
+                    entry_prices = self.ladder_entry_prices['short'] if self.grid_levels > 1 else [self.upper_price_short]
 
-                    placed_any |= self._ensure_take_profit_at(
-                        side='short',
-                        target_price=self.lower_price_short,
-                        quantity=self.short_initial_quantity,
-                        tol_ratio=max(self.grid_spacing * 0.2, 0.001),
-                    )
+                    requoted = None
+                    if self.use_batch_orders:
+                        requoted = await self._run_blocking(self._requote_side, 'short',
+                            self.lower_price_short, self.short_initial_quantity,
+                            entry_prices, open_qty, tol_ratio)
 
-                    open_qty = max(self.min_order_amount, round(self.initial_quantity, self.amount_precision))
-                    if self._place_order('sell', self.upper_price_short, open_qty, False, 'short'):
-                        placed_any = True
+                    if requoted is not None:
+                        placed_any |= requoted
+                    else:
+                        await self._run_blocking(self._cancel_open_orders_for_side, 'short')
+
+                        placed_any |= await self._run_blocking(self._ensure_take_profit_at,
+                            side='short',
+                            target_price=self.lower_price_short,
+                            quantity=self.short_initial_quantity,
+                            tol_ratio=tol_ratio,
+                        )
+
+                        for entry_price in entry_prices:
+                            if await self._run_blocking(self._place_order, 'sell', entry_price, open_qty, False, 'short'):
+                                placed_any = True
                     logger.info("挂空头止盈，挂空头补仓")
 
                 # 若本轮确实有挂出新单/重挂，则更新冷却时间戳
@@ -1340,6 +1975,65 @@ class BinanceGridBot:
             self.lower_price_short = self.mid_price_short * (1 - self.grid_spacing)
             logger.info("更新 short 中间价")
 
+        if self.grid_levels > 1:
+            self._snap_to_ladder(side, price)
+
+    # ===== 多档网格：等比格点 + 增量平移 =====
+    def _ladder_level_price(self, index):
+        """第 index 个格点的价格：锚点 * (1 + grid_spacing) ** index"""
+        return self._ladder_anchor * (1 + self.grid_spacing) ** index
+
+    def _ladder_index(self, price, current=None):
+        """
+        价格对应的格点序号。带迟滞：离当前中心格点不足 0.75 格时保持不变，
+        避免价格在格点边界来回抖动时反复平移
+        """
+        if self._ladder_anchor is None:
+            self._ladder_anchor = price
+        raw = math.log(price / self._ladder_anchor) / math.log1p(self.grid_spacing)
+        if current is not None and abs(raw - current) < 0.75:
+            return current
+        return int(round(raw))
+
+    def _snap_to_ladder(self, side, price):
+        """以最近格点为中心，重算该方向的止盈价和 grid_levels 档补仓价"""
+        center = self._ladder_index(price, self._ladder_center[side])
+        self._ladder_center[side] = center
+        step = -1 if side == 'long' else 1
+
+        entry_prices = []
+        for i in range(1, self.grid_levels + 1):
+            level_price = round(self._ladder_level_price(center + step * i), self.price_precision)
+            # 低精度币种相邻格点可能 round 到同一价格，去重
+            if level_price > 0 and level_price not in entry_prices:
+                entry_prices.append(level_price)
+        self.ladder_entry_prices[side] = entry_prices
+
+        tp_price = self._ladder_level_price(center - step)
+        if side == 'long':
+            self.upper_price_long = tp_price
+            if entry_prices:
+                self.lower_price_long = entry_prices[0]
+        else:
+            self.lower_price_short = tp_price
+            if entry_prices:
+                self.upper_price_short = entry_prices[0]
+
+    def _ladder_needs_requote(self, side):
+        """多档模式：中心格点移动、止盈单缺失或补仓挂单数量异常时需要平移"""
+        if self._ladder_center[side] is None:
+            return True
+        if self._ladder_index(self.latest_price, self._ladder_center[side]) != self._ladder_center[side]:
+            return True
+
+        if side == 'long':
+            entry_qty, tp_qty, tp_limit = self.buy_long_orders, self.sell_long_orders, self.long_initial_quantity
+        else:
+            entry_qty, tp_qty, tp_limit = self.sell_short_orders, self.buy_short_orders, self.short_initial_quantity
+        open_qty = max(self.min_order_amount, round(self.initial_quantity, self.amount_precision))
+        entry_limit = round(len(self.ladder_entry_prices[side]) * open_qty, self.amount_precision)
+        return not (0 < tp_qty <= tp_limit) or not (0 < round(entry_qty, self.amount_precision) <= entry_limit)
+
     async def _check_risk(self):
         """检查持仓并减少库存风险（紧急减仓：固定数量 + 冷却 + 暂停网格 + 退出滞后）"""
         self._reset_emg_daily_counter_if_new_day()
@@ -1366,35 +2060,54 @@ class BinanceGridBot:
         if (self.long_position >= enter_ratio * T and
             self.short_position >= enter_ratio * T and
             (now - self._emg_last_ts >= self.emg_cooldown_s)):
-            self._emg_in_progress = True
-            self._emg_last_ts = now
-            self._grid_pause_until_ts = now + self.grid_pause_after_emg_s
-            self._emg_trigger_count_today += 1
-            logger.info(f"[EMG][{self.symbol}] 进入紧急减仓：阈值 {enter_ratio:.2f}T，冷却 {self.emg_cooldown_s}s，暂停网格 {self.grid_pause_after_emg_s}s")
-            
-            # 发送进入紧急状态通知
-            await self._send_emergency_enter_notification(enter_ratio)
-
-            if self._emg_trigger_count_today >= self.emg_daily_fuse_count:
-                self._enter_day_fuse_mode()
-                # 发送日内封盘通知
-                await self._send_daily_fuse_notification()
-                return
+            # 紧急减仓期间的撤单、查询和下单都以最高优先级占用请求预算
+            with request_priority(PRIORITY_CRITICAL):
+                await self._emg_enter(enter_ratio, now)
+
+    async def _emg_enter(self, enter_ratio, now):
+        """进入紧急减仓：撤开仓挂单并分批减仓"""
+        self._emg_in_progress = True
+        self._emg_last_ts = now
+        self._grid_pause_until_ts = now + self.grid_pause_after_emg_s
+        self._emg_trigger_count_today += 1
+        logger.info(f"[EMG][{self.symbol}] 进入紧急减仓：阈值 {enter_ratio:.2f}T，冷却 {self.emg_cooldown_s}s，暂停网格 {self.grid_pause_after_emg_s}s")
+        
+        # 发送进入紧急状态通知
+        await self._send_emergency_enter_notification(enter_ratio)
 
-            try:
-                self._cancel_open_orders_for_side('long')
-                self._cancel_open_orders_for_side('short')
-            except Exception as e:
-                logger.warning(f"[EMG] 撤开仓挂单异常：{e}")
+        if self._emg_trigger_count_today >= self.emg_daily_fuse_count:
+            await self._run_blocking(self._enter_day_fuse_mode)
+            # 发送日内封盘通知
+            await self._send_daily_fuse_notification()
+            return
 
-            fixed_qty = max(self.min_order_amount, round(self.position_threshold * 0.1, self.amount_precision))
-            long_cut  = min(fixed_qty, max(0.0, self.long_position))
-            short_cut = min(fixed_qty, max(0.0, self.short_position))
+        results = await asyncio.gather(
+            self._run_blocking(self._cancel_open_orders_for_side, 'long'),
+            self._run_blocking(self._cancel_open_orders_for_side, 'short'),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"[EMG] 撤开仓挂单异常：{result}")
+
+        fixed_qty = max(self.min_order_amount, round(self.position_threshold * 0.1, self.amount_precision))
+        long_cut  = min(fixed_qty, max(0.0, self.long_position))
+        short_cut = min(fixed_qty, max(0.0, self.short_position))
+
+        # 多空两个方向的分批减仓并发执行
+        reductions = []
+        if long_cut > 0:
+            reductions.append(self._emg_reduce_side_batched('long', long_cut))
+        if short_cut > 0:
+            reductions.append(self._emg_reduce_side_batched('short', short_cut))
+        if not reductions:
+            return
 
-            if long_cut > 0:
-                await self._emg_reduce_side_batched('long', long_cut)
-            if short_cut > 0:
-                await self._emg_reduce_side_batched('short', short_cut)
+        started = time.time()
+        for result in await asyncio.gather(*reductions, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"[EMG] 减仓任务异常：{result}")
+        logger.info(f"[EMG][{self.symbol}] 减仓完成，耗时 {time.time() - started:.2f}s（上限约 {self._emg_time_bound():.1f}s）")
 
 
 
@@ -1409,11 +2122,14 @@ class BinanceGridBot:
             finally:
                 self._lockdown_restored = True
 
-        await self._check_and_notify_position_threshold('long', self.long_position)
-        await self._check_and_notify_position_threshold('short', self.short_position)
-        await self._check_and_notify_double_profit('long', self.long_position)
-        await self._check_and_notify_double_profit('short', self.short_position)
-        await self._check_risk()
+        with self.tracer.span('check_position_threshold'):
+            await self._check_and_notify_position_threshold('long', self.long_position)
+            await self._check_and_notify_position_threshold('short', self.short_position)
+        with self.tracer.span('check_double_profit'):
+            await self._check_and_notify_double_profit('long', self.long_position)
+            await self._check_and_notify_double_profit('short', self.short_position)
+        with self.tracer.span('check_risk'):
+            await self._check_risk()
 
         # 记录价格与风控辅助
         self._record_price(self.latest_price)
@@ -1437,44 +2153,62 @@ class BinanceGridBot:
         # 检测多头持仓
         if self.long_position == 0:
             logger.info(f"检测到没有多头持仓{self.long_position}，初始化多头挂单@ ticker")
-            await self._initialize_long_orders()
+            with self.tracer.span('initialize_orders'):
+                await self._initialize_long_orders()
         else:
-            if not (0 < self.buy_long_orders <= self.long_initial_quantity) or not (0 < self.sell_long_orders <= self.long_initial_quantity):
+            if self.grid_levels > 1:
+                needs_requote = self._ladder_needs_requote('long')
+            else:
+                needs_requote = not (0 < self.buy_long_orders <= self.long_initial_quantity) or not (0 < self.sell_long_orders <= self.long_initial_quantity)
+            if needs_requote:
                 if self.long_position > self.position_threshold and current_time - self.last_long_order_time < ORDER_COOLDOWN_TIME:
                     logger.info(f"距离上次 long 挂止盈时间不足 {ORDER_COOLDOWN_TIME} 秒，跳过本次 long 挂单@ ticker")
                 else:
-                    await self._place_long_orders(self.latest_price)
+                    with self.tracer.span('place_orders'):
+                        await self._place_long_orders(self.latest_price)
 
         # 检测空头持仓
         if self.short_position == 0:
-            await self._initialize_short_orders()
+            with self.tracer.span('initialize_orders'):
+                await self._initialize_short_orders()
         else:
-            if not (0 < self.sell_short_orders <= self.short_initial_quantity) or not (0 < self.buy_short_orders <= self.short_initial_quantity):
+            if self.grid_levels > 1:
+                needs_requote = self._ladder_needs_requote('short')
+            else:
+                needs_requote = not (0 < self.sell_short_orders <= self.short_initial_quantity) or not (0 < self.buy_short_orders <= self.short_initial_quantity)
+            if needs_requote:
                 if self.short_position > self.position_threshold and current_time - self.last_short_order_time < ORDER_COOLDOWN_TIME:
                     logger.info(f"距离上次 short 挂止盈时间不足 {ORDER_COOLDOWN_TIME} 秒，跳过本次 short 挂单@ ticker")
                 else:
-                    await self._place_short_orders(self.latest_price)
+                    with self.tracer.span('place_orders'):
+                        await self._place_short_orders(self.latest_price)
+
+    @staticmethod
+    def _is_close_order(order):
+        """
+        双向持仓模式下按 (side, positionSide) 判断是否为平仓（止盈）单：sell+LONG / buy+SHORT。
+        该模式下交易所回报的 reduceOnly 恒为 False，不能据此识别止盈单。
+        """
+        pos = order.get('info', {}).get('positionSide', 'BOTH')
+        side = order.get('side')
+        return (pos == 'LONG' and side == 'sell') or (pos == 'SHORT' and side == 'buy')
 
-    # ===== 新增：只撤"开仓"挂单，保留 reduceOnly 的止盈挂单 =====
+    # ===== 新增：只撤"开仓"挂单，保留止盈挂单 =====
     def _cancel_open_orders_for_side(self, position_side: str):
-        """仅撤销某个方向的开仓挂单（reduceOnly=False），保留止盈单"""
+        """仅撤销某个方向的开仓挂单，保留止盈单"""
         orders = self.exchange.fetch_open_orders(self.ccxt_symbol)
         try:
             for order in orders:
                 side = order.get('side')  # 'buy' / 'sell'
                 pos = order.get('info', {}).get('positionSide', 'BOTH')  # 'LONG' / 'SHORT'
-                # 兼容读取 reduceOnly
-                ro = order.get('reduceOnly')
-                if ro is None:
-                    ro = order.get('info', {}).get('reduceOnly') or order.get('info', {}).get('reduce_only') or False
 
                 if position_side == 'long':
-                    # 多头开仓: buy + LONG + 非 reduceOnly
-                    if (pos == 'LONG') and (side == 'buy') and (not ro):
+                    # 多头开仓: buy + LONG
+                    if (pos == 'LONG') and (side == 'buy'):
                         self._cancel_order(order['id'])
                 elif position_side == 'short':
-                    # 空头开仓: sell + SHORT + 非 reduceOnly
-                    if (pos == 'SHORT') and (side == 'sell') and (not ro):
+                    # 空头开仓: sell + SHORT
+                    if (pos == 'SHORT') and (side == 'sell'):
                         self._cancel_order(order['id'])
         except ccxt.OrderNotFound as e:
             logger.warning(f"撤单时发现不存在的订单: {e}")
@@ -1482,23 +2216,16 @@ class BinanceGridBot:
         except Exception as e:
             logger.error(f"撤销开仓挂单失败: {e}")
 
-    # ===== 新增：获取当前方向已有的止盈单（reduceOnly=True）=====
+    # ===== 新增：获取当前方向已有的止盈单（sell+LONG / buy+SHORT）=====
     def _get_existing_tp_order(self, side: str):
         """
-        返回该方向当前已存在的一张 reduceOnly 止盈单（若有）。
+        返回该方向当前已存在的一张止盈单（若有）。
         side: 'long' or 'short'
         """
+        position_side = side.upper()
         orders = self.exchange.fetch_open_orders(self.ccxt_symbol)
         for order in orders:
-            pos = order.get('info', {}).get('positionSide', 'BOTH')
-            s = order.get('side')
-            ro = order.get('reduceOnly')
-            if ro is None:
-                ro = order.get('info', {}).get('reduceOnly') or order.get('info', {}).get('reduce_only') or False
-
-            if side == 'long' and pos == 'LONG' and ro and s == 'sell':
-                return order
-            if side == 'short' and pos == 'SHORT' and ro and s == 'buy':
+            if order.get('info', {}).get('positionSide', 'BOTH') == position_side and self._is_close_order(order):
                 return order
         return None
 
@@ -1534,6 +2261,141 @@ class BinanceGridBot:
         self._place_take_profit_order(self.ccxt_symbol, side, target_price, quantity)
         return True
 
+    # ===== 批量重挂：一次查询 + 一次批量撤单 + 一次批量下单 =====
+    def _batch_order_params(self, side, price, quantity, position_side):
+        """构造 /fapi/v1/batchOrders 中的单笔限价单参数"""
+        quantity = max(round(float(quantity), self.amount_precision), self.min_order_amount)
+        price = round(float(price), self.price_precision)
+        return {
+            'symbol': self.exchange.market_id(self.ccxt_symbol),
+            'side': side.upper(),
+            'positionSide': position_side.upper(),
+            'type': 'LIMIT',
+            'timeInForce': 'GTC',
+            'quantity': self.exchange.amount_to_precision(self.ccxt_symbol, quantity),
+            'price': self.exchange.price_to_precision(self.ccxt_symbol, price),
+            'newClientOrderId': self._new_client_order_id(),
+        }
+
+    def _cancel_orders_batch(self, order_ids):
+        """批量撤单（每批最多 10 笔），返回撤单成功的订单 ID 列表"""
+        cancelled = []
+        market_id = self.exchange.market_id(self.ccxt_symbol)
+        for i in range(0, len(order_ids), 10):
+            chunk = order_ids[i:i + 10]
+            results = self.exchange.fapiPrivateDeleteBatchOrders({
+                'symbol': market_id,
+                'orderIdList': json.dumps([int(order_id) for order_id in chunk]),
+            })
+            for order_id, result in zip(chunk, results):
+                if isinstance(result, dict) and result.get('orderId') is not None:
+                    cancelled.append(order_id)
+                else:
+                    msg = result.get('msg') if isinstance(result, dict) else result
+                    logger.warning(f"批量撤单失败: {order_id} {msg}")
+        return cancelled
+
+    def _place_orders_batch(self, legs):
+        """
+        批量下单（每批最多 5 笔）。
+        legs: [(腿名称, 下单参数, 是否只减仓)]，返回 {腿名称: 订单回报}，失败的腿为 None。
+        双向持仓模式下批量接口不接受 reduceOnly 参数，只减仓标记仅记入订单注册表
+        """
+        placed = {}
+        for name, params, reduce_only in legs:
+            self.order_registry.register(params['newClientOrderId'], params['side'], params['positionSide'],
+                                         float(params['price']), float(params['quantity']), reduce_only,
+                                         'batch_tp' if reduce_only else 'batch_entry')
+        for i in range(0, len(legs), 5):
+            chunk = legs[i:i + 5]
+            results = self.exchange.fapiPrivatePostBatchOrders({
+                'batchOrders': json.dumps([params for _, params, _ in chunk]),
+            })
+            self._record_tick_to_order()
+            for (name, params, _), result in zip(chunk, results):
+                if isinstance(result, dict) and result.get('orderId') is not None:
+                    placed[name] = result
+                    self.order_registry.on_ack(params['newClientOrderId'], result.get('orderId'))
+                    logger.info(f"批量下单成功[{name}]: {params['side']} {params['positionSide']} {params['quantity']} @ {params['price']}")
+                else:
+                    placed[name] = None
+                    msg = result.get('msg') if isinstance(result, dict) else result
+                    self.order_registry.on_reject(params['newClientOrderId'], msg)
+                    logger.error(f"批量下单失败[{name}]: {params['side']} {params['positionSide']} @ {params['price']} {msg}")
+        return placed
+
+    def _requote_side(self, side, tp_price, tp_quantity, entry_prices, entry_quantity, tol_ratio):
+        """
+        批量重挂某方向的止盈单与补仓单：保留已在目标价位上的补仓单，撤掉其余开仓挂单和
+        偏离目标价的止盈单，再用一次 batchOrders 挂出缺失的档位（多档模式下即增量平移）。
+        返回是否有挂单动作；批量接口不可用时返回 None，由调用方回退到逐笔撤挂。
+        """
+        position_side = side.upper()
+        tp_side = 'sell' if side == 'long' else 'buy'
+        entry_side = 'buy' if side == 'long' else 'sell'
+        tp_price = round(float(tp_price), self.price_precision)
+        missing_entries = [round(float(p), self.price_precision) for p in entry_prices]
+
+        try:
+            orders = self.exchange.fetch_open_orders(self.ccxt_symbol)
+        except ccxt.BaseError as e:
+            logger.error(f"批量重挂查询挂单失败: {e}")
+            return None
+
+        to_cancel = []
+        tp_order_id = None
+        tp_in_place = False
+        for order in orders:
+            if order.get('info', {}).get('positionSide', 'BOTH') != position_side:
+                continue
+            is_tp = self._is_close_order(order)
+
+            if order.get('side') == entry_side and not is_tp:
+                try:
+                    order_price = round(float(order['price']), self.price_precision)
+                except Exception:
+                    order_price = None
+                if order_price in missing_entries:
+                    # 已在目标档位上，保留
+                    missing_entries.remove(order_price)
+                else:
+                    to_cancel.append(order['id'])
+            elif order.get('side') == tp_side and is_tp and tp_order_id is None:
+                # 与 _ensure_take_profit_at 一致：只校准第一张止盈单，价格足够接近则保留
+                tp_order_id = order['id']
+                try:
+                    existing_price = round(float(order['price']), self.price_precision)
+                except Exception:
+                    existing_price = None
+                if existing_price is not None and abs(existing_price / tp_price - 1.0) <= tol_ratio:
+                    tp_in_place = True
+                else:
+                    to_cancel.append(order['id'])
+
+        try:
+            cancelled = self._cancel_orders_batch(to_cancel) if to_cancel else []
+        except ccxt.BaseError as e:
+            logger.error(f"批量撤单失败，回退逐笔撤挂: {e}")
+            return None
+
+        legs = []
+        has_position = self.long_position > 0 if side == 'long' else self.short_position > 0
+        # 旧止盈单撤销失败时不再挂新止盈，避免同方向出现两张止盈单
+        if has_position and not tp_in_place and (tp_order_id is None or tp_order_id in cancelled):
+            legs.append(('tp', self._batch_order_params(tp_side, tp_price, tp_quantity, position_side), True))
+        for i, entry_price in enumerate(missing_entries):
+            legs.append((f'entry{i + 1}', self._batch_order_params(entry_side, entry_price, entry_quantity, position_side), False))
+        if not legs:
+            return False
+
+        try:
+            placed = self._place_orders_batch(legs)
+        except ccxt.BaseError as e:
+            logger.error(f"批量下单失败，回退逐笔挂单: {e}")
+            return None
+
+        return any(result is not None for result in placed.values())
+
     def _ensure_lockdown_take_profit(self, side: str, target_price: float, quantity: float):
         """装死模式下的止盈单管理：只在首次进入时挂单，后续不重挂，确保价格完全固定"""
         existing = self._get_existing_tp_order(side)
@@ -1683,11 +2545,7 @@ class BinanceGridBot:
 
         for i, part in enumerate(parts, 1):
             try:
-                lp, sp = self._get_position()
-                if lp is not None:
-                    self.long_position = lp
-                if sp is not None:
-                    self.short_position = sp
+                await self._emg_refresh_positions()
             except Exception:
                 pass
 
@@ -1702,35 +2560,29 @@ class BinanceGridBot:
                 await self._send_reduction_early_complete_notification(side, i-1, len(parts))
                 break
 
-            ok = False
+            order_side = 'sell' if side == 'long' else 'buy'
+            remaining = part
             try:
-                bid, ask = self._get_best_quotes()
+                bid, ask = await self._emg_quotes()
                 slip = self.emg_slip_cap_bp / 10000.0
-                if side == 'long' and bid:
-                    limit_price = bid * (1 - slip)
-                    self._place_order('sell', price=limit_price, quantity=part, is_reduce_only=True, position_side='long', order_type='limit')
-                    ok = True
-                    # 减少日志频率，只在关键批次记录
-                    if i == 1 or i == len(parts):
-                        logger.info(f"[EMG] {side}方向第{i}批限价减仓成功: 卖出{part}张 @ {limit_price:.8f}")
-                elif side == 'short' and ask:
-                    limit_price = ask * (1 + slip)
-                    self._place_order('buy', price=limit_price, quantity=part, is_reduce_only=True, position_side='short', order_type='limit')
-                    ok = True
+                ref = bid if side == 'long' else ask
+                if ref:
+                    limit_price = ref * (1 - slip) if side == 'long' else ref * (1 + slip)
+                    remaining = await self._emg_limit_batch(side, order_side, limit_price, part)
                     # 减少日志频率，只在关键批次记录
                     if i == 1 or i == len(parts):
-                        logger.info(f"[EMG] {side}方向第{i}批限价减仓成功: 买入{part}张 @ {limit_price:.8f}")
+                        logger.info(f"[EMG] {side}方向第{i}批限价减仓: {order_side} {part}张 @ {limit_price:.8f}，未成交 {remaining}")
             except Exception as e:
                 logger.warning(f"[EMG] 限价减仓异常（{side} 第{i}批）：{e}")
 
-            if not ok:
+            remaining = round(remaining, self.amount_precision)
+            if remaining >= self.min_order_amount:
                 try:
-                    if side == 'long':
-                        self._place_order('sell', price=None, quantity=part, is_reduce_only=True, position_side='long', order_type='market')
-                        logger.info(f"[EMG] {side}方向第{i}批市价减仓成功: 卖出{part}张")
+                    order = await self._run_blocking(self._place_order, order_side, price=None, quantity=remaining, is_reduce_only=True, position_side=side, order_type='market')
+                    if order:
+                        logger.info(f"[EMG] {side}方向第{i}批市价减仓成功: {order_side} {remaining}张")
                     else:
-                        self._place_order('buy', price=None, quantity=part, is_reduce_only=True, position_side='short', order_type='market')
-                        logger.info(f"[EMG] {side}方向第{i}批市价减仓成功: 买入{part}张")
+                        logger.error(f"[EMG] 市价减仓失败（{side} 第{i}批）")
                 except Exception as e:
                     logger.error(f"[EMG] 市价减仓失败（{side} 第{i}批）：{e}")
 
@@ -1741,6 +2593,87 @@ class BinanceGridBot:
         # 发送减仓完成通知
         await self._send_reduction_complete_notification(side, qty_total, len(parts))
 
+    async def _emg_limit_batch(self, side, order_side, limit_price, quantity):
+        """
+        挂一笔限价减仓单并通过用户数据流跟踪到终态：emg_fill_timeout_ms 内未完全成交则撤单，
+        返回未成交数量（下单失败时返回全部数量，由调用方改市价；成交数量无法确认时返回 0）
+        """
+        client_order_id = self._new_client_order_id()
+        waiter = self._track_order(client_order_id)
+        try:
+            order = await self._run_blocking(self._place_order, order_side, price=limit_price, quantity=quantity,
+                                             is_reduce_only=True, position_side=side, order_type='limit',
+                                             client_order_id=client_order_id)
+            if not order:
+                return quantity
+
+            try:
+                update = await asyncio.wait_for(asyncio.shield(waiter), self.emg_fill_timeout_ms / 1000.0)
+            except asyncio.TimeoutError:
+                # 超时：撤掉剩余部分，再等撤单（或恰好成交）的推送确认已成交数量
+                await self._run_blocking(self._cancel_order, order['id'])
+                try:
+                    update = await asyncio.wait_for(waiter, self.emg_fill_timeout_ms / 1000.0)
+                except asyncio.TimeoutError:
+                    update = None
+
+            if update is not None:
+                return max(0.0, quantity - update.filled)
+
+            # 推送未到达时回退 REST 查询成交数量
+            try:
+                fetched = await self._run_blocking(self.exchange.fetch_order, order['id'], self.ccxt_symbol)
+            except ccxt.BaseError as e:
+                # 成交数量未知：按已全部成交处理，不再市价追单以免过度减仓；
+                # 下一批前强制 REST 刷新持仓，并立即对账修正本地状态
+                logger.error(f"[EMG] 查询限价减仓单 {order['id']} 失败，成交数量未知: {e}")
+                self.last_position_update_time = 0
+                self._request_reconcile("紧急减仓订单状态未知")
+                return 0.0
+            return max(0.0, quantity - float(fetched.get('filled') or 0))
+        finally:
+            self._order_waiters.pop(client_order_id, None)
+
+    def _emg_time_bound(self):
+        """单个方向分批减仓的耗时上限估计：每批最多两次等待推送 + 批间间隔"""
+        batches = max(1, int(self.emg_batches))
+        return batches * 2 * self.emg_fill_timeout_ms / 1000.0 + (batches - 1) * self.emg_batch_sleep_ms / 1000.0
+
+    async def _emg_quotes(self):
+        """紧急减仓用的买一/卖一：优先使用 bookTicker 推送的本地报价，超过 emg_quote_max_age_ms 未更新时回退 REST"""
+        age = time.time() - self.last_ticker_update_time
+        if self.best_bid_price and self.best_ask_price and age * 1000 <= self.emg_quote_max_age_ms:
+            return self.best_bid_price, self.best_ask_price
+        logger.warning(f"[EMG] 本地报价已 {age:.1f} 秒未更新，改用 REST 获取")
+        return await self._run_blocking(self._get_best_quotes)
+
+    def _order_stream_healthy(self):
+        """订单推送是否连续：连接正常，且上次对账成功后没有重连或漏推送"""
+        if self._order_stream_gap:
+            return False
+        if self.user_hub is not None:
+            return self.user_hub.websocket is not None and self.user_hub.reconnects == self._seen_user_hub_reconnects
+        return self._order_stream_up
+
+    async def _emg_refresh_positions(self):
+        """
+        紧急减仓前确认持仓：与 REST 同步过且订单推送连续（成交已由推送累加），或同步不超过
+        emg_position_max_age_s 时直接使用本地持仓；重连、漏推送或对账失败后回退 REST 查询
+        """
+        if self.last_position_update_time and (
+                self._order_stream_healthy()
+                or time.time() - self.last_position_update_time <= self.emg_position_max_age_s):
+            return
+        started = (self.long_position, self.short_position)
+        lp, sp = await self._run_blocking(self._get_position)
+        # 查询期间有成交推送时本地持仓更新，保留本地值
+        if (self.long_position, self.short_position) == started:
+            if lp is not None:
+                self.long_position = lp
+            if sp is not None:
+                self.short_position = sp
+        self.last_position_update_time = time.time()
+
     def _get_best_quotes(self):
         try:
             t = self.exchange.fetch_ticker(self.ccxt_symbol)
@@ -1755,23 +2688,69 @@ class BinanceGridBot:
         """停止机器人"""
         logger.info("正在停止机器人...")
         self.running = False
+        # 启动尚未完成时通知等待者
+        self.ready.cancel()
+        # 可能在其他线程（如信号处理）中调用：任务只能在所属事件循环中取消
+        loop = self._foreign_loop()
+        for task in (self._decision_task, self._order_task, self._watchdog_task, self._snapshot_task):
+            if task is None:
+                continue
+            if loop is not None:
+                loop.call_soon_threadsafe(task.cancel)
+            else:
+                task.cancel()
+        if self._synced and self.snapshot_interval_s > 0:
+            # 停止前写最后一次快照，重新部署后从这里继续
+            try:
+                self._write_final_snapshot()
+            except Exception as e:
+                logger.warning(f"写入快照失败: {e}")
+        if self.market_hub is not None:
+            self.market_hub.unsubscribe(self._book_ticker_stream())
+        if self.user_hub is not None:
+            self.user_hub.unsubscribe(self.exchange_symbol)
+        self.order_registry.close()
+        if self.journal is not None:
+            self.journal.close()
         # 发送停止通知
-        asyncio.create_task(self._send_telegram_message("🛑 **机器人已手动停止**\n\n用户主动停止了网格交易机器人", urgent=False, silent=True))
+        notify = self._send_telegram_message("🛑 **机器人已手动停止**\n\n用户主动停止了网格交易机器人", urgent=False, silent=True)
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(notify, loop)
+        else:
+            try:
+                asyncio.get_running_loop().create_task(notify)
+            except RuntimeError:
+                # 事件循环已关闭，不再发送
+                notify.close()
 
     async def start(self):
         """启动机器人"""
         try:
             logger.info("网格交易机器人启动中...")
+            self._loop = asyncio.get_running_loop()
+            # 之后本任务及其子任务、线程池中的 REST 调用都记入本交易对的追踪器（和流量日志）
+            use_tracer(self.tracer)
+            if self.journal is not None:
+                traffic_journal.use_journal(self.journal)
+            # 登记事件循环，供按需采样分析器采样该线程和其中的任务
+            profiler.register_current_loop()
+            # 事件循环阻塞检测（单事件循环模式下已由外层统一启动，这里返回 None）
+            self._watchdog_task = loop_watchdog.watch_current_loop()
             
-            # 初始化时获取一次持仓数据
-            self.long_position, self.short_position = self._get_position()
+            # 初始化时并发获取一次持仓和挂单状态
+            (self.long_position, self.short_position), _ = await asyncio.gather(
+                self._run_blocking(self._get_position), self._run_blocking(self._check_orders_status))
             logger.info(f"初始化持仓: 多头 {self.long_position} 张, 空头 {self.short_position} 张")
-
-            # 等待状态同步完成
-            await asyncio.sleep(5)
-
-            # 初始化时获取一次挂单状态
-            self._check_orders_status()
+            # 用快照恢复冷却时间、紧急减仓计数、波动率窗口和网格价位；持仓和挂单以刚才的同步为准
+            if self._snapshot is not None:
+                self._apply_snapshot(self._snapshot)
+                self._snapshot = None
+            # 启动同步已与交易所核对过持仓和挂单，下一次对账按正常间隔进行
+            now = time.time()
+            self.last_position_update_time = now
+            self.last_orders_update_time = now
+            self._reconcile_due_ts = now + self._reconcile_interval
+            self._synced = True
             # 仅用本地持久化恢复装死状态（不读取订单、不反推）
             self._restore_lockdown_from_local()
 
@@ -1784,8 +2763,34 @@ class BinanceGridBot:
             # 设置运行状态
             self.running = True
 
-            # 启动 listenKey 更新任务
-            asyncio.create_task(self._keep_listen_key_alive())
+            # 启动行情决策任务
+            self._quote_event = asyncio.Event()
+            self._urgent_event = asyncio.Event()
+            self._decision_task = asyncio.create_task(self._decision_loop())
+            self._order_queue = StreamQueue('orders', self.order_queue_size, OVERFLOW_BLOCK)
+            self._order_task = asyncio.create_task(self._order_worker())
+            if self.snapshot_interval_s > 0:
+                self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+
+            # 启动 listenKey 更新任务（使用账户级用户数据流时由其统一续期）
+            if self.user_hub is None:
+                asyncio.create_task(self._keep_listen_key_alive())
+            else:
+                self.user_hub.subscribe(self.exchange_symbol, self._enqueue_order_update,
+                                        loop=asyncio.get_running_loop())
+
+            # 通过共享行情数据中心订阅 bookTicker
+            if self.market_hub is not None:
+                self.market_hub.subscribe(self._book_ticker_stream(), self._handle_ticker_update,
+                                          loop=asyncio.get_running_loop())
+
+            self._set_ready()
+
+            if self.market_hub is not None and self.user_hub is not None:
+                # 行情和订单推送都来自共享数据中心，无需自建连接
+                while self.running:
+                    await asyncio.sleep(1)
+                return
 
             # 启动 WebSocket 连接
             while self.running:
@@ -1798,9 +2803,19 @@ class BinanceGridBot:
 
         except Exception as e:
             logger.error(f"启动失败: {e}")
+            self._set_ready(e)
             await self._send_error_notification(str(e), "启动失败")
             raise e
 
+    def _set_ready(self, error=None):
+        """发出启动完成（或失败）信号"""
+        if self.ready.done():
+            return
+        if error is None:
+            self.ready.set_result(True)
+        else:
+            self.ready.set_exception(error)
+
     async def _send_daily_circuit_breaker_notification(self):
         """发送日内封盘通知"""
         message = f"""
@@ -0,0 +1,208 @@
+"""
+币安推送的精简事件对象
+
+只保留机器人用到的字段，价格和数量在解码时一次性转换为 float，
+处理函数直接读属性，不再反复 .get() 和 float()。
+安装了 msgspec 时，原始消息按事件类型（e 字段）直接解码为 msgspec.Struct 事件对象，
+不再先构建完整的 dict；未安装时先用 fastjson 解码为 dict 再构建事件对象。
+"""
+
+from typing import Optional, Union
+
+import fastjson
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+if msgspec is not None:
+    class BookTicker(msgspec.Struct, tag_field='e', tag='bookTicker', gc=False):
+        """bookTicker 推送：s / b / a / E（推送时间，毫秒）"""
+
+        symbol: str = msgspec.field(name='s')
+        bid: float = msgspec.field(name='b')
+        ask: float = msgspec.field(name='a')
+        event_time: int = msgspec.field(name='E', default=0)
+
+    class OrderUpdate(msgspec.Struct, gc=False):
+        """ORDER_TRADE_UPDATE 推送中的订单部分：s / c / i / S / ps / X / q / z / R"""
+
+        symbol: str = msgspec.field(name='s')
+        client_order_id: str = msgspec.field(name='c')
+        order_id: int = msgspec.field(name='i')
+        side: str = msgspec.field(name='S')
+        position_side: str = msgspec.field(name='ps')
+        status: str = msgspec.field(name='X')
+        quantity: float = msgspec.field(name='q')
+        filled: float = msgspec.field(name='z')
+        reduce_only: bool = msgspec.field(name='R', default=False)
+
+        @property
+        def remaining(self):
+            return self.quantity - self.filled
+
+    class _OrderTradeUpdate(msgspec.Struct, tag_field='e', tag='ORDER_TRADE_UPDATE', gc=False):
+        order: OrderUpdate = msgspec.field(name='o')
+
+    class _CombinedEvent(msgspec.Struct, gc=False):
+        stream: Optional[str] = None
+        data: Union[BookTicker, _OrderTradeUpdate, None] = None
+
+    # strict=False：币安推送中的价格和数量是字符串，解码时直接转换为 float
+    _event_decoder = msgspec.json.Decoder(Union[BookTicker, _OrderTradeUpdate], strict=False)
+    _combined_decoder = msgspec.json.Decoder(_CombinedEvent, strict=False)
+else:
+    class BookTicker:
+        """bookTicker 推送：s / b / a / E（推送时间，毫秒）"""
+
+        __slots__ = ('symbol', 'bid', 'ask', 'event_time')
+
+        def __init__(self, symbol, bid, ask, event_time=0):
+            self.symbol = symbol
+            self.bid = bid
+            self.ask = ask
+            self.event_time = event_time
+
+        def __repr__(self):
+            return f"BookTicker({self.symbol} {self.bid}/{self.ask})"
+
+    class OrderUpdate:
+        """ORDER_TRADE_UPDATE 推送中的订单部分：s / c / i / S / ps / X / q / z / R"""
+
+        __slots__ = ('symbol', 'client_order_id', 'order_id', 'side', 'position_side', 'status', 'quantity', 'filled', 'reduce_only')
+
+        def __init__(self, symbol, client_order_id, order_id, side, position_side, status, quantity, filled, reduce_only):
+            self.symbol = symbol
+            self.client_order_id = client_order_id
+            self.order_id = order_id
+            self.side = side
+            self.position_side = position_side
+            self.status = status
+            self.quantity = quantity
+            self.filled = filled
+            self.reduce_only = reduce_only
+
+        @property
+        def remaining(self):
+            return self.quantity - self.filled
+
+        def __repr__(self):
+            return (f"OrderUpdate({self.symbol} {self.side} {self.position_side} {self.status} "
+                    f"{self.filled}/{self.quantity})")
+
+
+def _from_dict(data):
+    event = data.get("e")
+    if event == "bookTicker":
+        return decode_book_ticker(data)
+    if event == "ORDER_TRADE_UPDATE":
+        return decode_order_update(data)
+    return data
+
+
+def decode_event(message):
+    """
+    解码一条原始推送
+
+    Returns:
+        bookTicker 返回 BookTicker，ORDER_TRADE_UPDATE 返回 OrderUpdate，其他事件（如 listenKeyExpired）返回 dict
+    """
+    if msgspec is not None:
+        try:
+            event = _event_decoder.decode(message)
+        except msgspec.DecodeError:
+            # 其他事件类型或字段缺失，走通用路径
+            pass
+        else:
+            return event.order if isinstance(event, _OrderTradeUpdate) else event
+    return _from_dict(fastjson.loads(message))
+
+
+def decode_stream_event(message):
+    """
+    解码一条组合流推送 {"stream": ..., "data": {...}}
+
+    Returns:
+        tuple: (stream 名称, 事件)，事件含义同 decode_event；订阅请求的响应等消息 stream 为 None
+    """
+    if msgspec is not None:
+        try:
+            combined = _combined_decoder.decode(message)
+        except msgspec.DecodeError:
+            pass
+        else:
+            event = combined.data
+            return combined.stream, event.order if isinstance(event, _OrderTradeUpdate) else event
+    data = fastjson.loads(message)
+    inner = data.get("data")
+    return data.get("stream"), _from_dict(inner) if isinstance(inner, dict) else inner
+
+
+def decode_book_ticker(data):
+    """
+    从 bookTicker 消息构建 BookTicker
+
+    Args:
+        data: 原始字符串/bytes，或已解析的 dict
+
+    Returns:
+        BookTicker，非 bookTicker 消息或缺少买卖价时返回 None；价格无法解析时抛出 ValueError
+    """
+    if not isinstance(data, dict):
+        event = decode_event(data)
+        if isinstance(event, BookTicker):
+            return event
+        data = event if isinstance(event, dict) else {}
+    if data.get("e") != "bookTicker":
+        return None
+    bid = data.get("b")
+    ask = data.get("a")
+    if bid is None or ask is None:
+        return None
+    return BookTicker(data.get("s"), float(bid), float(ask), data.get("E", 0))
+
+
+def decode_order_update(data):
+    """
+    从 ORDER_TRADE_UPDATE 消息构建 OrderUpdate
+
+    Args:
+        data: 原始字符串/bytes，或已解析的 dict
+
+    Returns:
+        OrderUpdate，非 ORDER_TRADE_UPDATE 消息返回 None
+    """
+    if not isinstance(data, dict):
+        event = decode_event(data)
+        if isinstance(event, OrderUpdate):
+            return event
+        data = event if isinstance(event, dict) else {}
+    if data.get("e") != "ORDER_TRADE_UPDATE":
+        return None
+    o = data.get("o", {})
+    return OrderUpdate(
+        o.get("s"),
+        o.get("c"),
+        o.get("i"),
+        o.get("S"),
+        o.get("ps"),
+        o.get("X"),
+        float(o.get("q", 0)),
+        float(o.get("z", 0)),
+        bool(o.get("R", False)),
+    )
+
+
+def event_message(event):
+    """把事件对象还原为币安推送格式（只含上述字段），用于写流量日志"""
+    if isinstance(event, BookTicker):
+        return {"e": "bookTicker", "s": event.symbol, "b": event.bid, "a": event.ask, "E": event.event_time}
+    if isinstance(event, OrderUpdate):
+        return {"e": "ORDER_TRADE_UPDATE", "o": {
+            "s": event.symbol, "c": event.client_order_id, "i": event.order_id, "S": event.side,
+            "ps": event.position_side, "X": event.status, "q": event.quantity, "z": event.filled,
+            "R": event.reduce_only,
+        }}
+    return event
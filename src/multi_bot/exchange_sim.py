@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+本地币安 U 本位合约交易所模拟器
+
+用于在不接触真实交易所的情况下压测多币种机器人（可 100+ 币种）：
+- REST: 机器人用到的 fapi 接口（市场信息、持仓、挂单、下单/撤单/批量、listenKey、持仓模式、余额、行情）
+- WebSocket: /ws、/stream（组合流）推送 bookTicker，/ws/<listenKey> 推送 ORDER_TRADE_UPDATE
+- 行情由合成价格路径（几何布朗运动）或录制的流量日志驱动，挂单由 sim_engine.MatchingEngine 撮合
+不校验签名，任何 API Key 都可以使用。
+
+用法:
+    python src/multi_bot/exchange_sim.py --config config/symbols.yaml --port 8090
+    python src/multi_bot/exchange_sim.py --count 150 --write-config config/symbols_sim.yaml
+然后以 EXCHANGE_SIM_URL=http://127.0.0.1:8090 运行 multi_bot.py（SYMBOLS_CONFIG 指定币种配置）。
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+import yaml
+from aiohttp import web, WSMsgType
+
+sys.path.append(os.path.dirname(__file__))
+from sim_engine import (MatchingEngine, SimFuturesApi, SimError, GbmPricePath, JournalPricePath, format_decimal,
+                        ERR_UNKNOWN_PATH)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRICE = 100.0
+DEFAULT_MIN_NOTIONAL = 5.0
+
+
+def market_spec(price):
+    """按价格量级生成交易规则：价格保留约 5 位有效数字，数量精度随价格提高"""
+    tick_size = 10.0 ** (math.floor(math.log10(price)) - 4)
+    step_size = 0.001 if price >= 1000 else 0.01 if price >= 10 else 1.0
+    return {'tick_size': tick_size, 'step_size': step_size, 'min_qty': step_size,
+            'min_notional': DEFAULT_MIN_NOTIONAL}
+
+
+class ExchangeSimulator:
+    """模拟交易所：HTTP/WebSocket 服务 + 撮合引擎 + 行情驱动"""
+
+    def __init__(self, prices, price_paths=None, balance=10000.0, step_seconds=0.25, partial_fill_ratio=1.0):
+        """
+        Args:
+            prices: {交易对: 初始价格}
+            price_paths: {交易对: 价格路径}，未提供的交易对使用 GbmPricePath
+        """
+        self.specs = {symbol: market_spec(price) for symbol, price in prices.items()}
+        self.engine = MatchingEngine(self.specs, balance, partial_fill_ratio=partial_fill_ratio)
+        self.api = SimFuturesApi(self.engine)
+        self.step_seconds = step_seconds
+        self.paths = dict(price_paths or {})
+        for index, (symbol, price) in enumerate(prices.items()):
+            self.paths.setdefault(symbol, GbmPricePath(price, step_seconds=step_seconds,
+                                                       tick_size=self.specs[symbol]['tick_size'], seed=index))
+        # 先生成一次报价，机器人启动时即可查询行情、下单
+        for symbol, path in self.paths.items():
+            self.engine.update_quote(symbol, *path.next_quote())
+        # stream 名称 -> {websocket: 是否组合流格式}
+        self.market_clients = {}
+        self.user_clients = set()
+        self._user_events = asyncio.Queue()
+        self.engine.add_listener(self._user_events.put_nowait)
+        self._tasks = []
+
+    # ===== 行情 =====
+    async def _feed(self):
+        """按固定间隔推进所有交易对的价格并推送 bookTicker"""
+        update_id = 0
+        while True:
+            started = time.monotonic()
+            for symbol, path in self.paths.items():
+                bid, ask = path.next_quote()
+                self.engine.update_quote(symbol, bid, ask)
+                stream = f"{symbol.lower()}@bookTicker"
+                clients = self.market_clients.get(stream)
+                if not clients:
+                    continue
+                update_id += 1
+                now = int(time.time() * 1000)
+                data = {'e': 'bookTicker', 'u': update_id, 's': symbol, 'b': format_decimal(bid), 'B': '10',
+                        'a': format_decimal(ask), 'A': '10', 'T': now, 'E': now}
+                raw = json.dumps(data)
+                combined = json.dumps({'stream': stream, 'data': data})
+                for ws, is_combined in list(clients.items()):
+                    await self._send(ws, combined if is_combined else raw)
+            await asyncio.sleep(max(0.0, self.step_seconds - (time.monotonic() - started)))
+
+    async def _broadcast_user_events(self):
+        while True:
+            event = await self._user_events.get()
+            text = json.dumps(event)
+            for ws in list(self.user_clients):
+                await self._send(ws, text)
+
+    async def _send(self, ws, text):
+        if ws.closed:
+            return
+        try:
+            await ws.send_str(text)
+        except (ConnectionError, RuntimeError):
+            pass
+
+    # ===== WebSocket =====
+    async def handle_ws(self, request):
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        combined = request.path.startswith('/stream')
+        listen_key = request.match_info.get('listen_key')
+        if listen_key is not None:
+            self.user_clients.add(ws)
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    payload = json.loads(msg.data)
+                except ValueError:
+                    continue
+                method = payload.get('method')
+                for stream in payload.get('params') or []:
+                    if stream in self.api.listen_keys:
+                        self.user_clients.add(ws)
+                    elif method == 'SUBSCRIBE':
+                        self.market_clients.setdefault(stream, {})[ws] = combined
+                    elif method == 'UNSUBSCRIBE':
+                        self.market_clients.get(stream, {}).pop(ws, None)
+                await ws.send_str(json.dumps({'result': None, 'id': payload.get('id')}))
+        finally:
+            self.user_clients.discard(ws)
+            for clients in self.market_clients.values():
+                clients.pop(ws, None)
+        return ws
+
+    # ===== REST =====
+    async def handle_rest(self, request):
+        """所有 /fapi 请求交给 SimFuturesApi，拒绝时按币安格式返回 HTTP 400 {code, msg}"""
+        if not self.api.supports(request.method, request.path):
+            return web.json_response({'code': ERR_UNKNOWN_PATH, 'msg': 'Not found.'}, status=404)
+        params = dict(request.query)
+        if request.can_read_body:
+            params.update(await request.post())
+        try:
+            return web.json_response(self.api.handle(request.method, request.path, params))
+        except SimError as e:
+            return web.json_response({'code': e.code, 'msg': e.msg}, status=400)
+
+    async def handle_stats(self, request):
+        return web.json_response({
+            'symbols': len(self.specs), 'requests': self.api.requests, 'trades': self.engine.trades,
+            'open_orders': len(self.engine.list_open_orders()), 'wallet': self.engine.wallet,
+            'market_streams': sum(1 for clients in self.market_clients.values() if clients),
+            'user_clients': len(self.user_clients),
+        })
+
+    def make_app(self):
+        app = web.Application()
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        app.router.add_route('*', '/fapi/{path:.*}', self.handle_rest)
+        app.router.add_get('/sim/stats', self.handle_stats)
+        app.router.add_get('/ws', self.handle_ws)
+        app.router.add_get('/ws/{listen_key}', self.handle_ws)
+        app.router.add_get('/stream', self.handle_ws)
+        return app
+
+    async def _on_startup(self, app):
+        self._tasks = [asyncio.create_task(self._feed()), asyncio.create_task(self._broadcast_user_events())]
+
+    async def _on_cleanup(self, app):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def load_symbol_prices(args):
+    """按命令行参数确定模拟的交易对及初始价格"""
+    prices = {}
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f)
+        for symbol_config in config.get('symbols', []):
+            prices[symbol_config['name'].upper()] = float(symbol_config.get('sim_price', DEFAULT_PRICE))
+    for item in filter(None, (args.symbols or '').split(',')):
+        name, _, price = item.partition(':')
+        prices[name.strip().upper()] = float(price or DEFAULT_PRICE)
+    for i in range(args.count):
+        prices[f"SIM{i + 1:03d}USDT"] = DEFAULT_PRICE * (1 + i % 10)
+    return prices
+
+
+def write_symbols_config(path, prices, grid_spacing=0.004, leverage=20):
+    """为模拟的交易对生成 multi_bot 可用的币种配置（初始数量满足最小名义价值）"""
+    symbols = []
+    for symbol, price in prices.items():
+        spec = market_spec(price)
+        step = spec['step_size']
+        quantity = math.ceil(spec['min_notional'] * 1.2 / price / step) * step
+        symbols.append({'name': symbol, 'grid_spacing': grid_spacing, 'initial_quantity': round(quantity, 8),
+                        'leverage': leverage, 'contract_type': 'USDT', 'sim_price': price})
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump({'symbols': symbols}, f, allow_unicode=True, sort_keys=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地币安 U 本位合约交易所模拟器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--config', help='从币种配置文件读取交易对（可用 sim_price 指定初始价格）')
+    parser.add_argument('--symbols', help='交易对列表，如 BTCUSDT:60000,ETHUSDT:3000')
+    parser.add_argument('--count', type=int, default=0, help='额外生成 N 个合成交易对 SIM001USDT...')
+    parser.add_argument('--write-config', help='把模拟的交易对写成 multi_bot 币种配置文件')
+    parser.add_argument('--journal', help='用录制的流量日志（.asgj）中的 bookTicker 驱动行情')
+    parser.add_argument('--step-ms', type=int, default=250, help='行情推送间隔（毫秒）')
+    parser.add_argument('--balance', type=float, default=10000.0, help='初始 USDT 余额')
+    parser.add_argument('--partial-fill-ratio', type=float, default=1.0,
+                        help='挂单被穿价时每次报价成交的比例，1 为一次全部成交')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    prices = load_symbol_prices(args)
+    if not prices:
+        parser.error('没有交易对：请指定 --config、--symbols 或 --count')
+
+    paths = {}
+    if args.journal:
+        for symbol in prices:
+            try:
+                paths[symbol] = JournalPricePath(args.journal, symbol)
+            except ValueError as e:
+                logger.warning(f"{e}，使用合成行情")
+
+    if args.write_config:
+        write_symbols_config(args.write_config, prices)
+        logger.info(f"已写入币种配置: {args.write_config}")
+
+    simulator = ExchangeSimulator(prices, paths, args.balance, args.step_ms / 1000, args.partial_fill_ratio)
+    logger.info(f"模拟交易所: {len(prices)} 个交易对，http://{args.host}:{args.port}")
+    web.run_app(simulator.make_app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+WebSocket 消息解码
+
+安装了 orjson 或 msgspec 时使用更快的解码器，否则使用标准库 json。
+可通过环境变量 JSON_DECODER=orjson|msgspec|json 指定，指定的库不可用时自动回退。
+"""
+
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def _load_orjson():
+    import orjson
+    return orjson.loads
+
+
+def _load_msgspec():
+    import msgspec
+    decoder = msgspec.json.Decoder()
+    return decoder.decode
+
+
+def _load_stdlib():
+    return json.loads
+
+
+DECODERS = {
+    'orjson': _load_orjson,
+    'msgspec': _load_msgspec,
+    'json': _load_stdlib,
+}
+
+
+def get_decoder(name=None):
+    """
+    按名称获取解码函数；不指定时按 orjson → msgspec → json 的顺序选择第一个可用的
+
+    Returns:
+        tuple: (解码器名称, 解码函数)
+    """
+    candidates = [name] if name else ['orjson', 'msgspec', 'json']
+    for candidate in candidates:
+        loader = DECODERS.get(candidate)
+        if loader is None:
+            logger.warning(f"未知的 JSON 解码器: {candidate}，使用标准库 json")
+            continue
+        try:
+            return candidate, loader()
+        except ImportError:
+            if name:
+                logger.warning(f"JSON 解码器 {candidate} 未安装，使用标准库 json")
+    return 'json', json.loads
+
+
+BACKEND, loads = get_decoder(os.getenv('JSON_DECODER', '').strip().lower() or None)
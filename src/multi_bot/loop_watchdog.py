@@ -0,0 +1,151 @@
+"""
+事件循环阻塞检测
+
+每个事件循环运行一个心跳任务，按固定间隔 sleep 并记录调度延迟；
+进程内一个守护线程检查各循环的心跳，超过阈值未更新时说明循环被同步调用阻塞，
+此时抓取该线程的调用栈，记录并计数阻塞所在的本项目函数（如 _check_orders_status）。
+
+环境变量：
+- LOOP_WATCHDOG: 是否启用，默认 true
+- LOOP_LAG_THRESHOLD_MS: 判定阻塞的阈值，默认 200
+- LOOP_WATCHDOG_INTERVAL_MS: 心跳间隔，默认 100
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from latency import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG", "true").lower() == "true"
+LAG_THRESHOLD = int(os.getenv("LOOP_LAG_THRESHOLD_MS", "200")) / 1000
+HEARTBEAT_INTERVAL = int(os.getenv("LOOP_WATCHDOG_INTERVAL_MS", "100")) / 1000
+
+_SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 定位阻塞函数时跳过的本项目包装层（请求预算、REST 封装、线程池转发）
+_WRAPPER_FUNCTIONS = {'fetch', 'acquire', 'record_latency', 'update_from_headers', '_run_blocking'}
+
+_watched = {}
+_watched_lock = threading.Lock()
+_monitor_thread = None
+
+
+class LoopStats:
+    """单个事件循环的心跳与阻塞统计"""
+
+    def __init__(self, name, thread_id):
+        self.name = name
+        self.thread_id = thread_id
+        self.heartbeat = time.monotonic()
+        self.lag = LatencyHistogram()
+        self.last_lag = 0.0
+        self.blocked = Counter()
+        # 当前阻塞事件已上报的心跳时间，避免同一次阻塞重复计数
+        self.reported_heartbeat = None
+
+    def snapshot(self):
+        return {
+            'last_lag': self.last_lag,
+            'lag': self.lag.summary(),
+            'blocked': dict(self.blocked),
+        }
+
+
+def _blocking_site(frame):
+    """
+    从调用栈中找出阻塞点
+
+    Returns:
+        tuple: (本项目中最内层的业务函数, 最内层的实际调用, 本项目调用链)
+    """
+    innermost = frame
+    own_frames = []
+    while frame is not None:
+        code = frame.f_code
+        if os.path.dirname(os.path.abspath(code.co_filename)) == _SOURCE_DIR:
+            own_frames.append(frame)
+        frame = frame.f_back
+
+    def _label(f):
+        return f"{f.f_code.co_name} ({os.path.basename(f.f_code.co_filename)}:{f.f_lineno})"
+
+    function = next((f for f in own_frames if f.f_code.co_name not in _WRAPPER_FUNCTIONS), None)
+    chain = ' <- '.join(_label(f) for f in own_frames[:6])
+    return (function.f_code.co_name if function else '<unknown>'), _label(innermost), chain
+
+
+def _check_loops():
+    now = time.monotonic()
+    frames = None
+    with _watched_lock:
+        watched = list(_watched.values())
+    for stats in watched:
+        blocked_for = now - stats.heartbeat - HEARTBEAT_INTERVAL
+        if blocked_for < LAG_THRESHOLD or stats.reported_heartbeat == stats.heartbeat:
+            continue
+        if frames is None:
+            frames = sys._current_frames()
+        frame = frames.get(stats.thread_id)
+        if frame is None:
+            continue
+        stats.reported_heartbeat = stats.heartbeat
+        function, call, chain = _blocking_site(frame)
+        stats.blocked[function] += 1
+        logger.warning(f"[事件循环阻塞] {stats.name} 已阻塞 {blocked_for * 1000:.0f}ms，位于 {function}，"
+                       f"当前调用 {call}；调用链: {chain}")
+
+
+def _monitor():
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL / 2)
+        try:
+            _check_loops()
+        except Exception as e:
+            logger.debug(f"事件循环阻塞检测失败: {e}")
+
+
+async def _heartbeat(stats):
+    try:
+        while True:
+            started = time.monotonic()
+            stats.heartbeat = started
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            stats.last_lag = max(0.0, time.monotonic() - started - HEARTBEAT_INTERVAL)
+            stats.lag.record(stats.last_lag)
+    finally:
+        with _watched_lock:
+            _watched.pop(stats.thread_id, None)
+
+
+def watch_current_loop(name=None):
+    """
+    为当前线程的事件循环启动心跳任务（同一线程重复调用无副作用）
+
+    Returns:
+        asyncio.Task，未启用或已在监控时返回 None
+    """
+    global _monitor_thread
+    if not WATCHDOG_ENABLED:
+        return None
+    thread = threading.current_thread()
+    with _watched_lock:
+        if thread.ident in _watched:
+            return None
+        stats = _watched[thread.ident] = LoopStats(name or thread.name, thread.ident)
+        if _monitor_thread is None:
+            _monitor_thread = threading.Thread(target=_monitor, name="loop-watchdog", daemon=True)
+            _monitor_thread.start()
+    return asyncio.get_running_loop().create_task(_heartbeat(stats), name=f"loop-watchdog-{stats.name}")
+
+
+def snapshot():
+    """{循环名称: {'last_lag', 'lag', 'blocked'}}"""
+    with _watched_lock:
+        watched = list(_watched.values())
+    return {stats.name: stats.snapshot() for stats in watched}
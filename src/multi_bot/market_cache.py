@@ -0,0 +1,155 @@
+"""
+市场信息缓存
+
+进程内所有机器人共用一份市场信息（ccxt fetch_markets 的结果，按 ccxt 交易对和交易所 id 建立索引），
+带有效期（MARKET_CACHE_TTL 秒），并持久化到 <STATE_DIR>/markets_cache.json：
+- 冷启动：第一个机器人下载一次，其余机器人等待并复用
+- 热启动：磁盘缓存未过期时不访问网络
+- 下载失败但磁盘上有过期缓存时，继续使用过期缓存并记录警告
+缓存按数据来源（REST 地址和 fetchMarkets 选项）区分，连接模拟器时不会混用实盘数据。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MARKET_CACHE_TTL = float(os.getenv("MARKET_CACHE_TTL", "3600"))
+CACHE_FILE_NAME = "markets_cache.json"
+STALE_RETRY_SECONDS = 60
+
+
+def _default_path():
+    base = os.environ.get("STATE_DIR")
+    directory = Path(base).resolve() if base else Path(__file__).resolve().parent / "state"
+    return directory / CACHE_FILE_NAME
+
+
+def cache_source(exchange):
+    """缓存数据来源标识：U 本位合约 REST 地址 + 要加载的市场类型"""
+    return {
+        'api': exchange.urls['api'].get('fapiPublic'),
+        'types': list(exchange.options.get('fetchMarkets') or []),
+    }
+
+
+class MarketCache:
+    """线程安全的市场信息缓存"""
+
+    def __init__(self, path=None, ttl=MARKET_CACHE_TTL):
+        self.path = Path(path) if path is not None else _default_path()
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._source = None
+        self._markets = None
+        self._by_symbol = {}
+        self._by_id = {}
+        self._fetched_at = 0.0
+        self.downloads = 0
+        self.disk_loads = 0
+
+    def _fresh(self, fetched_at):
+        return time.time() - fetched_at < self.ttl
+
+    def _index(self, source, markets, fetched_at):
+        self._source = source
+        self._markets = markets
+        self._by_symbol = {market['symbol']: market for market in markets}
+        self._by_id = {}
+        for market in markets:
+            self._by_id.setdefault(market['id'], market)
+        self._fetched_at = fetched_at
+
+    def _read_disk(self, source):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取市场信息缓存失败: {e}")
+            return None
+        if data.get('source') != source or not data.get('markets'):
+            return None
+        return data
+
+    def _write_disk(self, source, markets, fetched_at):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'source': source, 'fetched_at': fetched_at, 'markets': markets}, f,
+                          ensure_ascii=False, separators=(',', ':'), default=str)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"写入市场信息缓存失败: {e}")
+
+    def markets(self, exchange):
+        """
+        返回市场信息列表（必要时下载或从磁盘加载）
+
+        Args:
+            exchange: 用于下载的 ccxt 交易所实例，同时决定数据来源
+        """
+        source = cache_source(exchange)
+        with self._lock:
+            if self._markets is not None and self._source == source and self._fresh(self._fetched_at):
+                return self._markets
+
+            stale = self._read_disk(source)
+            if stale is not None and self._fresh(stale['fetched_at']):
+                self._index(source, stale['markets'], stale['fetched_at'])
+                self.disk_loads += 1
+                logger.info(f"从磁盘加载市场信息缓存: {len(self._markets)} 个市场")
+                return self._markets
+
+            try:
+                markets = exchange.fetch_markets()
+            except Exception as e:
+                if stale is None:
+                    raise
+                logger.warning(f"下载市场信息失败，使用过期缓存: {e}")
+                # 过期缓存在内存中再用 STALE_RETRY_SECONDS 秒，避免每个机器人启动时都重试下载
+                self._index(source, stale['markets'], time.time() - max(0.0, self.ttl - STALE_RETRY_SECONDS))
+                return self._markets
+            fetched_at = time.time()
+            self._index(source, markets, fetched_at)
+            self.downloads += 1
+            logger.info(f"已下载市场信息: {len(markets)} 个市场")
+            self._write_disk(source, markets, fetched_at)
+            return self._markets
+
+    def market(self, exchange, symbol):
+        """按 ccxt 交易对（如 BTC/USDT:USDT）或交易所 id（如 BTCUSDT）查找市场"""
+        self.markets(exchange)
+        market = self._by_symbol.get(symbol) or self._by_id.get(symbol)
+        if market is None:
+            raise KeyError(f"市场信息中没有交易对: {symbol}")
+        return market
+
+    def load_into(self, exchange):
+        """把缓存的市场信息装入交易所实例，之后 exchange.load_markets() 不再访问网络"""
+        exchange.set_markets(self.markets(exchange))
+        return exchange.markets
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_market_cache():
+    """进程内共享的市场信息缓存"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = MarketCache()
+        return _shared_cache
+
+
+def load_markets(exchange):
+    """用共享缓存加载交易所实例的市场信息"""
+    return get_market_cache().load_into(exchange)
@@ -0,0 +1,299 @@
+"""
+Prometheus 指标服务
+
+在独立线程的事件循环中运行 aiohttp 服务（默认端口 8080），只读取各机器人的内存状态，
+不会阻塞交易任务。提供：
+- /metrics: Prometheus 文本格式指标
+- /health: 运行中的机器人数量（JSON）
+- POST /debug/profile?seconds=N: 触发一次采样分析（见 profiler.py）
+
+supervisor 模式下各工作进程把采集结果随状态一起上报，由 supervisor 合并后统一提供。
+"""
+
+import asyncio
+import json
+import logging
+import threading
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 指标族定义: 名称 -> (类型, 说明)
+METRIC_FAMILIES = {
+    'asgrid_bot_running': ('gauge', '机器人是否在运行'),
+    'asgrid_ticks_total': ('counter', '收到的 bookTicker 推送数'),
+    'asgrid_ticks_coalesced_total': ('counter', '被合并（未单独处理）的 bookTicker 推送数'),
+    'asgrid_tick_lag_seconds': ('gauge', '最近一次报价从收到到被决策任务取走的延迟'),
+    'asgrid_decisions_total': ('counter', '决策（网格逻辑）执行次数'),
+    'asgrid_decision_seconds_total': ('counter', '决策累计耗时'),
+    'asgrid_decision_last_seconds': ('gauge', '最近一次决策耗时'),
+    'asgrid_span_seconds': ('summary', '热路径各阶段耗时分位数（自启动以来）'),
+    'asgrid_order_queue_depth': ('gauge', '订单推送队列深度'),
+    'asgrid_order_queue_dropped_total': ('counter', '订单推送队列丢弃数'),
+    'asgrid_position': ('gauge', '持仓数量'),
+    'asgrid_open_orders': ('gauge', '挂单数量（按方向和类型）'),
+    'asgrid_registry_open_orders': ('gauge', '订单注册表中未完成的订单数'),
+    'asgrid_lockdown_active': ('gauge', '装死模式是否开启'),
+    'asgrid_emg_in_progress': ('gauge', '紧急减仓是否进行中'),
+    'asgrid_emg_triggers_today': ('gauge', '当日紧急减仓触发次数'),
+    'asgrid_day_fuse_on': ('gauge', '日内封盘是否开启'),
+    'asgrid_reconcile_runs_total': ('counter', '对账次数'),
+    'asgrid_reconcile_mismatches_total': ('counter', '对账发现的不一致数（按类型）'),
+    'asgrid_reconcile_interval_seconds': ('gauge', '当前对账间隔'),
+    'asgrid_bot_reconnects_total': ('counter', '机器人自身 WebSocket 或用户数据流重连次数'),
+    'asgrid_loop_lag_seconds': ('summary', '事件循环调度延迟分位数'),
+    'asgrid_loop_blocked_total': ('counter', '事件循环被同步调用阻塞的次数（按阻塞所在函数）'),
+    'asgrid_hub_reconnects_total': ('counter', '共享数据中心重连次数'),
+    'asgrid_hub_connections': ('gauge', '共享行情数据中心连接数'),
+    'asgrid_rest_requests_total': ('counter', 'REST 请求数（按接口）'),
+    'asgrid_rest_errors_total': ('counter', 'REST 请求失败数（按接口）'),
+    'asgrid_rest_seconds_total': ('counter', 'REST 请求累计耗时（按接口）'),
+    'asgrid_rest_max_seconds': ('gauge', 'REST 请求最大耗时（按接口）'),
+    'asgrid_rate_limit_used_weight_1m': ('gauge', '账户最近 1 分钟已用 REST 权重'),
+    'asgrid_rate_limit_weight_limit_1m': ('gauge', '账户 1 分钟 REST 权重上限'),
+    'asgrid_rate_limit_order_count_10s': ('gauge', '账户最近 10 秒下单数'),
+    'asgrid_rate_limit_order_count_1m': ('gauge', '账户最近 1 分钟下单数'),
+    'asgrid_rate_limit_throttled_total': ('counter', '因预算不足而等待的请求数'),
+    'asgrid_rate_limit_banned': ('gauge', '是否处于 418/429 封禁期'),
+}
+
+
+def _add(samples, name, labels, value):
+    samples.setdefault(name, []).append((tuple(sorted(labels.items())), float(value)))
+
+
+def collect_bot_metrics(bots):
+    """
+    采集各机器人的指标
+
+    Args:
+        bots: {symbol: BinanceGridBot}
+
+    Returns:
+        dict: {指标名: [(标签, 值)]}
+    """
+    samples = {}
+    for symbol, bot in list(bots.items()):
+        labels = {'symbol': symbol}
+        try:
+            pipeline = bot.pipeline_metrics()
+            ticker = pipeline.get('ticker', {})
+            orders = pipeline.get('orders', {})
+            reconcile = pipeline.get('reconcile', {})
+
+            _add(samples, 'asgrid_bot_running', labels, bool(getattr(bot, 'running', False)))
+            _add(samples, 'asgrid_ticks_total', labels, ticker.get('received', 0))
+            _add(samples, 'asgrid_ticks_coalesced_total', labels, ticker.get('coalesced', 0))
+            _add(samples, 'asgrid_tick_lag_seconds', labels, ticker.get('lag_ms', 0) / 1000)
+            _add(samples, 'asgrid_decisions_total', labels, bot._decision_count)
+            _add(samples, 'asgrid_decision_seconds_total', labels, bot._decision_seconds_total)
+            _add(samples, 'asgrid_decision_last_seconds', labels, bot._decision_last_seconds)
+            _add(samples, 'asgrid_order_queue_depth', labels, orders.get('depth', 0))
+            _add(samples, 'asgrid_order_queue_dropped_total', labels, orders.get('dropped', 0))
+
+            _add(samples, 'asgrid_position', dict(labels, side='long'), bot.long_position)
+            _add(samples, 'asgrid_position', dict(labels, side='short'), bot.short_position)
+            for side, kind, value in (('long', 'entry', bot.buy_long_orders), ('long', 'take_profit', bot.sell_long_orders),
+                                      ('short', 'entry', bot.sell_short_orders), ('short', 'take_profit', bot.buy_short_orders)):
+                _add(samples, 'asgrid_open_orders', dict(labels, side=side, kind=kind), value)
+            _add(samples, 'asgrid_registry_open_orders', labels, len(bot.order_registry.orders))
+
+            for side in ('long', 'short'):
+                _add(samples, 'asgrid_lockdown_active', dict(labels, side=side),
+                     bool(bot.lockdown_mode[side]['active']))
+            _add(samples, 'asgrid_emg_in_progress', labels, bool(bot._emg_in_progress))
+            _add(samples, 'asgrid_emg_triggers_today', labels, bot._emg_trigger_count_today)
+            _add(samples, 'asgrid_day_fuse_on', labels, bool(bot._day_fuse_on))
+
+            _add(samples, 'asgrid_reconcile_runs_total', labels, reconcile.get('runs', 0))
+            for kind in ('position', 'order_count', 'registry'):
+                _add(samples, 'asgrid_reconcile_mismatches_total', dict(labels, kind=kind),
+                     reconcile.get(f'{kind}_mismatches', 0))
+            _add(samples, 'asgrid_reconcile_mismatches_total', dict(labels, kind='stream_gap'),
+                 reconcile.get('stream_gaps', 0))
+            _add(samples, 'asgrid_reconcile_interval_seconds', labels, reconcile.get('interval_s', 0))
+            _add(samples, 'asgrid_bot_reconnects_total', labels, reconcile.get('reconnects', 0))
+
+            for span, stats in pipeline.get('latency', {}).items():
+                span_labels = dict(labels, span=span)
+                for quantile in (0.5, 0.99, 0.999):
+                    _add(samples, 'asgrid_span_seconds', dict(span_labels, quantile=str(quantile)),
+                         stats.get(quantile, 0))
+                _add(samples, 'asgrid_span_seconds_sum', span_labels, stats.get('sum', 0))
+                _add(samples, 'asgrid_span_seconds_count', span_labels, stats.get('count', 0))
+        except Exception as e:
+            logger.warning(f"采集 {symbol} 指标失败: {e}")
+    return samples
+
+
+def collect_process_metrics(market_hub=None, user_hub=None, budget=None, loops=None):
+    """采集进程级指标：共享数据中心、REST 请求预算和事件循环阻塞检测（loop_watchdog.snapshot()）"""
+    samples = {}
+    for loop_name, stats in (loops or {}).items():
+        labels = {'loop': loop_name}
+        lag = stats.get('lag', {})
+        for quantile in (0.5, 0.99, 0.999):
+            _add(samples, 'asgrid_loop_lag_seconds', dict(labels, quantile=str(quantile)), lag.get(quantile, 0))
+        _add(samples, 'asgrid_loop_lag_seconds_sum', labels, lag.get('sum', 0))
+        _add(samples, 'asgrid_loop_lag_seconds_count', labels, lag.get('count', 0))
+        for function, count in stats.get('blocked', {}).items():
+            _add(samples, 'asgrid_loop_blocked_total', dict(labels, function=function), count)
+    for name, hub in (('market', market_hub), ('user', user_hub)):
+        if hub is not None:
+            _add(samples, 'asgrid_hub_reconnects_total', {'hub': name}, hub.reconnects)
+    if market_hub is not None:
+        _add(samples, 'asgrid_hub_connections', {'hub': 'market'}, market_hub.connection_count)
+
+    if budget is not None:
+        snapshot = budget.snapshot()
+        _add(samples, 'asgrid_rate_limit_used_weight_1m', {}, snapshot['used_weight_1m'])
+        _add(samples, 'asgrid_rate_limit_weight_limit_1m', {}, snapshot['weight_limit_1m'])
+        _add(samples, 'asgrid_rate_limit_order_count_10s', {}, snapshot['order_count_10s'])
+        _add(samples, 'asgrid_rate_limit_order_count_1m', {}, snapshot['order_count_1m'])
+        _add(samples, 'asgrid_rate_limit_throttled_total', {}, snapshot['throttled'])
+        _add(samples, 'asgrid_rate_limit_banned', {}, snapshot['banned'])
+        for (method, path), (count, total, maximum, errors) in budget.latency_snapshot().items():
+            labels = {'method': method, 'endpoint': path}
+            _add(samples, 'asgrid_rest_requests_total', labels, count)
+            _add(samples, 'asgrid_rest_errors_total', labels, errors)
+            _add(samples, 'asgrid_rest_seconds_total', labels, total)
+            _add(samples, 'asgrid_rest_max_seconds', labels, maximum)
+    return samples
+
+
+def merge_samples(*sample_sets, extra_labels=None):
+    """合并多组采集结果，可为每组附加标签（如 supervisor 模式下的 worker 编号）"""
+    merged = {}
+    for index, samples in enumerate(sample_sets):
+        for name, series in samples.items():
+            for labels, value in series:
+                if extra_labels and extra_labels[index]:
+                    labels = tuple(sorted(dict(labels, **extra_labels[index]).items()))
+                merged.setdefault(name, []).append((labels, value))
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render(samples):
+    """渲染为 Prometheus 文本格式"""
+    lines = []
+    for name, series in samples.items():
+        # summary 的 _sum / _count 属于同一指标族，不单独声明
+        base, _, suffix = name.rpartition('_')
+        if suffix in ('sum', 'count') and METRIC_FAMILIES.get(base, ('',))[0] == 'summary':
+            metric_type = None
+        else:
+            metric_type, help_text = METRIC_FAMILIES.get(name, ('gauge', name))
+        if metric_type:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in series:
+            if labels:
+                label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+                lines.append(f"{name}{{{label_text}}} {value:g}")
+            else:
+                lines.append(f"{name} {value:g}")
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """在独立线程中运行的指标 HTTP 服务"""
+
+    def __init__(self, collector, host='0.0.0.0', port=8080, profile_handler=None):
+        """
+        Args:
+            collector: 无参函数，返回 {指标名: [(标签, 值)]}
+            profile_handler: 触发采样分析的函数 (seconds, all_threads) -> dict，为 None 时不提供 /debug/profile
+        """
+        self.collector = collector
+        self.profile_handler = profile_handler
+        self.host = host
+        self.port = port
+        self.loop = None
+        self._runner = None
+        self._thread = None
+
+    async def _handle_metrics(self, request):
+        try:
+            body = render(self.collector())
+        except Exception as e:
+            logger.error(f"生成指标失败: {e}")
+            return web.Response(status=500, text=str(e))
+        return web.Response(body=body.encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+    async def _handle_health(self, request):
+        samples = self.collector()
+        running = sum(1 for _, value in samples.get('asgrid_bot_running', []) if value)
+        status = 200 if running > 0 else 503
+        return web.Response(status=status, content_type='application/json',
+                            text=json.dumps({'running_bots': running}))
+
+    async def _handle_profile(self, request):
+        try:
+            seconds = int(request.query.get('seconds', 0)) or None
+        except ValueError:
+            return web.Response(status=400, text='seconds 必须是整数')
+        all_threads = request.query.get('all_threads', '').lower() in ('1', 'true')
+        result = self.profile_handler(seconds, all_threads)
+        status = 202 if result.get('started') else 409
+        return web.Response(status=status, content_type='application/json',
+                            text=json.dumps(result, ensure_ascii=False))
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        app.router.add_get('/health', self._handle_health)
+        if self.profile_handler is not None:
+            app.router.add_post('/debug/profile', self._handle_profile)
+        return app
+
+    async def start(self):
+        """在当前事件循环中启动服务"""
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        logger.info(f"指标服务已启动: http://{self.host}:{self.port}/metrics")
+
+    async def stop_async(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self):
+        """在独立线程的事件循环中启动服务"""
+        started = threading.Event()
+
+        def _run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.start())
+            except Exception as e:
+                logger.error(f"指标服务启动失败: {e}")
+                started.set()
+                return
+            started.set()
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, name="metrics-server", daemon=True)
+        self._thread.start()
+        started.wait(timeout=10)
+        return self._thread
+
+    def stop(self):
+        """停止服务（可从任意线程调用）"""
+        if self.loop is None or not self.loop.is_running():
+            return
+        future = asyncio.run_coroutine_threadsafe(self.stop_async(), self.loop)
+        try:
+            future.result(timeout=5)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
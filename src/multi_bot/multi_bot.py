@@ -7,20 +7,57 @@ import time
 import yaml
 import json
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import functools
+import multiprocessing
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError, CancelledError
 from dotenv import load_dotenv
 import sys
 import os
 sys.path.append(os.path.dirname(__file__))
-from binance_multi_bot import BinanceGridBot
+from binance_multi_bot import BinanceGridBot, CustomBinance, ensure_hedge_mode
 from logging_config import setup_logging, create_bot_logger, DailyStatusLogger
+from stream_hub import MarketDataHub, UserDataHub
+from rate_limiter import get_shared_budget
+from metrics_server import MetricsServer, collect_bot_metrics, collect_process_metrics, merge_samples
+import profiler
+import loop_watchdog
+import market_cache
+from paper import TickerFanout, is_paper
 
 # 加载环境变量
 load_dotenv()
 
+# 是否所有币种共用一条行情 WebSocket 连接
+SHARED_MARKET_STREAM = os.getenv("SHARED_MARKET_STREAM", "true").lower() == "true"
+# 是否所有币种共用一个 listenKey 和一条用户数据流
+SHARED_USER_STREAM = os.getenv("SHARED_USER_STREAM", "true").lower() == "true"
+# 运行模式: threads = 每个币种一个线程和事件循环; loop = 所有币种运行在同一个事件循环中;
+# supervisor = 币种分片到多个工作进程，每个进程一个事件循环
+RUN_MODE = os.getenv("RUN_MODE", "threads").lower()
+# 单事件循环模式下执行阻塞 REST 调用的线程池大小
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "8"))
+# supervisor 模式下的工作进程数，0 表示按 CPU 核数
+MULTI_BOT_WORKERS = int(os.getenv("MULTI_BOT_WORKERS", "0"))
+# 工作进程上报状态的间隔，以及判定工作进程卡死的超时时间（秒）
+WORKER_STATUS_INTERVAL = 10
+WORKER_STALL_TIMEOUT = int(os.getenv("WORKER_STALL_TIMEOUT", "120"))
+# 工作进程崩溃后重启的最大退避时间（秒）
+WORKER_RESTART_MAX_DELAY = 300
+# Prometheus 指标服务（/metrics、/health），supervisor 模式下由 supervisor 进程统一提供
+ENABLE_METRICS = os.getenv("ENABLE_METRICS", "true").lower() == "true"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8080"))
+# 启动时同时初始化的机器人数量（构造和启动同步都要调用 REST），以及等待单个机器人启动完成的超时时间（秒）
+STARTUP_CONCURRENCY = max(1, int(os.getenv("STARTUP_CONCURRENCY", "8")))
+STARTUP_TIMEOUT = int(os.getenv("STARTUP_TIMEOUT", "60"))
+# 币种配置文件路径（压测时可指向 exchange_sim.py --write-config 生成的配置）
+SYMBOLS_CONFIG = os.getenv("SYMBOLS_CONFIG", "config/symbols.yaml")
+
 # 全局变量用于控制所有机器人
 running_bots = {}
 stop_event = threading.Event()
+market_hub = None
+user_hub = None
 
 # 配置优化的日志系统
 main_logger = setup_logging()
@@ -74,6 +111,26 @@ def load_config(config_file='config/symbols.yaml'):
                 symbol_config['leverage'] = 20
             if 'contract_type' not in symbol_config:
                 symbol_config['contract_type'] = 'USDT'
+            if str(symbol_config.get('mode', 'live')).lower() not in ('live', 'paper'):
+                main_logger.error(f"{symbol_config['name']} 的 mode 必须是 live 或 paper")
+                return None
+        
+        # 同一交易对配置多个机器人（如并排比较多组纸面参数）时必须用 id 区分
+        names = [bot_name(symbol_config) for symbol_config in config['symbols']]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            main_logger.error(f"机器人名称重复: {duplicates}，同一交易对配置多个机器人时请用 id 区分")
+            return None
+        
+        # 实盘机器人的状态文件、双向持仓和订单推送（按交易对分发）都以交易对区分，同一交易对只能有一个实盘机器人
+        by_symbol = {}
+        for symbol_config in config['symbols']:
+            by_symbol.setdefault(str(symbol_config['name']).upper(), []).append(symbol_config)
+        shared = sorted(symbol for symbol, entries in by_symbol.items()
+                        if len(entries) > 1 and not all(is_paper(entry) for entry in entries))
+        if shared:
+            main_logger.error(f"交易对重复: {shared}，同一交易对配置多个机器人时必须全部为 mode: paper")
+            return None
         
         main_logger.info(f"成功加载配置文件: {config_file}")
         return config
@@ -122,7 +179,81 @@ def create_bot_logger(symbol):
     from logging_config import create_bot_logger as create_logger
     return create_logger(symbol)
 
-def run_single_bot(symbol_config, api_key, api_secret):
+def build_bot_config(symbol_config):
+    """
+    从币种配置构建机器人配置字典
+    
+    Args:
+        symbol_config: 币种配置字典
+        
+    Returns:
+        dict: 传给 BinanceGridBot 的配置
+    """
+    config = {
+        'grid_spacing': symbol_config['grid_spacing'],
+        'initial_quantity': symbol_config['initial_quantity'],
+        'leverage': symbol_config['leverage'],
+        'contract_type': symbol_config['contract_type']
+    }
+    # 其余可选参数（如 use_batch_orders）原样透传给机器人
+    for key, value in symbol_config.items():
+        if key != 'name' and key not in config:
+            config[key] = value
+    return config
+
+def bot_name(symbol_config):
+    """机器人名称（日志、状态和指标中使用）：配置了 id 时为 id（同一交易对的多个纸面机器人），否则为交易对"""
+    return str(symbol_config.get('id') or symbol_config['name'])
+
+def create_ticker_fanout(hub, symbols):
+    """有纸面机器人时同一交易对可能有多个订阅者，行情改由 TickerFanout 分发；否则返回 None"""
+    if hub is None or not any(is_paper(symbol_config) for symbol_config in symbols):
+        return None
+    return TickerFanout(hub)
+
+def needs_user_hub(symbols):
+    """纸面机器人的订单推送来自撮合引擎，只有实盘机器人需要账户级用户数据流"""
+    return SHARED_USER_STREAM and not all(is_paper(symbol_config) for symbol_config in symbols)
+
+def create_exchange(api_key, api_secret, load_markets=True):
+    """
+    创建共享的交易所实例
+    
+    Args:
+        api_key: API密钥
+        api_secret: API密钥
+        load_markets: 是否加载市场信息
+        
+    Returns:
+        CustomBinance: 交易所实例
+    """
+    exchange = CustomBinance({
+        "apiKey": api_key,
+        "secret": api_secret,
+        "options": {"defaultType": "future"},
+    })
+    if load_markets:
+        market_cache.load_markets(exchange)
+    return exchange
+
+def prefetch_shared_data(api_key, api_secret, symbols):
+    """
+    启动第一阶段：加载一次所有机器人共用的数据，之后各机器人构造时不再重复请求
+    
+    - 市场信息（写入进程内和磁盘缓存）
+    - 账户持仓模式（有实盘机器人时检查一次，必要时启用双向持仓）
+    
+    Returns:
+        CustomBinance: 已加载市场信息的交易所实例
+    """
+    started = time.time()
+    exchange = create_exchange(api_key, api_secret)
+    if any(not is_paper(symbol_config) for symbol_config in symbols):
+        ensure_hedge_mode(exchange)
+    main_logger.info(f"共用数据预加载完成，用时 {time.time() - started:.1f} 秒")
+    return exchange
+
+def run_single_bot(symbol_config, api_key, api_secret, market_hub=None, user_hub=None):
     """
     运行单个币种的网格机器人
     
@@ -130,27 +261,25 @@ def run_single_bot(symbol_config, api_key, api_secret):
         symbol_config: 币种配置字典
         api_key: API密钥
         api_secret: API密钥
+        market_hub: 共享行情数据中心，为 None 时机器人自行订阅行情
+        user_hub: 账户级用户数据流，为 None 时机器人自行获取 listenKey
         
     Returns:
         tuple: (symbol, success, error_message)
     """
-    symbol = symbol_config['name']
+    symbol = bot_name(symbol_config)
     logger = create_bot_logger(symbol)
     
     try:
         # 构建配置字典
-        config = {
-            'grid_spacing': symbol_config['grid_spacing'],
-            'initial_quantity': symbol_config['initial_quantity'],
-            'leverage': symbol_config['leverage'],
-            'contract_type': symbol_config['contract_type']
-        }
+        config = build_bot_config(symbol_config)
         
         logger.info(f"启动 {symbol} 网格机器人")
         logger.info(f"配置: 网格间距={config['grid_spacing']:.3f}, 初始数量={config['initial_quantity']}, 杠杆={config['leverage']}")
         
         # 创建机器人实例
-        bot = BinanceGridBot(symbol=symbol, api_key=api_key, api_secret=api_secret, config=config)
+        bot = BinanceGridBot(symbol=symbol_config['name'], api_key=api_key, api_secret=api_secret, config=config,
+                             market_hub=market_hub, user_hub=user_hub)
         
         # 存储机器人实例（用于停止）
         running_bots[symbol] = bot
@@ -173,35 +302,25 @@ def run_single_bot(symbol_config, api_key, api_secret):
                     pass
         
         # 在新线程中运行
-        import threading
         bot_thread = threading.Thread(target=run_bot_with_loop, name=f"bot-{symbol}")
         bot_thread.daemon = True
         bot_thread.start()
         
-        # 等待一小段时间确保线程启动
-        import time
-        time.sleep(0.1)
-        
-        # 等待机器人真正启动
-        max_wait_time = 30  # 最多等待30秒
-        wait_time = 0
-        while wait_time < max_wait_time:
-            if symbol in running_bots:
-                # 检查机器人是否真正运行
-                bot = running_bots[symbol]
-                if hasattr(bot, 'running') and bot.running:
-                    logger.info(f"{symbol} 机器人已添加到运行列表")
-                    return symbol, True, None
-            time.sleep(1)
-            wait_time += 1
-        
-        # 如果超时，从运行列表中移除
-        if symbol in running_bots:
-            del running_bots[symbol]
+        # 等待启动完成信号（持仓和挂单已同步、推送已订阅）
+        try:
+            bot.ready.result(timeout=STARTUP_TIMEOUT)
+        except FutureTimeoutError:
+            running_bots.pop(symbol, None)
+            return symbol, False, "机器人启动超时"
+        except CancelledError:
+            running_bots.pop(symbol, None)
+            return symbol, False, "机器人已停止"
         
-        return symbol, False, "机器人启动超时"
+        logger.info(f"{symbol} 机器人已启动")
+        return symbol, True, None
         
     except Exception as e:
+        running_bots.pop(symbol, None)
         error_msg = f"启动 {symbol} 机器人失败: {str(e)}"
         logger.error(error_msg)
         return symbol, False, error_msg
@@ -221,8 +340,54 @@ def signal_handler(signum, frame):
         except Exception as e:
             main_logger.error(f"停止 {symbol} 机器人失败: {e}")
     
+    for hub in (market_hub, user_hub):
+        if hub is not None:
+            hub.stop()
+    
     sys.exit(0)
 
+def format_pipeline_metrics(symbol, metrics):
+    """
+    把机器人的流水线指标格式化成一行日志
+    
+    Args:
+        symbol: 币种
+        metrics: BinanceGridBot.pipeline_metrics() 的返回值
+    """
+    ticker = metrics.get('ticker', {})
+    orders = metrics.get('orders', {})
+    reconcile = metrics.get('reconcile', {})
+    return (f"[流水线] {symbol} 行情: 收到 {ticker.get('received', 0)} 合并 {ticker.get('coalesced', 0)} "
+            f"延迟 {ticker.get('lag_ms', 0)}ms(最大 {ticker.get('max_lag_ms', 0)}ms) | "
+            f"订单队列: 深度 {orders.get('depth', 0)}/{orders.get('maxsize', 0)} 最大 {orders.get('max_depth', 0)} "
+            f"丢弃 {orders.get('dropped', 0)} 延迟 {orders.get('lag_ms', 0)}ms(最大 {orders.get('max_lag_ms', 0)}ms) | "
+            f"对账: {reconcile.get('runs', 0)} 次 间隔 {reconcile.get('interval_s', 0)}s "
+            f"持仓不一致 {reconcile.get('position_mismatches', 0)} 挂单不一致 {reconcile.get('order_count_mismatches', 0)} "
+            f"订单不一致 {reconcile.get('registry_mismatches', 0)} 漏推送 {reconcile.get('stream_gaps', 0)}")
+
+def format_latency_summary(symbol, latency):
+    """
+    把各阶段耗时分位数格式化成一行日志，没有记录时返回 None
+    
+    Args:
+        symbol: 币种
+        latency: BinanceGridBot.pipeline_metrics() 中的 'latency'
+    """
+    spans = [
+        f"{span}={stats.get(0.5, 0) * 1000:.1f}/{stats.get(0.99, 0) * 1000:.1f}/{stats.get(0.999, 0) * 1000:.1f}"
+        for span, stats in sorted(latency.items()) if stats.get('count')
+    ]
+    if not spans:
+        return None
+    return f"[耗时] {symbol} p50/p99/p999(ms): {' '.join(spans)}"
+
+def log_pipeline_metrics(symbol, metrics):
+    """输出流水线指标和耗时分位数日志"""
+    main_logger.info(format_pipeline_metrics(symbol, metrics))
+    latency_line = format_latency_summary(symbol, metrics.get('latency', {}))
+    if latency_line:
+        main_logger.info(latency_line)
+
 def print_status():
     """
     打印当前运行状态并写入状态汇总日志
@@ -246,6 +411,9 @@ def print_status():
                         f.write(status_summary + '\n')
                 except Exception as e:
                     main_logger.error(f"写入状态汇总日志失败: {e}")
+                
+                for symbol, bot in list(running_bots.items()):
+                    log_pipeline_metrics(symbol, bot.pipeline_metrics())
             else:
                 daily_status_logger.log_status("当前没有活跃的机器人")
                 
@@ -262,13 +430,379 @@ def print_status():
         except KeyboardInterrupt:
             break
 
+def collect_local_metrics():
+    """采集本进程内各机器人、共享数据中心和 REST 请求预算的指标"""
+    return merge_samples(
+        collect_bot_metrics(running_bots),
+        collect_process_metrics(market_hub, user_hub, get_shared_budget(), loop_watchdog.snapshot()),
+    )
+
+def start_metrics_server(collector, profile_handler=profiler.trigger_profile):
+    """按配置在独立线程中启动指标服务，未启用或启动失败时返回 None"""
+    if not ENABLE_METRICS:
+        return None
+    try:
+        server = MetricsServer(collector, port=METRICS_PORT, profile_handler=profile_handler)
+        server.start_in_thread()
+        return server
+    except Exception as e:
+        main_logger.error(f"启动指标服务失败: {e}")
+        return None
+
+async def report_worker_status(status_queue, worker_id, startup=None):
+    """
+    定期向 supervisor 上报本进程内各机器人的状态
+    
+    启动阶段同样按周期上报（附带启动进度），避免 supervisor 把仍在启动的进程判定为卡死。
+    
+    Args:
+        status_queue: 进程间状态队列
+        worker_id: 工作进程编号
+        startup: 启动进度 {'phase': ..., 'ready': 已就绪数, 'total': 总数}，由 run_all_bots 原地更新
+    """
+    while True:
+        bots = {}
+        for symbol, bot in list(running_bots.items()):
+            bots[symbol] = {
+                'running': bool(getattr(bot, 'running', False)),
+                'long_position': bot.long_position,
+                'short_position': bot.short_position,
+                'latest_price': bot.latest_price,
+                'pipeline': bot.pipeline_metrics(),
+            }
+        try:
+            status_queue.put_nowait({'worker': worker_id, 'pid': os.getpid(), 'ts': time.time(), 'bots': bots,
+                                     'startup': dict(startup) if startup is not None else None,
+                                     'metrics': collect_local_metrics() if ENABLE_METRICS else {}})
+        except Exception as e:
+            main_logger.warning(f"工作进程 {worker_id} 上报状态失败: {e}")
+        await asyncio.sleep(WORKER_STATUS_INTERVAL)
+
+async def run_all_bots(symbols, api_key, api_secret, status_queue=None, worker_id=None):
+    """
+    单事件循环模式：所有币种机器人作为同一事件循环中的任务运行
+    
+    - 所有机器人共用一个交易所实例（市场信息只加载一次）和共享数据中心
+    - 阻塞的 REST 调用统一交给有界线程池执行
+    - 收到 SIGINT/SIGTERM 后停止所有机器人并取消其任务
+    
+    Args:
+        symbols: 币种配置列表
+        api_key: API密钥
+        api_secret: API密钥
+        status_queue: supervisor 模式下的进程间状态队列
+        worker_id: supervisor 模式下的工作进程编号
+    """
+    global market_hub, user_hub
+    
+    loop = asyncio.get_running_loop()
+    profiler.register_current_loop("event-loop")
+    watchdog_task = loop_watchdog.watch_current_loop("event-loop")
+    executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+    loop.set_default_executor(executor)
+    
+    shutdown = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, shutdown.set)
+    
+    # 状态上报先于启动开始，启动期间也持续刷新心跳并报告进度
+    hub_tasks = []
+    startup_progress = {'phase': 'prefetch', 'ready': 0, 'total': len(symbols)}
+    if status_queue is not None:
+        hub_tasks.append(asyncio.create_task(report_worker_status(status_queue, worker_id, startup_progress),
+                                             name="worker-status"))
+    
+    # 第一阶段：预加载共用数据（市场信息、持仓模式）
+    exchange = await loop.run_in_executor(executor, prefetch_shared_data, api_key, api_secret, symbols)
+    
+    if SHARED_MARKET_STREAM:
+        market_hub = MarketDataHub()
+        hub_tasks.append(asyncio.create_task(market_hub.run(), name="market-data-hub"))
+    if needs_user_hub(symbols):
+        user_hub = UserDataHub(create_exchange(api_key, api_secret, load_markets=False))
+        hub_tasks.append(asyncio.create_task(user_hub.run(), name="user-data-hub"))
+    
+    fanout = create_ticker_fanout(market_hub, symbols)
+    bot_tasks = {}
+    
+    def _on_bot_done(symbol, task):
+        running_bots.pop(symbol, None)
+        bot_tasks.pop(symbol, None)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            create_bot_logger(symbol).error(f"机器人运行异常: {error}")
+            main_logger.error(f"{symbol} 机器人异常退出: {error}")
+    
+    # 第二阶段：有界并发地构造并启动机器人，以启动完成信号（bot.ready）为准
+    startup = asyncio.Semaphore(STARTUP_CONCURRENCY)
+    
+    async def _launch(symbol_config):
+        symbol = bot_name(symbol_config)
+        logger = create_bot_logger(symbol)
+        config = build_bot_config(symbol_config)
+        async with startup:
+            logger.info(f"启动 {symbol} 网格机器人")
+            logger.info(f"配置: 网格间距={config['grid_spacing']:.3f}, 初始数量={config['initial_quantity']}, 杠杆={config['leverage']}")
+            try:
+                # 构造函数包含阻塞的 REST 调用，放到线程池中执行
+                bot = await loop.run_in_executor(executor, functools.partial(
+                    BinanceGridBot, symbol=symbol_config['name'], api_key=api_key, api_secret=api_secret, config=config,
+                    market_hub=fanout.view() if fanout is not None else market_hub, user_hub=user_hub,
+                    exchange=exchange, executor=executor))
+            except Exception as e:
+                error_msg = f"启动 {symbol} 机器人失败: {str(e)}"
+                logger.error(error_msg)
+                main_logger.error(error_msg)
+                return False
+            
+            running_bots[symbol] = bot
+            task = asyncio.create_task(bot.start(), name=f"bot-{symbol}")
+            task.add_done_callback(functools.partial(_on_bot_done, symbol))
+            bot_tasks[symbol] = task
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(bot.ready)), STARTUP_TIMEOUT)
+            except asyncio.TimeoutError:
+                main_logger.warning(f"{symbol} 机器人 {STARTUP_TIMEOUT} 秒内未完成启动，继续在后台启动")
+                return False
+            except Exception:
+                # 启动失败，由 _on_bot_done 记录
+                return False
+            startup_progress['ready'] += 1
+            return True
+    
+    startup_started = time.time()
+    startup_progress['phase'] = 'starting'
+    results = await asyncio.gather(*(_launch(symbol_config) for symbol_config in symbols))
+    startup_progress['phase'] = 'running'
+    main_logger.info(f"单事件循环模式: {sum(results)}/{len(symbols)} 个机器人启动完成，"
+                     f"用时 {time.time() - startup_started:.1f} 秒")
+    
+    try:
+        await shutdown.wait()
+    finally:
+        main_logger.info("收到停止信号，正在停止所有机器人...")
+        stop_event.set()
+        for symbol, bot in list(running_bots.items()):
+            try:
+                bot.stop()
+                main_logger.info(f"已停止 {symbol} 机器人")
+            except Exception as e:
+                main_logger.error(f"停止 {symbol} 机器人失败: {e}")
+        
+        tasks = list(bot_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        
+        for hub in (market_hub, user_hub):
+            if hub is not None:
+                hub.stop()
+        for task in hub_tasks:
+            if task.get_name() == "worker-status":
+                task.cancel()
+        if watchdog_task is not None:
+            watchdog_task.cancel()
+        await asyncio.gather(*hub_tasks, return_exceptions=True)
+        executor.shutdown(wait=False)
+
+def split_symbols(symbols, workers):
+    """
+    把币种轮询分配到各工作进程
+    
+    Args:
+        symbols: 币种配置列表
+        workers: 工作进程数
+        
+    Returns:
+        list: 每个工作进程负责的币种配置列表（不含空分片）
+    """
+    shards = [[] for _ in range(max(1, workers))]
+    for i, symbol_config in enumerate(symbols):
+        shards[i % len(shards)].append(symbol_config)
+    return [shard for shard in shards if shard]
+
+def worker_main(worker_id, symbols, api_key, api_secret, status_queue):
+    """supervisor 模式的工作进程入口：在单个事件循环中运行分配到的币种"""
+    main_logger.info(f"工作进程 {worker_id} (pid={os.getpid()}) 启动，负责币种: {[s['name'] for s in symbols]}")
+    profiler.install_signal_handler()
+    try:
+        asyncio.run(run_all_bots(symbols, api_key, api_secret, status_queue=status_queue, worker_id=worker_id))
+    except KeyboardInterrupt:
+        pass
+
+def write_supervisor_status(worker_status, shards):
+    """
+    合并各工作进程上报的状态并写入状态汇总日志
+    
+    Args:
+        worker_status: {worker_id: 最近一次上报的状态}
+        shards: 每个工作进程负责的币种配置列表
+    """
+    entries = []
+    for worker_id, shard in enumerate(shards):
+        bots = worker_status.get(worker_id, {}).get('bots', {})
+        for symbol_config in shard:
+            symbol = bot_name(symbol_config)
+            state = 'Running' if bots.get(symbol, {}).get('running') else 'Stopped'
+            entries.append(f"{symbol}={state}")
+    
+    for status in worker_status.values():
+        for symbol, bot_status in status.get('bots', {}).items():
+            if bot_status.get('pipeline'):
+                log_pipeline_metrics(symbol, bot_status['pipeline'])
+    
+    running = sum(1 for entry in entries if entry.endswith('=Running'))
+    daily_status_logger.log_status(f"当前活跃机器人: {running}/{len(entries)} 个，工作进程 {len(shards)} 个")
+    for worker_id, status in sorted(worker_status.items()):
+        startup = status.get('startup')
+        if startup and startup.get('phase') != 'running':
+            main_logger.info(f"工作进程 {worker_id} 启动中 ({startup['phase']}): "
+                             f"{startup['ready']}/{startup['total']} 个机器人已就绪")
+    
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    status_summary = f"[{timestamp}] Active Bots: {', '.join(entries) if entries else 'None'}"
+    try:
+        with open('log/status_summary.log', 'a', encoding='utf-8') as f:
+            f.write(status_summary + '\n')
+    except Exception as e:
+        main_logger.error(f"写入状态汇总日志失败: {e}")
+
+def run_supervisor(symbols, api_key, api_secret, workers):
+    """
+    supervisor 模式：把币种分片到多个工作进程，每个进程在单个事件循环中运行自己的币种
+    
+    - 工作进程崩溃或超过 WORKER_STALL_TIMEOUT 未上报状态时，按指数退避重启
+    - 合并各工作进程上报的状态写入状态汇总日志
+    - 合并各工作进程上报的指标，由本进程统一提供 /metrics（按 worker 标签区分）
+    
+    Args:
+        symbols: 币种配置列表
+        api_key: API密钥
+        api_secret: API密钥
+        workers: 工作进程数
+    """
+    # 先在本进程预加载共用数据：市场信息写入磁盘缓存，工作进程启动时直接读取，不再各自下载
+    try:
+        prefetch_shared_data(api_key, api_secret, symbols)
+    except Exception as e:
+        main_logger.warning(f"预加载共用数据失败: {e}")
+    
+    ctx = multiprocessing.get_context("spawn")
+    status_queue = ctx.Queue()
+    shards = split_symbols(symbols, workers)
+    processes = {}
+    restart_delay = {}
+    restart_at = {}
+    worker_status = {}
+    
+    def _start_worker(worker_id):
+        process = ctx.Process(
+            target=worker_main,
+            args=(worker_id, shards[worker_id], api_key, api_secret, status_queue),
+            name=f"bot-worker-{worker_id}",
+            daemon=False,
+        )
+        process.start()
+        processes[worker_id] = (process, time.time())
+        main_logger.info(f"已启动工作进程 {worker_id} (pid={process.pid})，币种数: {len(shards[worker_id])}")
+    
+    def _stop_worker(process, timeout=30):
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout)
+        if process.is_alive():
+            process.kill()
+            process.join()
+    
+    def _request_stop(signum, frame):
+        main_logger.info("收到停止信号，正在停止所有工作进程...")
+        stop_event.set()
+    
+    def _collect_worker_metrics():
+        statuses = list(worker_status.items())
+        return merge_samples(*(status.get('metrics', {}) for _, status in statuses),
+                             extra_labels=[{'worker': str(worker_id)} for worker_id, _ in statuses])
+    
+    def _profile_workers(seconds=None, all_threads=False):
+        # 采样在各工作进程内进行，时长使用工作进程的 PROFILE_SECONDS
+        pids = []
+        for process, _ in list(processes.values()):
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGUSR1)
+                pids.append(process.pid)
+        main_logger.info(f"已通知工作进程开始性能采样: {pids}")
+        return {'started': bool(pids), 'workers': pids}
+    
+    signal.signal(signal.SIGINT, _request_stop)
+    signal.signal(signal.SIGTERM, _request_stop)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda *_: _profile_workers())
+    
+    metrics_server = start_metrics_server(_collect_worker_metrics, _profile_workers)
+    
+    main_logger.info(f"supervisor 模式: {len(symbols)} 个币种分配到 {len(shards)} 个工作进程")
+    # 各工作进程平分同一账户的 REST 请求额度（子进程继承环境变量）
+    os.environ.setdefault("RATE_LIMIT_SHARE", f"{1.0 / len(shards):.4f}")
+    for worker_id in range(len(shards)):
+        _start_worker(worker_id)
+    
+    last_summary = 0
+    while not stop_event.is_set():
+        # 汇总各工作进程上报的状态
+        while True:
+            try:
+                status = status_queue.get(timeout=1)
+            except queue.Empty:
+                break
+            worker_status[status['worker']] = status
+        
+        now = time.time()
+        for worker_id, (process, started_at) in list(processes.items()):
+            reported_at = worker_status.get(worker_id, {}).get('ts', started_at)
+            if process.is_alive() and now - reported_at <= WORKER_STALL_TIMEOUT:
+                # 稳定运行一段时间后重置退避
+                if now - started_at > WORKER_RESTART_MAX_DELAY:
+                    restart_delay.pop(worker_id, None)
+                continue
+            
+            if worker_id not in restart_at:
+                if process.is_alive():
+                    main_logger.error(f"工作进程 {worker_id} 超过 {WORKER_STALL_TIMEOUT} 秒未上报状态，判定卡死并重启")
+                    _stop_worker(process)
+                else:
+                    main_logger.error(f"工作进程 {worker_id} 已退出 (exitcode={process.exitcode})")
+                delay = min(restart_delay.get(worker_id, 2.5) * 2, WORKER_RESTART_MAX_DELAY)
+                restart_delay[worker_id] = delay
+                restart_at[worker_id] = now + delay
+                worker_status.pop(worker_id, None)
+                main_logger.info(f"工作进程 {worker_id} 将在 {delay:.0f} 秒后重启")
+            elif now >= restart_at[worker_id]:
+                restart_at.pop(worker_id)
+                _start_worker(worker_id)
+        
+        if now - last_summary >= 30:
+            write_supervisor_status(worker_status, shards)
+            last_summary = now
+    
+    for process, _ in processes.values():
+        _stop_worker(process)
+    if metrics_server is not None:
+        metrics_server.stop()
+    main_logger.info("所有工作进程已停止")
+
 def main():
     """
     主函数
     """
+    global market_hub, user_hub
+    
     # 注册信号处理器
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
+    # SIGUSR1: 对运行中的事件循环做一次采样分析（supervisor 模式下转发给各工作进程）
+    profiler.install_signal_handler()
     
     main_logger.info("多币种网格交易机器人启动中...")
     
@@ -279,7 +813,7 @@ def main():
         sys.exit(1)
     
     # 加载配置文件
-    config = load_config()
+    config = load_config(SYMBOLS_CONFIG)
     if not config:
         main_logger.error("配置文件加载失败，程序退出")
         sys.exit(1)
@@ -287,30 +821,54 @@ def main():
     symbols = config['symbols']
     main_logger.info(f"配置了 {len(symbols)} 个币种: {[s['name'] for s in symbols]}")
     
+    if RUN_MODE == "supervisor":
+        workers = MULTI_BOT_WORKERS if MULTI_BOT_WORKERS > 0 else (os.cpu_count() or 1)
+        run_supervisor(symbols, api_key, api_secret, workers)
+        return
+    
     # 启动状态监控线程
     status_thread = threading.Thread(target=print_status, daemon=True)
     status_thread.start()
     
-    # 直接运行所有机器人，不使用线程池
-    bot_threads = {}
-    for symbol_config in symbols:
-        symbol = symbol_config['name']
-        main_logger.info(f"启动 {symbol} 网格机器人")
-        
-        # 创建机器人线程
-        bot_thread = threading.Thread(
-            target=run_single_bot, 
-            args=(symbol_config, api_key, api_secret),
-            name=f"bot-{symbol}",
-            daemon=True
-        )
-        bot_thread.start()
-        bot_threads[symbol] = bot_thread
+    # 启动指标服务：只读取内存状态，运行在独立线程中，不影响交易任务
+    start_metrics_server(collect_local_metrics)
+    
+    if RUN_MODE == "loop":
+        asyncio.run(run_all_bots(symbols, api_key, api_secret))
+        return
+    
+    # 第一阶段：预加载共用数据（市场信息、持仓模式）
+    prefetch_shared_data(api_key, api_secret, symbols)
     
-    # 等待所有机器人启动完成
-    main_logger.info("等待所有机器人启动完成...")
-    for symbol, thread in bot_threads.items():
-        thread.join(timeout=60)  # 最多等待60秒
+    # 启动共享行情数据中心：所有币种共用组合流连接
+    if SHARED_MARKET_STREAM:
+        market_hub = MarketDataHub()
+        market_hub.start_in_thread()
+        main_logger.info("共享行情数据中心已启动")
+    
+    # 启动账户级用户数据流：整个账户只维护一个 listenKey
+    if needs_user_hub(symbols):
+        user_hub = UserDataHub(create_exchange(api_key, api_secret, load_markets=False))
+        user_hub.start_in_thread()
+        main_logger.info("账户级用户数据流已启动")
+    
+    # 第二阶段：有界并发地构造并启动机器人（每个机器人仍运行在自己的线程和事件循环中），以启动完成信号为准
+    fanout = create_ticker_fanout(market_hub, symbols)
+    startup_started = time.time()
+    ready_count = 0
+    with ThreadPoolExecutor(max_workers=STARTUP_CONCURRENCY, thread_name_prefix="bot-startup") as pool:
+        futures = [
+            pool.submit(run_single_bot, symbol_config, api_key, api_secret,
+                        fanout.view() if fanout is not None else market_hub, user_hub)
+            for symbol_config in symbols
+        ]
+        for future in as_completed(futures):
+            symbol, success, error_msg = future.result()
+            if success:
+                ready_count += 1
+            else:
+                main_logger.error(f"{symbol} 启动失败: {error_msg}")
+    main_logger.info(f"{ready_count}/{len(symbols)} 个机器人启动完成，用时 {time.time() - startup_started:.1f} 秒")
     
     # 主循环：监控机器人状态
     try:
@@ -335,6 +893,10 @@ def main():
                 main_logger.info(f"已停止 {symbol} 机器人")
             except Exception as e:
                 main_logger.error(f"停止 {symbol} 机器人失败: {e}")
+        
+        for hub in (market_hub, user_hub):
+            if hub is not None:
+                hub.stop()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
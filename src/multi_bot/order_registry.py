@@ -0,0 +1,376 @@
+"""
+订单注册表
+
+按 clientOrderId 跟踪机器人自己发出的每一笔订单：
+PENDING_NEW → NEW → PARTIALLY_FILLED → FILLED / CANCELED / EXPIRED / EXPIRED_IN_MATCH / REJECTED。
+所有状态变化和成交追加写入 JSONL 日志，重启时回放日志即可恢复未完成订单
+（有检查点时只回放检查点之后追加的部分），与交易所对账只需比较两边的 clientOrderId 集合。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+PENDING_NEW = 'PENDING_NEW'
+NEW = 'NEW'
+PARTIALLY_FILLED = 'PARTIALLY_FILLED'
+FILLED = 'FILLED'
+CANCELED = 'CANCELED'
+EXPIRED = 'EXPIRED'
+# 自成交保护（STP）触发时订单以该状态结束
+EXPIRED_IN_MATCH = 'EXPIRED_IN_MATCH'
+REJECTED = 'REJECTED'
+
+TERMINAL_STATUSES = (FILLED, CANCELED, EXPIRED, EXPIRED_IN_MATCH, REJECTED)
+
+# 状态只能前进，乱序到达的旧状态推送直接忽略
+_STATUS_RANK = {
+    PENDING_NEW: 0,
+    NEW: 1,
+    PARTIALLY_FILLED: 2,
+    FILLED: 3,
+    CANCELED: 3,
+    EXPIRED: 3,
+    EXPIRED_IN_MATCH: 3,
+    REJECTED: 3,
+}
+
+# 币安 clientOrderId 最长 36 个字符
+CLIENT_ORDER_ID_MAX_LEN = 36
+
+# 日志超过该大小时轮转为 .1，新日志以未完成订单开头
+JOURNAL_MAX_BYTES = 5 * 1024 * 1024
+
+# 记住最近结束的订单数，用于区分"迟到的重复推送"和"漏掉的推送"
+RECENTLY_CLOSED_SIZE = 1000
+
+
+def _base36(value):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    out = ''
+    while True:
+        value, rem = divmod(value, 36)
+        out = digits[rem] + out
+        if value == 0:
+            return out
+
+
+class OrderRecord:
+    """单笔订单的本地状态"""
+
+    __slots__ = ('client_order_id', 'order_id', 'side', 'position_side', 'price', 'quantity',
+                 'filled', 'status', 'reduce_only', 'intent', 'created_ts', 'updated_ts')
+
+    def __init__(self, client_order_id, side, position_side, price, quantity, reduce_only=False,
+                 intent='', status=PENDING_NEW, order_id=None, filled=0.0, created_ts=None):
+        now = time.time()
+        self.client_order_id = client_order_id
+        self.order_id = order_id
+        self.side = side
+        self.position_side = position_side
+        self.price = price
+        self.quantity = quantity
+        self.filled = filled
+        self.status = status
+        self.reduce_only = reduce_only
+        self.intent = intent
+        self.created_ts = created_ts if created_ts is not None else now
+        self.updated_ts = now
+
+    @property
+    def is_open(self):
+        return self.status not in TERMINAL_STATUSES
+
+    @property
+    def remaining(self):
+        return max(0.0, self.quantity - self.filled)
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls(data['client_order_id'], data.get('side'), data.get('position_side'), data.get('price'),
+                     data.get('quantity', 0.0), data.get('reduce_only', False), data.get('intent', ''),
+                     data.get('status', PENDING_NEW), data.get('order_id'), data.get('filled', 0.0),
+                     data.get('created_ts'))
+        record.updated_ts = data.get('updated_ts', record.updated_ts)
+        return record
+
+
+class OrderRegistry:
+    """单个交易对的订单注册表，线程安全（下单在线程池中执行，推送在事件循环中处理）"""
+
+    def __init__(self, symbol, journal_path, prefix='x-TBzTen1X-'):
+        self.symbol = symbol
+        self.journal_path = journal_path
+        self.prefix = prefix
+        self.orders = {}
+        self._closed = OrderedDict()
+        self._lock = threading.Lock()
+        self._seq = 0
+        # 每次启动一个会话号，clientOrderId = 前缀 + 会话号 + 序号，同一进程内不会重复
+        self._session = _base36(int(time.time()))
+        self._journal = None
+        self._journal_size = 0
+        # 轮转后新日志开头写入的未完成订单大小；轮转按之后追加的字节数判断，避免开头过大时反复轮转
+        self._journal_base = 0
+
+    # ===== clientOrderId =====
+    def next_client_order_id(self):
+        """生成下一个 clientOrderId（重试同一笔订单时应复用，交易所会拒绝重复的 ID）"""
+        with self._lock:
+            self._seq += 1
+            client_order_id = f"{self.prefix}{self._session}{_base36(self._seq)}"
+        return client_order_id[:CLIENT_ORDER_ID_MAX_LEN]
+
+    def owns(self, client_order_id):
+        """是否为本注册表（前缀）发出的订单"""
+        return bool(client_order_id) and client_order_id.startswith(self.prefix)
+
+    # ===== 日志 =====
+    @staticmethod
+    def _line(event, record, **extra):
+        """构造一条日志（JSONL）"""
+        entry = {'ts': round(time.time(), 3), 'ev': event, 'cid': record.client_order_id}
+        if event == 'new':
+            entry.update({
+                'side': record.side, 'ps': record.position_side, 'price': record.price,
+                'qty': record.quantity, 'ro': record.reduce_only, 'intent': record.intent,
+            })
+        else:
+            entry.update({'status': record.status, 'id': record.order_id, 'filled': record.filled})
+        entry.update(extra)
+        return json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+    def _seed(self):
+        """轮转后新日志的开头：每笔未完成订单一条 new 和一条 status"""
+        return ''.join(self._line('new', record) + self._line('status', record) for record in self.orders.values())
+
+    def _write(self, event, record, **extra):
+        """追加一条日志（调用方持有 self._lock）"""
+        line = self._line(event, record, **extra)
+        try:
+            if self._journal is None:
+                os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+                self._journal_size = os.path.getsize(self.journal_path)
+                self._journal_base = min(self._journal_size, len(self._seed()))
+            self._journal.write(line)
+            self._journal.flush()
+            self._journal_size += len(line)
+            if self._journal_size - self._journal_base > JOURNAL_MAX_BYTES:
+                self._rotate()
+        except OSError as e:
+            logger.error(f"写入订单日志失败: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def checkpoint(self):
+        """
+        当前未完成订单及日志写到的位置，保存后可传给 restore() 跳过已回放的部分
+
+        Returns:
+            dict: {'inode', 'offset', 'orders'}
+        """
+        with self._lock:
+            try:
+                if self._journal is not None:
+                    stat = os.fstat(self._journal.fileno())
+                else:
+                    stat = os.stat(self.journal_path)
+                inode, offset = stat.st_ino, stat.st_size
+            except OSError:
+                inode, offset = None, 0
+            return {'inode': inode, 'offset': offset,
+                    'orders': [record.to_dict() for record in self.orders.values()]}
+
+    def restore(self, checkpoint=None):
+        """
+        回放日志恢复未完成订单，返回恢复的订单数
+
+        Args:
+            checkpoint: checkpoint() 的返回值；与当前日志文件一致时从检查点的订单出发，
+                        只回放之后追加的日志，否则回放整个日志
+        """
+        if not os.path.exists(self.journal_path):
+            return 0
+
+        orders = {}
+        offset = 0
+        stat = os.stat(self.journal_path)
+        if checkpoint and checkpoint.get('inode') == stat.st_ino and 0 < checkpoint.get('offset', 0) <= stat.st_size:
+            orders = {data['client_order_id']: OrderRecord.from_dict(data) for data in checkpoint.get('orders', [])}
+            offset = checkpoint['offset']
+
+        with open(self.journal_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                cid = entry.get('cid')
+                if entry.get('ev') == 'new':
+                    orders[cid] = OrderRecord(cid, entry.get('side'), entry.get('ps'), entry.get('price'),
+                                              entry.get('qty', 0.0), entry.get('ro', False),
+                                              entry.get('intent', ''), created_ts=entry.get('ts'))
+                elif cid in orders:
+                    record = orders[cid]
+                    record.status = entry.get('status', record.status)
+                    record.order_id = entry.get('id') or record.order_id
+                    record.filled = entry.get('filled', record.filled)
+                    record.updated_ts = entry.get('ts', record.updated_ts)
+
+        with self._lock:
+            self.orders = {cid: record for cid, record in orders.items() if record.is_open}
+            if stat.st_size - len(self._seed()) > JOURNAL_MAX_BYTES:
+                self._rotate()
+        return len(self.orders)
+
+    def _rotate(self):
+        """轮转日志：旧日志保留为 .1，新日志以未完成订单开头（调用方持有 self._lock）"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        os.replace(self.journal_path, self.journal_path + '.1')
+        # 开头直接一次写入，不经过 _write，避免轮转中再次触发轮转
+        seed = self._seed()
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal.write(seed)
+        self._journal.flush()
+        self._journal_size = self._journal_base = len(seed)
+
+    # ===== 状态迁移 =====
+    def register(self, client_order_id, side, position_side, price, quantity, reduce_only=False, intent=''):
+        """下单前登记（PENDING_NEW）；同一 clientOrderId 重试时返回已有记录"""
+        with self._lock:
+            record = self.orders.get(client_order_id)
+            if record is None:
+                record = OrderRecord(client_order_id, side, position_side, price, quantity, reduce_only, intent)
+                self.orders[client_order_id] = record
+                self._write('new', record)
+            return record
+
+    def on_ack(self, client_order_id, order_id):
+        """下单请求成功返回"""
+        with self._lock:
+            record = self.orders.get(client_order_id)
+            if record is None:
+                return None
+            record.order_id = str(order_id) if order_id is not None else record.order_id
+            if record.status == PENDING_NEW:
+                record.status = NEW
+            record.updated_ts = time.time()
+            self._write('ack', record)
+            return record
+
+    def on_reject(self, client_order_id, reason=''):
+        """下单请求被拒绝"""
+        return self._transition(client_order_id, REJECTED, None, reason=str(reason)[:200])
+
+    def on_update(self, client_order_id, status, filled=None, order_id=None):
+        """
+        应用订单推送或查询结果
+
+        Returns:
+            OrderRecord，非本注册表订单或状态倒退时返回 None
+        """
+        return self._transition(client_order_id, status, filled, order_id=order_id)
+
+    def _transition(self, client_order_id, status, filled, order_id=None, reason=None):
+        with self._lock:
+            record = self.orders.get(client_order_id)
+            if record is None:
+                return None
+            if _STATUS_RANK.get(status, -1) < _STATUS_RANK.get(record.status, 0):
+                return None
+
+            if order_id is not None:
+                record.order_id = str(order_id)
+            if filled is not None and filled > record.filled:
+                delta = filled - record.filled
+                record.filled = filled
+                record.status = status
+                record.updated_ts = time.time()
+                self._write('fill', record, delta=delta)
+            elif status != record.status:
+                record.status = status
+                record.updated_ts = time.time()
+                if reason:
+                    self._write('status', record, reason=reason)
+                else:
+                    self._write('status', record)
+
+            if not record.is_open:
+                self.orders.pop(client_order_id, None)
+                self._closed[client_order_id] = record.status
+                while len(self._closed) > RECENTLY_CLOSED_SIZE:
+                    self._closed.popitem(last=False)
+            return record
+
+    # ===== 查询与对账 =====
+    def is_known(self, client_order_id):
+        """订单是否在跟踪中或刚结束"""
+        with self._lock:
+            return client_order_id in self.orders or client_order_id in self._closed
+
+    def open_orders(self, position_side=None, side=None):
+        """未完成订单列表，可按持仓方向（LONG/SHORT）和买卖方向（BUY/SELL）过滤"""
+        with self._lock:
+            return [
+                record for record in self.orders.values()
+                if (position_side is None or record.position_side == position_side)
+                and (side is None or record.side == side)
+            ]
+
+    def diff(self, exchange_open_orders, grace=5.0):
+        """
+        与交易所的挂单对账
+
+        Args:
+            exchange_open_orders: fetch_open_orders 的返回值
+            grace: 刚登记不足该秒数的订单不计入"本地有、交易所无"，避免与下单竞争
+
+        Returns:
+            tuple: (本地未完成但交易所已没有的 clientOrderId 列表, 交易所有但本地未登记的订单列表)
+        """
+        now = time.time()
+        remote = {}
+        for order in exchange_open_orders:
+            cid = order.get('clientOrderId') or order.get('info', {}).get('clientOrderId')
+            if cid:
+                remote[cid] = order
+
+        with self._lock:
+            missing_remote = [
+                cid for cid, record in self.orders.items()
+                if cid not in remote and now - record.created_ts > grace
+            ]
+            unknown_local = [order for cid, order in remote.items() if cid not in self.orders]
+        return missing_remote, unknown_local
+
+    def adopt(self, order, intent='adopted'):
+        """把交易所上本地未登记的挂单纳入跟踪（如重启前发出、日志缺失的订单）"""
+        info = order.get('info', {})
+        cid = order.get('clientOrderId') or info.get('clientOrderId')
+        if not cid:
+            return None
+        side = str(order.get('side', '')).upper()
+        position_side = info.get('positionSide')
+        # 双向持仓模式下交易所不返回 reduceOnly，平仓方向的订单（多头卖出、空头买入）即止盈/减仓单
+        reduce_only = bool(order.get('reduceOnly')) or (side, position_side) in (('SELL', 'LONG'), ('BUY', 'SHORT'))
+        record = self.register(cid, side, position_side, order.get('price'), float(order.get('amount') or 0),
+                               reduce_only, intent)
+        self.on_ack(cid, order.get('id'))
+        status = info.get('status') or NEW
+        return self.on_update(cid, status, float(order.get('filled') or 0)) or record
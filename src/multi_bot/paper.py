@@ -0,0 +1,261 @@
+"""
+纸面交易模式
+
+symbols.yaml 中 mode: paper 的币种照常接收真实（或回放的）bookTicker 行情，
+但下单、撤单、查单、持仓、余额等私有接口由进程内撮合引擎（sim_engine）作答：
+- REST 往返按 paper_latency_ms ± paper_latency_jitter_ms 模拟延迟
+- 挂单被穿价时按 paper_partial_fill_ratio 部分成交
+- 订单状态变化以 ORDER_TRADE_UPDATE 格式推送给机器人（延迟 paper_latency_ms），处理路径与实盘相同
+每个纸面机器人有独立的模拟账户，不占用账户的 REST 请求预算，也不需要 listenKey；
+市场信息来自进程内共享的市场信息缓存（market_cache），与实盘机器人共用。
+同一交易对可以配置多个纸面机器人（用 id 区分），并排比较不同参数。
+"""
+
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+
+import ccxt
+
+from binance_multi_bot import CustomBinance
+from latency import record_current
+from market_cache import get_market_cache
+from sim_engine import MatchingEngine, SimFuturesApi, SimError
+from traffic_journal import request_params
+
+logger = logging.getLogger(__name__)
+
+
+def is_paper(config):
+    return str((config or {}).get('mode', 'live')).lower() == 'paper'
+
+
+def _precision_step(value):
+    """ccxt 精度转换为最小变动单位：整数为小数位数（与 _get_price_precision 一致），浮点数本身即步长"""
+    if isinstance(value, int):
+        return 10.0 ** -value
+    return float(value)
+
+
+def market_steps(market):
+    """
+    交易对的价格步长和数量步长
+
+    优先读取币安交易规则（PRICE_FILTER.tickSize、LOT_SIZE.stepSize），缺失时由 ccxt 精度换算
+    """
+    filters = {f.get('filterType'): f for f in (market.get('info') or {}).get('filters') or []}
+    tick_size = filters.get('PRICE_FILTER', {}).get('tickSize')
+    step_size = filters.get('LOT_SIZE', {}).get('stepSize')
+    return (float(tick_size) if tick_size else _precision_step(market['precision']['price']),
+            float(step_size) if step_size else _precision_step(market['precision']['amount']))
+
+
+class PaperExchange(CustomBinance):
+    """
+    纸面交易所：私有接口由 SimFuturesApi 作答，同时充当该机器人的用户数据流
+    （subscribe/unsubscribe/reconnects 与 UserDataHub 一致）
+    """
+
+    def __init__(self, symbol, config):
+        """
+        Args:
+            symbol: 交易所中的交易对名称，如 BTCUSDT
+            config: 机器人配置，读取 paper_balance、paper_fee_rate、paper_latency_ms、
+                    paper_latency_jitter_ms、paper_partial_fill_ratio、leverage
+        """
+        super().__init__({
+            'apiKey': 'paper',
+            'secret': 'paper',
+            'options': {'defaultType': 'future', 'fetchCurrencies': False},
+        })
+        self.paper_symbol = symbol.upper()
+        self.latency = float(config.get('paper_latency_ms', 50)) / 1000
+        self.latency_jitter = float(config.get('paper_latency_jitter_ms', 20)) / 1000
+        cache = get_market_cache()
+        cache.load_into(self)
+        market = cache.market(self, self.paper_symbol)
+        tick_size, step_size = market_steps(market)
+        spec = {
+            'tick_size': tick_size,
+            'step_size': step_size,
+            'min_qty': market['limits']['amount']['min'] or 0,
+            'min_notional': market['limits']['cost']['min'] or 0,
+        }
+        self.engine = MatchingEngine({self.paper_symbol: spec}, float(config.get('paper_balance', 10000)),
+                                     float(config.get('paper_fee_rate', 0.0002)),
+                                     float(config.get('paper_partial_fill_ratio', 1.0)))
+        self.api = SimFuturesApi(self.engine, int(config.get('leverage', 20)))
+        self.engine.add_listener(self._on_engine_event)
+        self._subscriber = None
+        self.reconnects = 0
+        self.connection_count = 0
+
+    # ===== REST =====
+    def fetch(self, url, method='GET', headers=None, body=None):
+        path, params = request_params(url, body)
+        if not self.api.supports(method, path) or path == '/fapi/v1/exchangeInfo':
+            return super().fetch(url, method, headers, body)
+
+        self.last_response_headers = {}
+        started = time.monotonic()
+        delay = random.uniform(max(0.0, self.latency - self.latency_jitter), self.latency + self.latency_jitter)
+        if delay > 0:
+            # 一半在请求到达"交易所"之前，一半在响应返回途中
+            time.sleep(delay / 2)
+        try:
+            response = self.api.handle(method, path, params)
+        except SimError as e:
+            error = {'code': e.code, 'msg': e.msg}
+            text = json.dumps(error)
+            self.handle_errors(400, 'Bad Request', url, method, {}, text, error, headers, body)
+            raise ccxt.ExchangeError(f"{self.id} {text}")
+        finally:
+            if delay > 0:
+                time.sleep(delay / 2)
+            record_current(f"rest {method.upper()} {path}", time.monotonic() - started)
+        return response
+
+    # ===== 行情 =====
+    def on_quote(self, bid, ask):
+        """机器人收到 bookTicker 时调用：更新模拟盘口并撮合挂单"""
+        self.engine.update_quote(self.paper_symbol, bid, ask)
+
+    # ===== 用户数据流 =====
+    def subscribe(self, symbol, callback, loop=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._subscriber = (callback, loop)
+
+    def unsubscribe(self, symbol):
+        self._subscriber = None
+
+    def _on_engine_event(self, event):
+        # 在引擎锁内调用（可能在线程池线程中），投递到机器人事件循环；固定延迟保证推送顺序不变
+        subscriber = self._subscriber
+        if subscriber is None:
+            return
+        callback, loop = subscriber
+        try:
+            loop.call_soon_threadsafe(loop.call_later, self.latency, self._deliver, callback, loop, event)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    @staticmethod
+    def _deliver(callback, loop, event):
+        loop.create_task(callback(event))
+
+
+class _Subscriber:
+    """TickerFanout 的一个订阅者：最新一条未投递的行情，以及是否已安排投递任务"""
+
+    __slots__ = ('callback', 'loop', 'latest', 'pending')
+
+    def __init__(self, callback, loop):
+        self.callback = callback
+        self.loop = loop
+        self.latest = None
+        self.pending = False
+
+
+class TickerFanout:
+    """
+    让同一 bookTicker stream 可以有多个订阅者（同一交易对的多个纸面/实盘机器人）
+
+    行情数据中心每个 stream 只对应一个订阅者；这里向数据中心只订阅一次，再分发给每个机器人。
+    view() 返回与 MarketDataHub 接口一致的对象，每个机器人一个，unsubscribe 只移除自己。
+    与数据中心一致：订阅者仍在处理上一条行情时只保留最新一条，处理完成后立即投递，最后一条不会丢失。
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self._subscribers = {}
+        self._hub_loops = {}
+        self._lock = threading.Lock()
+
+    def view(self):
+        return _FanoutView(self)
+
+    def _subscribe(self, stream, owner, callback, loop):
+        with self._lock:
+            subscribers = self._subscribers.setdefault(stream, {})
+            first = not subscribers
+            subscribers[owner] = _Subscriber(callback, loop)
+        if first:
+            self._register(stream, loop)
+
+    def _unsubscribe(self, stream, owner):
+        with self._lock:
+            subscribers = self._subscribers.get(stream, {})
+            removed = subscribers.pop(owner, None)
+            remaining = next(iter(subscribers.values()), None)
+        if remaining is None:
+            self.hub.unsubscribe(stream)
+        elif removed is not None and removed.loop is self._hub_loops.get(stream):
+            # 分发函数运行在被移除机器人的事件循环中，改到仍在运行的机器人的事件循环
+            self._register(stream, remaining.loop)
+
+    def _register(self, stream, loop):
+        self._hub_loops[stream] = loop
+        self.hub.subscribe(stream, lambda data, s=stream: self._dispatch(s, data), loop=loop)
+
+    def _dispatch(self, stream, data):
+        scheduled = []
+        with self._lock:
+            for subscriber in self._subscribers.get(stream, {}).values():
+                subscriber.latest = data
+                if not subscriber.pending:
+                    subscriber.pending = True
+                    scheduled.append(subscriber)
+        for subscriber in scheduled:
+            try:
+                asyncio.run_coroutine_threadsafe(self._drain(subscriber), subscriber.loop)
+            except RuntimeError:
+                # 订阅者的事件循环已关闭
+                with self._lock:
+                    subscriber.pending = False
+
+    async def _drain(self, subscriber):
+        """在订阅者事件循环中依次处理最新行情，直到没有新行情"""
+        while True:
+            with self._lock:
+                data, subscriber.latest = subscriber.latest, None
+                if data is None:
+                    subscriber.pending = False
+                    return
+            try:
+                await subscriber.callback(data)
+            except asyncio.CancelledError:
+                with self._lock:
+                    subscriber.pending = False
+                raise
+            except Exception as e:
+                logger.error(f"行情分发处理失败: {e}")
+
+    @property
+    def reconnects(self):
+        return self.hub.reconnects
+
+    @property
+    def connection_count(self):
+        return self.hub.connection_count
+
+
+class _FanoutView:
+    def __init__(self, fanout):
+        self.fanout = fanout
+
+    def subscribe(self, stream, callback, loop=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.fanout._subscribe(stream, self, callback, loop)
+
+    def unsubscribe(self, stream):
+        self.fanout._unsubscribe(stream, self)
+
+    @property
+    def reconnects(self):
+        return self.fanout.reconnects
@@ -0,0 +1,229 @@
+"""
+按需采样分析器
+
+在运行中的进程上按固定间隔采样机器人事件循环线程的调用栈，持续 N 秒后写出
+collapsed-stack 文件（可直接交给 flamegraph.pl / speedscope 生成火焰图）：
+- log/profile_<pid>_<时间>.folded: 线程调用栈采样
+- log/profile_<pid>_<时间>_tasks.folded: asyncio 任务等待位置采样（按实际采样间隔累计的等待时间，毫秒）
+
+只读取解释器中的栈帧，不修改任何状态，可以在实盘进程上触发。
+采样线程只调用 sys._current_frames()；asyncio 任务的栈不是线程安全的，
+由 call_soon_threadsafe 投递到各事件循环线程中收集；收集会占用事件循环，
+因此按较低的频率（PROFILE_TASK_INTERVAL_MS）进行，任务较多时每次只抽样一部分。
+触发方式：向进程发送 SIGUSR1，或 POST 指标服务的 /debug/profile?seconds=N。
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SECONDS = int(os.getenv("PROFILE_SECONDS", "30"))
+PROFILE_INTERVAL_MS = int(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# asyncio 任务采样在事件循环线程中执行，间隔比线程栈采样长
+PROFILE_TASK_INTERVAL_MS = int(os.getenv("PROFILE_TASK_INTERVAL_MS", "50"))
+# 单次任务采样最多读取的任务数，超出时随机抽样并按比例放大等待时间
+PROFILE_TASK_MAX = int(os.getenv("PROFILE_TASK_MAX", "200"))
+# 单次采样的最长时间，避免误触发后长时间占用 CPU
+PROFILE_MAX_SECONDS = 600
+
+# 已注册的事件循环: {线程 ID: (名称, 事件循环)}
+_loops = {}
+_loops_lock = threading.Lock()
+_active = None
+_active_lock = threading.Lock()
+
+
+def register_current_loop(name=None):
+    """登记当前线程正在运行的事件循环（同一线程重复登记无副作用）"""
+    loop = asyncio.get_running_loop()
+    thread = threading.current_thread()
+    with _loops_lock:
+        if thread.ident not in _loops:
+            _loops[thread.ident] = (name or thread.name, loop)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _collapse(frames):
+    return ';'.join(_frame_label(frame) for frame in frames)
+
+
+class SamplingProfiler:
+    """一次采样会话，在独立的守护线程中运行"""
+
+    def __init__(self, seconds=PROFILE_SECONDS, interval_ms=PROFILE_INTERVAL_MS, all_threads=False, output_dir='log'):
+        self.seconds = max(1, min(int(seconds), PROFILE_MAX_SECONDS))
+        self.interval = max(1, int(interval_ms)) / 1000
+        self.task_interval = max(self.interval, PROFILE_TASK_INTERVAL_MS / 1000)
+        self.all_threads = all_threads
+        stamp = time.strftime('%Y%m%d_%H%M%S')
+        self.stack_path = os.path.join(output_dir, f"profile_{os.getpid()}_{stamp}.folded")
+        self.task_path = os.path.join(output_dir, f"profile_{os.getpid()}_{stamp}_tasks.folded")
+        self.stacks = Counter()
+        self.task_waits = Counter()
+        self.samples = 0
+        self._thread = None
+        self._task_lock = threading.Lock()
+        # 已投递但尚未在事件循环中执行的任务采样（事件循环阻塞时不重复投递）
+        self._task_pending = set()
+        # 各事件循环上次投递和上次执行任务采样的时间
+        self._task_scheduled = {}
+        self._task_collected = {}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _targets(self):
+        with _loops_lock:
+            loops = dict(_loops)
+        if self.all_threads or not loops:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            names.pop(threading.get_ident(), None)
+            return names, loops
+        return {ident: name for ident, (name, _) in loops.items()}, loops
+
+    def _sample_threads(self, names):
+        frames = sys._current_frames()
+        for ident, name in names.items():
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame)
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[f"{name};{_collapse(stack)}"] += 1
+
+    def _sample_tasks(self, loops):
+        now = time.monotonic()
+        for name, loop in loops.values():
+            if loop.is_closed() or id(loop) in self._task_pending:
+                continue
+            if now - self._task_scheduled.get(id(loop), 0) < self.task_interval:
+                continue
+            self._task_scheduled[id(loop)] = now
+            self._task_pending.add(id(loop))
+            try:
+                loop.call_soon_threadsafe(self._collect_tasks, name, loop)
+            except RuntimeError:
+                # 事件循环已关闭
+                self._task_pending.discard(id(loop))
+
+    def _collect_tasks(self, name, loop):
+        """
+        在事件循环线程中执行：此时没有任务在运行，所有未完成的任务都在等待。
+        每个任务记入距上次采样的实际间隔（事件循环繁忙时采样会推迟，间隔随之变长）
+        """
+        waits = Counter()
+        try:
+            now = time.monotonic()
+            elapsed = now - self._task_collected.get(id(loop), now - self.task_interval)
+            self._task_collected[id(loop)] = now
+            tasks = [task for task in asyncio.all_tasks(loop) if not task.done()]
+            if len(tasks) > PROFILE_TASK_MAX:
+                elapsed *= len(tasks) / PROFILE_TASK_MAX
+                tasks = random.sample(tasks, PROFILE_TASK_MAX)
+            for task in tasks:
+                stack = task.get_stack()
+                if stack:
+                    waits[f"{name};{task.get_name()};{_collapse(stack)}"] += elapsed
+        finally:
+            self._task_pending.discard(id(loop))
+        with self._task_lock:
+            self.task_waits.update(waits)
+
+    def _run(self):
+        global _active
+        logger.info(f"[性能分析] 开始采样 {self.seconds} 秒，间隔 {self.interval * 1000:.0f}ms")
+        try:
+            deadline = time.monotonic() + self.seconds
+            names, loops = self._targets()
+            while time.monotonic() < deadline:
+                try:
+                    self._sample_threads(names)
+                    self._sample_tasks(loops)
+                    self.samples += 1
+                except Exception as e:
+                    logger.debug(f"[性能分析] 采样失败: {e}")
+                time.sleep(self.interval)
+            self._write()
+        except Exception as e:
+            logger.error(f"[性能分析] 失败: {e}")
+        finally:
+            with _active_lock:
+                _active = None
+
+    def _write(self):
+        os.makedirs(os.path.dirname(self.stack_path) or '.', exist_ok=True)
+        # 事件循环中可能还有未执行完的任务采样
+        with self._task_lock:
+            task_waits = Counter(self.task_waits)
+        # 任务等待按毫秒写出（folded 格式要求整数）
+        task_ms = Counter({stack: round(seconds * 1000) for stack, seconds in task_waits.items()})
+        for path, counter in ((self.stack_path, self.stacks), (self.task_path, task_ms)):
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in counter.most_common():
+                    if count > 0:
+                        f.write(f"{stack} {count}\n")
+        logger.info(f"[性能分析] 完成: {self.samples} 次采样，调用栈 {self.stack_path}，任务等待 {self.task_path}")
+
+        # 日志中给出等待最久的几个位置（按任务和最内层 await 汇总）
+        waits = Counter()
+        for stack, seconds in task_waits.items():
+            parts = stack.split(';')
+            waits[f"{parts[1]} @ {parts[-1]}"] += seconds
+        for location, seconds in waits.most_common(5):
+            logger.info(f"[性能分析] 任务等待 {seconds:.2f}s: {location}")
+
+
+def start_profile(seconds=PROFILE_SECONDS, interval_ms=PROFILE_INTERVAL_MS, all_threads=False):
+    """
+    开始一次采样（已有采样进行中时不重复启动）
+
+    Returns:
+        SamplingProfiler，已有采样进行中时返回 None
+    """
+    global _active
+    # 可能在信号处理函数中调用，不能阻塞等锁
+    if not _active_lock.acquire(blocking=False):
+        return None
+    try:
+        if _active is not None:
+            logger.warning("[性能分析] 已有采样进行中，忽略本次触发")
+            return None
+        _active = SamplingProfiler(seconds, interval_ms, all_threads)
+        return _active.start()
+    finally:
+        _active_lock.release()
+
+
+def trigger_profile(seconds=None, all_threads=False):
+    """供管理接口调用：开始采样并返回输出文件路径"""
+    profile = start_profile(seconds or PROFILE_SECONDS, all_threads=all_threads)
+    if profile is None:
+        return {'started': False, 'reason': '已有采样进行中'}
+    return {'started': True, 'pid': os.getpid(), 'seconds': profile.seconds,
+            'files': [profile.stack_path, profile.task_path]}
+
+
+def install_signal_handler(signum=None):
+    """收到 SIGUSR1（默认）时开始采样；只能在主线程调用，Windows 上没有 SIGUSR1 时忽略"""
+    import signal
+    signum = signum or getattr(signal, 'SIGUSR1', None)
+    if signum is None:
+        return False
+    signal.signal(signum, lambda *_: start_profile())
+    return True
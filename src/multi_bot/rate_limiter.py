@@ -0,0 +1,311 @@
+"""
+账户级 REST 请求预算
+
+同一 API Key 下所有机器人（所有 CustomBinance 实例）共享一个预算：
+- 按接口权重扣减 IP 权重令牌桶，按下单次数扣减 10 秒 / 1 分钟订单令牌桶
+- 读取响应头 X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-10S / X-MBX-ORDER-COUNT-1M 校准服务端真实用量
+- 撤单、只减仓单、紧急减仓优先；普通下单和查询其次；余额、交易规则等后台请求最后，
+  低优先级请求只能用到上限的一部分，为高优先级请求预留余量
+- 收到 418/429 时按 Retry-After 暂停所有请求
+"""
+
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+# 优先级（数值越小越优先）
+PRIORITY_CRITICAL = 0
+PRIORITY_NORMAL = 1
+PRIORITY_HOUSEKEEPING = 2
+
+# 各优先级可使用的额度比例
+PRIORITY_CEILING = {
+    PRIORITY_CRITICAL: 0.98,
+    PRIORITY_NORMAL: 0.85,
+    PRIORITY_HOUSEKEEPING: 0.6,
+}
+
+# 币安 U 本位合约默认限制
+DEFAULT_WEIGHT_LIMIT_1M = 2400
+DEFAULT_ORDER_LIMIT_10S = 300
+DEFAULT_ORDER_LIMIT_1M = 1200
+
+# (method, path) -> (IP 权重, 下单次数)
+ENDPOINT_WEIGHTS = {
+    ('GET', '/fapi/v1/openOrders'): (1, 0),
+    ('GET', '/fapi/v2/positionRisk'): (5, 0),
+    ('GET', '/fapi/v2/account'): (5, 0),
+    ('GET', '/fapi/v2/balance'): (5, 0),
+    ('GET', '/fapi/v1/exchangeInfo'): (1, 0),
+    ('GET', '/fapi/v1/ticker/24hr'): (1, 0),
+    ('GET', '/fapi/v1/ticker/bookTicker'): (2, 0),
+    ('GET', '/fapi/v1/positionSide/dual'): (30, 0),
+    ('POST', '/fapi/v1/positionSide/dual'): (1, 0),
+    ('POST', '/fapi/v1/listenKey'): (1, 0),
+    ('PUT', '/fapi/v1/listenKey'): (1, 0),
+    ('POST', '/fapi/v1/order'): (0, 1),
+    ('PUT', '/fapi/v1/order'): (1, 1),
+    ('DELETE', '/fapi/v1/order'): (1, 0),
+    ('POST', '/fapi/v1/batchOrders'): (5, 5),
+    ('DELETE', '/fapi/v1/batchOrders'): (1, 0),
+    ('DELETE', '/fapi/v1/allOpenOrders'): (1, 0),
+    ('GET', '/api/v3/exchangeInfo'): (20, 0),
+    ('GET', '/dapi/v1/exchangeInfo'): (1, 0),
+}
+
+# 不带 symbol 参数时权重更高的接口
+ENDPOINT_WEIGHTS_ALL_SYMBOLS = {
+    ('GET', '/fapi/v1/openOrders'): 40,
+    ('GET', '/fapi/v1/ticker/24hr'): 40,
+    ('GET', '/fapi/v1/ticker/bookTicker'): 5,
+}
+
+# 调用方显式指定的优先级（通过 contextvars 传递到线程池中的 REST 调用）
+_priority_override = contextvars.ContextVar('rate_limit_priority', default=None)
+
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """在上下文内把 REST 请求标记为指定优先级，例如紧急减仓时使用 PRIORITY_CRITICAL"""
+    token = _priority_override.set(priority)
+    try:
+        yield
+    finally:
+        _priority_override.reset(token)
+
+
+class TokenBucket:
+    """令牌桶：容量为 capacity，每秒补充 refill_rate 个令牌"""
+
+    def __init__(self, capacity, period):
+        self.capacity = float(capacity)
+        self.refill_rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    def wait_time(self, amount, ceiling, now):
+        """在只允许使用 ceiling 比例容量的前提下，取出 amount 个令牌还需等待的秒数"""
+        self._refill(now)
+        reserve = (1.0 - ceiling) * self.capacity
+        deficit = amount - (self.tokens - reserve)
+        if deficit <= 0:
+            return 0.0
+        return deficit / self.refill_rate
+
+    def take(self, amount):
+        self.tokens -= amount
+
+
+class RateLimitBudget:
+    """
+    账户级 REST 请求预算
+
+    acquire() 在发出请求前调用，预算不足时阻塞当前线程；update_from_headers() 在收到响应后调用。
+    share 为本进程可使用的额度比例（supervisor 模式下多个进程平分同一账户的额度）。
+    """
+
+    def __init__(self, weight_limit=DEFAULT_WEIGHT_LIMIT_1M, order_limit_10s=DEFAULT_ORDER_LIMIT_10S,
+                 order_limit_1m=DEFAULT_ORDER_LIMIT_1M, share=1.0):
+        self.share = max(0.01, min(1.0, float(share)))
+        self.weight_limit = weight_limit
+        self.order_limit_10s = order_limit_10s
+        self.order_limit_1m = order_limit_1m
+        self.weight_bucket = TokenBucket(weight_limit * self.share, 60)
+        self.order_bucket_10s = TokenBucket(order_limit_10s * self.share, 10)
+        self.order_bucket_1m = TokenBucket(order_limit_1m * self.share, 60)
+
+        # 服务端回报的用量（所有进程、所有机器人的真实合计）
+        self.used_weight_1m = 0
+        self.order_count_10s = 0
+        self.order_count_1m = 0
+        self._usage_minute = None
+        self._usage_10s = None
+        self.banned_until = 0.0
+
+        self.requests = 0
+        self.throttled = 0
+        # 按接口统计的请求耗时: {(method, path): [次数, 总耗时, 最大耗时, 失败次数]}
+        self.latency = {}
+        self._waiting = {priority: 0 for priority in PRIORITY_CEILING}
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def endpoint_cost(method, url):
+        """返回 (path, IP 权重, 下单次数)"""
+        parts = urlsplit(url)
+        path = parts.path
+        key = (method.upper(), path)
+        weight, orders = ENDPOINT_WEIGHTS.get(key, (1, 0))
+        if key in ENDPOINT_WEIGHTS_ALL_SYMBOLS and 'symbol' not in parse_qs(parts.query):
+            weight = ENDPOINT_WEIGHTS_ALL_SYMBOLS[key]
+        return path, weight, orders
+
+    @staticmethod
+    def classify(method, path, url, body):
+        """根据请求内容判断优先级：撤单和只减仓单（含双向持仓下的平仓单）最优先"""
+        override = _priority_override.get()
+        if override is not None:
+            return override
+        method = method.upper()
+        if method == 'DELETE' and path.endswith(('/order', '/batchOrders', '/allOpenOrders')):
+            return PRIORITY_CRITICAL
+        if path.endswith(('/order', '/batchOrders')) and method in ('POST', 'PUT'):
+            text = f"{urlsplit(url).query}&{body or ''}"
+            if 'reduceOnly=true' in text or 'closePosition=true' in text:
+                return PRIORITY_CRITICAL
+            if ('side=SELL' in text and 'positionSide=LONG' in text) or \
+                    ('side=BUY' in text and 'positionSide=SHORT' in text):
+                return PRIORITY_CRITICAL
+            return PRIORITY_NORMAL
+        if path.endswith(('/openOrders', '/positionRisk', '/ticker/24hr', '/ticker/bookTicker')):
+            return PRIORITY_NORMAL
+        return PRIORITY_HOUSEKEEPING
+
+    def _wait_time(self, weight, orders, priority, now, wall_now):
+        if wall_now < self.banned_until:
+            return self.banned_until - wall_now
+        # 有更高优先级的请求在排队时，低优先级请求让行
+        if any(self._waiting[p] for p in self._waiting if p < priority):
+            return 0.05
+
+        ceiling = PRIORITY_CEILING[priority]
+        minute = int(wall_now // 60)
+        if self._usage_minute == minute and self.used_weight_1m + weight > ceiling * self.weight_limit:
+            return (minute + 1) * 60 - wall_now
+        wait = self.weight_bucket.wait_time(weight, ceiling, now)
+        if orders:
+            window_10s = int(wall_now // 10)
+            if self._usage_10s == window_10s and self.order_count_10s + orders > ceiling * self.order_limit_10s:
+                wait = max(wait, (window_10s + 1) * 10 - wall_now)
+            if self._usage_minute == minute and self.order_count_1m + orders > ceiling * self.order_limit_1m:
+                wait = max(wait, (minute + 1) * 60 - wall_now)
+            wait = max(wait, self.order_bucket_10s.wait_time(orders, ceiling, now),
+                       self.order_bucket_1m.wait_time(orders, ceiling, now))
+        return wait
+
+    def acquire(self, method, url, body=None):
+        """发出请求前调用：预算不足时阻塞，直到可以发送"""
+        path, weight, orders = self.endpoint_cost(method, url)
+        priority = self.classify(method, path, url, body)
+        with self._cond:
+            waited = False
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    wait = self._wait_time(weight, orders, priority, time.monotonic(), time.time())
+                    if wait <= 0:
+                        break
+                    if not waited:
+                        waited = True
+                        self.throttled += 1
+                        if wait > 1:
+                            logger.warning(f"[限频] {method} {path} 需等待 {wait:.1f}s (优先级 {priority})")
+                    self._cond.wait(min(wait, 1.0))
+            finally:
+                self._waiting[priority] -= 1
+            self.weight_bucket.take(weight)
+            if orders:
+                self.order_bucket_10s.take(orders)
+                self.order_bucket_1m.take(orders)
+            self.requests += 1
+            # 预先计入本地估计，等响应头回来再校准
+            wall_now = time.time()
+            if self._usage_minute == int(wall_now // 60):
+                self.used_weight_1m += weight
+                self.order_count_1m += orders
+            if self._usage_10s == int(wall_now // 10):
+                self.order_count_10s += orders
+            self._cond.notify_all()
+
+    @staticmethod
+    def _header(headers, name):
+        if not headers:
+            return None
+        value = headers.get(name)
+        if value is None:
+            lower = name.lower()
+            for key, val in headers.items():
+                if key.lower() == lower:
+                    value = val
+                    break
+        return value
+
+    def update_from_headers(self, headers):
+        """收到响应后调用：用服务端回报的用量校准本地预算"""
+        if not headers:
+            return
+        wall_now = time.time()
+        with self._cond:
+            used = self._header(headers, 'X-MBX-USED-WEIGHT-1M')
+            if used is not None:
+                self.used_weight_1m = int(used)
+                self._usage_minute = int(wall_now // 60)
+                # 服务端用量高于本地估计时（如其他进程也在请求）收紧令牌桶
+                remaining = (self.weight_limit - self.used_weight_1m) * self.share
+                self.weight_bucket.tokens = min(self.weight_bucket.tokens, max(0.0, remaining))
+            count_1m = self._header(headers, 'X-MBX-ORDER-COUNT-1M')
+            if count_1m is not None:
+                self.order_count_1m = int(count_1m)
+            count_10s = self._header(headers, 'X-MBX-ORDER-COUNT-10S')
+            if count_10s is not None:
+                self.order_count_10s = int(count_10s)
+                self._usage_10s = int(wall_now // 10)
+            retry_after = self._header(headers, 'Retry-After')
+            if retry_after is not None:
+                self.banned_until = max(self.banned_until, wall_now + float(retry_after))
+                logger.error(f"[限频] 触发币安限频，暂停所有 REST 请求 {float(retry_after):.0f}s")
+            self._cond.notify_all()
+
+    def record_latency(self, method, url, seconds, error=False):
+        """记录一次 REST 请求的耗时"""
+        key = (method.upper(), urlsplit(url).path)
+        with self._cond:
+            stats = self.latency.get(key)
+            if stats is None:
+                stats = self.latency[key] = [0, 0.0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            if error:
+                stats[3] += 1
+
+    def latency_snapshot(self):
+        """按接口的请求耗时快照: {(method, path): (次数, 总耗时, 最大耗时, 失败次数)}"""
+        with self._cond:
+            return {key: tuple(stats) for key, stats in self.latency.items()}
+
+    def snapshot(self):
+        """当前用量快照"""
+        return {
+            'used_weight_1m': self.used_weight_1m,
+            'weight_limit_1m': self.weight_limit,
+            'order_count_10s': self.order_count_10s,
+            'order_count_1m': self.order_count_1m,
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'banned': time.time() < self.banned_until,
+        }
+
+
+_shared_budget = None
+_shared_budget_lock = threading.Lock()
+
+
+def get_shared_budget():
+    """进程内共享的请求预算，RATE_LIMIT_SHARE 环境变量为本进程可使用的额度比例"""
+    global _shared_budget
+    if _shared_budget is None:
+        with _shared_budget_lock:
+            if _shared_budget is None:
+                _shared_budget = RateLimitBudget(share=float(os.getenv("RATE_LIMIT_SHARE", "1.0")))
+    return _shared_budget
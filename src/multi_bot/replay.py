@@ -0,0 +1,232 @@
+"""
+流量日志回放
+
+把 traffic_journal 录制的推送按原始节奏（或尽可能快地）重新喂给 BinanceGridBot，
+REST 请求由 ReplayBinance 按录制的响应作答，不访问网络。
+回放结束后比较下单/撤单请求序列与录制时是否一致，并给出吞吐和各阶段耗时。
+"""
+
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from difflib import SequenceMatcher
+
+import ccxt
+
+from events import BookTicker, OrderUpdate, decode_event
+from binance_multi_bot import BinanceGridBot, CustomBinance
+from traffic_journal import KIND_META, KIND_REST, KIND_WS, read_journal, request_key, request_params
+
+logger = logging.getLogger(__name__)
+
+# 改变挂单的请求，回放时用于比较决策是否一致
+ORDER_PATHS = {'/fapi/v1/order', '/fapi/v1/batchOrders', '/fapi/v1/allOpenOrders'}
+
+
+def is_order_request(method, path):
+    return method.upper() in ('POST', 'DELETE', 'PUT') and path in ORDER_PATHS
+
+
+def load_journal(path):
+    """
+    Returns:
+        tuple: (合并后的 META, [(相对时间, 推送文本)], [REST 记录])
+    """
+    meta, frames, rest = {}, [], []
+    for kind, offset, payload in read_journal(path):
+        if kind == KIND_META:
+            meta.update(payload)
+        elif kind == KIND_WS:
+            frames.append((offset, payload))
+        elif kind == KIND_REST:
+            rest.append(payload)
+    return meta, frames, rest
+
+
+class ReplayHub:
+    """替代 MarketDataHub / UserDataHub：只记录订阅的回调，由回放驱动直接调用"""
+
+    def __init__(self):
+        self.callbacks = {}
+        self.reconnects = 0
+        self.connection_count = 0
+
+    def subscribe(self, stream, callback, loop=None):
+        self.callbacks[stream] = callback
+
+    def unsubscribe(self, stream):
+        self.callbacks.pop(stream, None)
+
+
+class ReplayBinance(CustomBinance):
+    """
+    按录制的响应回答 REST 请求的交易所
+
+    同一请求按录制顺序依次返回，用完后重复最后一个响应；
+    录制中没有的下单/撤单请求（回放决策与录制时不同）返回合成的回报，其余请求抛出 ExchangeError
+    """
+
+    def __init__(self, rest_records, config=None):
+        super().__init__(dict({
+            'apiKey': 'replay',
+            'secret': 'replay',
+            'options': {'defaultType': 'future'},
+        }, **(config or {})))
+        self._responses = defaultdict(deque)
+        self._last = {}
+        self._last_by_path = {}
+        for entry in rest_records:
+            key = request_key(entry['m'], entry['path'], entry['params'])
+            self._responses[key].append(entry)
+            self._last_by_path[(entry['m'], entry['path'])] = entry
+        self._order_ids = itertools.count(1)
+        self.order_requests = []
+        self.unmatched = 0
+
+    def fetch(self, url, method='GET', headers=None, body=None):
+        self.last_response_headers = {}
+        path, params = request_params(url, body)
+        key = request_key(method, path, params)
+        if is_order_request(method, path):
+            self.order_requests.append(key)
+
+        queue = self._responses.get(key)
+        if queue:
+            entry = self._last[key] = queue.popleft()
+        elif key in self._last:
+            entry = self._last[key]
+        else:
+            self.unmatched += 1
+            if is_order_request(method, path):
+                return self._synthesize(method.upper(), path, params)
+            entry = self._last_by_path.get((method.upper(), path))
+            if entry is None:
+                raise ccxt.ExchangeError(f"回放日志中没有该请求: {method} {path}")
+
+        if 'err' in entry:
+            name, message = entry['err']
+            error_class = getattr(ccxt, name, None)
+            if not (isinstance(error_class, type) and issubclass(error_class, Exception)):
+                error_class = ccxt.ExchangeError
+            raise error_class(message)
+        return entry['resp']
+
+    def _synthesize(self, method, path, params):
+        if path == '/fapi/v1/allOpenOrders':
+            return {'code': 200, 'msg': 'The operation of cancel all open order is done.'}
+        if method == 'DELETE':
+            if path == '/fapi/v1/batchOrders':
+                return [{'orderId': order_id, 'symbol': params.get('symbol'), 'status': 'CANCELED'}
+                        for order_id in json.loads(params.get('orderIdList', '[]'))]
+            return {'orderId': params.get('orderId'), 'clientOrderId': params.get('origClientOrderId'),
+                    'symbol': params.get('symbol'), 'status': 'CANCELED'}
+        if path == '/fapi/v1/batchOrders':
+            return [self._new_order(order) for order in json.loads(params.get('batchOrders', '[]'))]
+        return self._new_order(params)
+
+    def _new_order(self, params):
+        return {
+            'orderId': next(self._order_ids),
+            'clientOrderId': params.get('newClientOrderId'),
+            'symbol': params.get('symbol'),
+            'status': 'NEW',
+            'type': params.get('type'),
+            'side': params.get('side'),
+            'positionSide': params.get('positionSide', 'BOTH'),
+            'price': params.get('price', '0'),
+            'origQty': params.get('quantity', '0'),
+            'executedQty': '0',
+            'reduceOnly': str(params.get('reduceOnly', 'false')).lower() == 'true',
+            'timeInForce': params.get('timeInForce', 'GTC'),
+            'updateTime': int(time.time() * 1000),
+        }
+
+
+async def replay(path, speed=1.0, config_overrides=None):
+    """
+    回放一个流量日志
+
+    Args:
+        path: 流量日志路径
+        speed: 回放倍速，1 为按录制节奏，0 为尽可能快
+        config_overrides: 覆盖录制时的机器人配置（如 tick_interval_ms）
+
+    Returns:
+        dict: 推送数、耗时、吞吐、决策次数、下单请求比较结果和各阶段耗时
+    """
+    meta, frames, rest = load_journal(path)
+    if not meta:
+        raise ValueError(f"流量日志缺少元数据: {path}")
+    loop = asyncio.get_running_loop()
+
+    exchange = ReplayBinance(rest)
+    if meta.get('market'):
+        # 录制时写入的市场信息（市场信息来自共享缓存，不一定有 exchangeInfo 请求记录）
+        exchange.set_markets([meta['market']])
+    else:
+        await loop.run_in_executor(None, exchange.load_markets)
+    market_hub, user_hub = ReplayHub(), ReplayHub()
+    config = dict(meta.get('config') or {}, **(config_overrides or {}))
+    bot = await loop.run_in_executor(None, functools.partial(
+        BinanceGridBot, symbol=meta['symbol'], api_key='replay', api_secret='replay', config=config,
+        market_hub=market_hub, user_hub=user_hub, exchange=exchange))
+
+    task = asyncio.create_task(bot.start(), name=f"replay-{meta['symbol']}")
+    while not bot.running:
+        if task.done():
+            task.result()
+            raise RuntimeError("机器人启动失败")
+        await asyncio.sleep(0.05)
+    on_ticker = market_hub.callbacks.get(bot._book_ticker_stream(), bot._handle_ticker_update)
+    on_order = user_hub.callbacks.get(bot.exchange_symbol, bot._enqueue_order_update)
+
+    started = time.monotonic()
+    first_offset = frames[0][0] if frames else 0.0
+    for offset, text in frames:
+        if speed > 0:
+            delay = (offset - first_offset) / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        event = decode_event(text)
+        if isinstance(event, BookTicker):
+            await on_ticker(event)
+        elif isinstance(event, OrderUpdate):
+            await on_order(event)
+        if speed <= 0:
+            # 让出事件循环，决策任务和订单任务才有机会运行
+            await asyncio.sleep(0)
+    elapsed = time.monotonic() - started
+
+    # 等最后一轮决策完成
+    await asyncio.sleep(bot.tick_interval_ms / 1000 * 2)
+    bot.running = False
+    bot.stop()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    recorded = [request_key(entry['m'], entry['path'], entry['params'])
+                for entry in rest if is_order_request(entry['m'], entry['path'])]
+    replayed = exchange.order_requests
+    matcher = SequenceMatcher(a=recorded, b=replayed, autojunk=False)
+    first_diff = next((op for op in matcher.get_opcodes() if op[0] != 'equal'), None)
+    return {
+        'symbol': meta['symbol'],
+        'frames': len(frames),
+        'elapsed': elapsed,
+        'frames_per_second': len(frames) / elapsed if elapsed > 0 else 0.0,
+        'decisions': bot._decision_count,
+        'recorded_orders': len(recorded),
+        'replayed_orders': len(replayed),
+        'orders_identical': recorded == replayed,
+        'order_similarity': matcher.ratio(),
+        'first_difference': None if first_diff is None else {
+            'recorded': recorded[first_diff[1]:first_diff[2]][:3],
+            'replayed': replayed[first_diff[3]:first_diff[4]][:3],
+        },
+        'unmatched_requests': exchange.unmatched,
+        'latency': bot.tracer.summary(),
+    }
@@ -0,0 +1,597 @@
+"""
+模拟撮合引擎
+
+按币安 U 本位合约（双向持仓）的规则维护模拟账户的挂单、持仓和余额：
+- 限价单在对手价穿过挂单价时按挂单价成交（maker），partial_fill_ratio < 1 时每次报价只成交一部分；
+  下单时已可成交的按对手价成交（taker），GTX 直接拒绝
+- 市价单按当前对手价立即成交
+- 平仓方向（LONG 的 SELL、SHORT 的 BUY）成交数量不超过持仓，持仓为 0 时订单过期
+订单状态变化以 ORDER_TRADE_UPDATE 推送（与币安格式一致）通知监听者。
+SimFuturesApi 把 fapi REST 请求映射到撮合引擎，供本地交易所模拟器（exchange_sim.py）和纸面交易模式（paper.py）共用。
+"""
+
+import itertools
+import json
+import math
+import random
+import threading
+import time
+
+from traffic_journal import KIND_WS, read_journal
+import fastjson
+
+# 币安错误码（ccxt 按错误码映射异常类型）
+ERR_UNKNOWN_ORDER = -2011
+ERR_NO_SUCH_ORDER = -2013
+ERR_REDUCE_ONLY_REJECTED = -2022
+ERR_POST_ONLY_REJECTED = -5022
+ERR_MIN_NOTIONAL = -4164
+ERR_INVALID_SYMBOL = -1121
+ERR_NO_QUOTE = -1001
+ERR_BAD_PARAMETER = -1102
+ERR_UNKNOWN_PATH = -1000
+
+
+class SimError(Exception):
+    """模拟交易所拒绝请求，code/msg 与币安一致"""
+
+    def __init__(self, code, msg):
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def format_decimal(value):
+    return format(value, '.8f').rstrip('0').rstrip('.') or '0'
+
+
+class SimOrder:
+    """模拟订单"""
+
+    __slots__ = ('order_id', 'client_order_id', 'symbol', 'side', 'position_side', 'type', 'time_in_force',
+                 'price', 'quantity', 'filled', 'avg_price', 'status', 'reduce_only', 'created', 'updated')
+
+    def __init__(self, order_id, client_order_id, symbol, side, position_side, order_type, time_in_force,
+                 price, quantity, reduce_only):
+        self.order_id = order_id
+        self.client_order_id = client_order_id
+        self.symbol = symbol
+        self.side = side
+        self.position_side = position_side
+        self.type = order_type
+        self.time_in_force = time_in_force
+        self.price = price
+        self.quantity = quantity
+        self.filled = 0.0
+        self.avg_price = 0.0
+        self.status = 'NEW'
+        self.reduce_only = reduce_only
+        self.created = self.updated = _now_ms()
+
+    @property
+    def is_open(self):
+        return self.status in ('NEW', 'PARTIALLY_FILLED')
+
+    @property
+    def closes_position(self):
+        return (self.position_side == 'LONG' and self.side == 'SELL') or \
+               (self.position_side == 'SHORT' and self.side == 'BUY')
+
+    def to_rest(self):
+        """REST 接口（下单、查单、挂单列表）返回的订单格式"""
+        return {
+            'orderId': self.order_id,
+            'symbol': self.symbol,
+            'status': self.status,
+            'clientOrderId': self.client_order_id,
+            'price': format_decimal(self.price),
+            'avgPrice': format_decimal(self.avg_price),
+            'origQty': format_decimal(self.quantity),
+            'executedQty': format_decimal(self.filled),
+            'cumQuote': format_decimal(self.filled * self.avg_price),
+            'timeInForce': self.time_in_force,
+            'type': self.type,
+            'origType': self.type,
+            'reduceOnly': self.reduce_only,
+            'closePosition': False,
+            'side': self.side,
+            'positionSide': self.position_side,
+            'stopPrice': '0',
+            'workingType': 'CONTRACT_PRICE',
+            'priceProtect': False,
+            'time': self.created,
+            'updateTime': self.updated,
+        }
+
+    def to_event(self, execution_type, last_qty=0.0, last_price=0.0, realized=0.0, commission=0.0):
+        """ORDER_TRADE_UPDATE 推送"""
+        now = _now_ms()
+        return {
+            'e': 'ORDER_TRADE_UPDATE',
+            'E': now,
+            'T': now,
+            'o': {
+                's': self.symbol, 'c': self.client_order_id, 'S': self.side, 'o': self.type,
+                'f': self.time_in_force, 'q': format_decimal(self.quantity), 'p': format_decimal(self.price),
+                'ap': format_decimal(self.avg_price), 'sp': '0', 'x': execution_type, 'X': self.status,
+                'i': self.order_id, 'l': format_decimal(last_qty), 'z': format_decimal(self.filled), 'L': format_decimal(last_price),
+                'n': format_decimal(commission), 'N': 'USDT', 'T': now, 't': 0, 'b': '0', 'a': '0',
+                'm': execution_type == 'TRADE' and self.type == 'LIMIT', 'R': self.reduce_only,
+                'wt': 'CONTRACT_PRICE', 'ot': self.type, 'ps': self.position_side, 'cp': False,
+                'rp': format_decimal(realized), 'pP': False, 'si': 0, 'ss': 0,
+            },
+        }
+
+
+class MatchingEngine:
+    """
+    模拟账户与撮合（线程安全）
+
+    Args:
+        symbols: {交易对: {'tick_size', 'step_size', 'min_qty', 'min_notional'}}
+        balance: 初始 USDT 余额
+        fee_rate: 手续费率（maker/taker 相同）
+        partial_fill_ratio: 挂单被穿价时每次报价成交的比例（按原始数量计，向上取整到数量步长），1 为一次全部成交
+    """
+
+    def __init__(self, symbols, balance=10000.0, fee_rate=0.0002, partial_fill_ratio=1.0):
+        self.symbols = dict(symbols)
+        self.partial_fill_ratio = min(1.0, max(0.0, float(partial_fill_ratio))) or 1.0
+        self.quotes = {}
+        self.orders = {}
+        self.open_orders = {symbol: {} for symbol in self.symbols}
+        self.positions = {}
+        self.wallet = float(balance)
+        self.fee_rate = fee_rate
+        self.listeners = []
+        self.trades = 0
+        self._client_ids = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def add_listener(self, callback):
+        """callback(event) 在持有引擎锁时调用，不能阻塞"""
+        self.listeners.append(callback)
+
+    def _emit(self, event):
+        for callback in self.listeners:
+            callback(event)
+
+    def _check_symbol(self, symbol):
+        if symbol not in self.symbols:
+            raise SimError(ERR_INVALID_SYMBOL, 'Invalid symbol.')
+
+    # ===== 持仓 =====
+    def position(self, symbol, position_side):
+        """返回 [数量, 开仓均价]"""
+        return self.positions.setdefault((symbol, position_side), [0.0, 0.0])
+
+    def unrealized_pnl(self, symbol, position_side):
+        quantity, entry = self.position(symbol, position_side)
+        quote = self.quotes.get(symbol)
+        if not quantity or quote is None:
+            return 0.0
+        mark = (quote[0] + quote[1]) / 2
+        return (mark - entry) * quantity if position_side == 'LONG' else (entry - mark) * quantity
+
+    def _apply_fill(self, order, quantity, price, execution_type='TRADE'):
+        position = self.position(order.symbol, order.position_side)
+        realized = 0.0
+        if order.closes_position:
+            quantity = min(quantity, position[0])
+            if order.position_side == 'LONG':
+                realized = (price - position[1]) * quantity
+            else:
+                realized = (position[1] - price) * quantity
+            position[0] -= quantity
+            if position[0] <= 1e-12:
+                position[0], position[1] = 0.0, 0.0
+        else:
+            total = position[0] + quantity
+            position[1] = (position[0] * position[1] + quantity * price) / total
+            position[0] = total
+        commission = quantity * price * self.fee_rate
+        self.wallet += realized - commission
+        order.avg_price = (order.avg_price * order.filled + price * quantity) / (order.filled + quantity)
+        order.filled += quantity
+        order.status = 'FILLED' if order.filled >= order.quantity - 1e-12 else 'PARTIALLY_FILLED'
+        order.updated = _now_ms()
+        self.trades += 1
+        if not order.is_open:
+            self.open_orders[order.symbol].pop(order.order_id, None)
+        self._emit(order.to_event(execution_type, quantity, price, realized, commission))
+
+    def _close(self, order, status, execution_type):
+        order.status = status
+        order.updated = _now_ms()
+        self.open_orders[order.symbol].pop(order.order_id, None)
+        self._emit(order.to_event(execution_type))
+
+    # ===== 行情 =====
+    def update_quote(self, symbol, bid, ask):
+        """更新最优买卖价并撮合该交易对的挂单"""
+        with self._lock:
+            self.quotes[symbol] = (bid, ask)
+            for order in list(self.open_orders.get(symbol, {}).values()):
+                if order.side == 'BUY' and ask <= order.price:
+                    self._fill_resting(order)
+                elif order.side == 'SELL' and bid >= order.price:
+                    self._fill_resting(order)
+
+    def _fill_resting(self, order):
+        remaining = order.quantity - order.filled
+        if order.closes_position and self.position(order.symbol, order.position_side)[0] <= 0:
+            self._close(order, 'EXPIRED', 'EXPIRED')
+            return
+        quantity = remaining
+        if self.partial_fill_ratio < 1.0:
+            step = self.symbols[order.symbol].get('step_size') or 0
+            chunk = order.quantity * self.partial_fill_ratio
+            if step:
+                chunk = math.ceil(chunk / step - 1e-9) * step
+            quantity = min(remaining, chunk)
+        self._apply_fill(order, quantity, order.price)
+
+    # ===== 下单/撤单 =====
+    def place_order(self, symbol, side, position_side, order_type, quantity, price=None, reduce_only=False,
+                    client_order_id=None, time_in_force='GTC'):
+        """下单，返回 SimOrder；不满足规则时抛出 SimError"""
+        with self._lock:
+            self._check_symbol(symbol)
+            side = side.upper()
+            order_type = order_type.upper()
+            position_side = (position_side or 'BOTH').upper()
+            quantity = float(quantity)
+            quote = self.quotes.get(symbol)
+            if quote is None:
+                raise SimError(ERR_NO_QUOTE, 'No market price for symbol.')
+            reference = float(price) if price is not None else (quote[1] if side == 'BUY' else quote[0])
+            spec = self.symbols[symbol]
+            if quantity < spec.get('min_qty', 0) or quantity * reference < spec.get('min_notional', 0):
+                raise SimError(ERR_MIN_NOTIONAL, "Order's notional must be no smaller than the minimum.")
+
+            client_order_id = client_order_id or f"sim_{next(self._ids)}"
+            if (symbol, client_order_id) in self._client_ids:
+                raise SimError(-4015, 'Client order id is not valid.')
+            order = SimOrder(next(self._ids), client_order_id, symbol, side, position_side, order_type,
+                             time_in_force if order_type == 'LIMIT' else 'GTC',
+                             reference if order_type == 'LIMIT' else 0.0, quantity, bool(reduce_only))
+
+            if order.closes_position or order.reduce_only:
+                if self.position(symbol, position_side)[0] <= 0:
+                    raise SimError(ERR_REDUCE_ONLY_REJECTED, 'ReduceOnly Order is rejected.')
+
+            marketable = (side == 'BUY' and quote[1] <= reference) or (side == 'SELL' and quote[0] >= reference)
+            if order_type == 'LIMIT' and marketable and time_in_force == 'GTX':
+                raise SimError(ERR_POST_ONLY_REJECTED, 'Due to the order could not be executed as maker, '
+                                                       'the Post Only order will be rejected.')
+
+            self.orders[order.order_id] = order
+            self._client_ids[(symbol, client_order_id)] = order
+            self.open_orders[symbol][order.order_id] = order
+            self._emit(order.to_event('NEW'))
+
+            if order_type == 'MARKET' or marketable:
+                # 可立即成交的部分按对手价成交
+                self._apply_fill(order, quantity, quote[1] if side == 'BUY' else quote[0])
+            return order
+
+    def get_order(self, symbol, order_id=None, client_order_id=None):
+        with self._lock:
+            order = None
+            if order_id is not None:
+                order = self.orders.get(int(order_id))
+            elif client_order_id is not None:
+                order = self._client_ids.get((symbol, client_order_id))
+            if order is None or order.symbol != symbol:
+                raise SimError(ERR_NO_SUCH_ORDER, 'Order does not exist.')
+            return order
+
+    def cancel_order(self, symbol, order_id=None, client_order_id=None):
+        with self._lock:
+            try:
+                order = self.get_order(symbol, order_id, client_order_id)
+            except SimError:
+                raise SimError(ERR_UNKNOWN_ORDER, 'Unknown order sent.')
+            if not order.is_open:
+                raise SimError(ERR_UNKNOWN_ORDER, 'Unknown order sent.')
+            self._close(order, 'CANCELED', 'CANCELED')
+            return order
+
+    def cancel_all(self, symbol):
+        with self._lock:
+            self._check_symbol(symbol)
+            for order in list(self.open_orders[symbol].values()):
+                self._close(order, 'CANCELED', 'CANCELED')
+
+    def list_open_orders(self, symbol=None):
+        with self._lock:
+            symbols = [symbol] if symbol else list(self.open_orders)
+            return [order for s in symbols for order in self.open_orders.get(s, {}).values()]
+
+
+def _precision(step):
+    return max(0, -int(math.floor(math.log10(step) + 1e-9)))
+
+
+class SimFuturesApi:
+    """
+    币安 U 本位合约 REST 接口的同步实现：按 (方法, 路径) 分发到撮合引擎，
+    返回与币安一致的 JSON 结构（数值为字符串），请求被拒绝时抛出 SimError。不校验签名。
+    """
+
+    def __init__(self, engine, leverage=20):
+        self.engine = engine
+        self.leverage = leverage
+        self.listen_keys = set()
+        self.requests = 0
+        self.routes = {
+            ('GET', '/fapi/v1/ping'): self.server_time,
+            ('GET', '/fapi/v1/time'): self.server_time,
+            ('GET', '/fapi/v1/exchangeInfo'): self.exchange_info,
+            ('GET', '/fapi/v1/leverageBracket'): self.leverage_bracket,
+            ('GET', '/fapi/v2/positionRisk'): self.position_risk,
+            ('GET', '/fapi/v2/account'): self.account,
+            ('GET', '/fapi/v2/balance'): self.balance,
+            ('GET', '/fapi/v1/ticker/24hr'): self.ticker,
+            ('GET', '/fapi/v1/ticker/bookTicker'): self.ticker,
+            ('GET', '/fapi/v1/positionSide/dual'): self.get_position_mode,
+            ('POST', '/fapi/v1/positionSide/dual'): self.ok,
+            ('POST', '/fapi/v1/leverage'): self.set_leverage,
+            ('POST', '/fapi/v1/marginType'): self.ok,
+            ('POST', '/fapi/v1/listenKey'): self.new_listen_key,
+            ('PUT', '/fapi/v1/listenKey'): self.empty,
+            ('DELETE', '/fapi/v1/listenKey'): self.empty,
+            ('POST', '/fapi/v1/order'): self.new_order,
+            ('GET', '/fapi/v1/order'): self.query_order,
+            ('DELETE', '/fapi/v1/order'): self.cancel_order,
+            ('POST', '/fapi/v1/batchOrders'): self.new_batch_orders,
+            ('DELETE', '/fapi/v1/batchOrders'): self.cancel_batch_orders,
+            ('GET', '/fapi/v1/openOrders'): self.open_orders,
+            ('DELETE', '/fapi/v1/allOpenOrders'): self.cancel_all_orders,
+        }
+
+    def supports(self, method, path):
+        return (method.upper(), path) in self.routes
+
+    def handle(self, method, path, params):
+        """处理一个请求，params 为查询串和表单合并后的参数（值为字符串）"""
+        handler = self.routes.get((method.upper(), path))
+        if handler is None:
+            raise SimError(ERR_UNKNOWN_PATH, f'{method.upper()} {path} is not supported.')
+        self.requests += 1
+        try:
+            return handler(params)
+        except (KeyError, ValueError) as e:
+            raise SimError(ERR_BAD_PARAMETER, f'Mandatory parameter missing or malformed: {e}')
+
+    # ===== 公共接口 =====
+    def server_time(self, params):
+        return {'serverTime': _now_ms()}
+
+    def exchange_info(self, params):
+        symbols = []
+        for symbol, spec in self.engine.symbols.items():
+            tick, step = format_decimal(spec['tick_size']), format_decimal(spec['step_size'])
+            symbols.append({
+                'symbol': symbol, 'pair': symbol, 'contractType': 'PERPETUAL', 'deliveryDate': 4133404800000,
+                'onboardDate': 1569398400000, 'status': 'TRADING', 'maintMarginPercent': '2.5000',
+                'requiredMarginPercent': '5.0000', 'baseAsset': symbol[:-4], 'quoteAsset': 'USDT',
+                'marginAsset': 'USDT', 'pricePrecision': _precision(spec['tick_size']),
+                'quantityPrecision': _precision(spec['step_size']), 'baseAssetPrecision': 8, 'quotePrecision': 8,
+                'underlyingType': 'COIN', 'underlyingSubType': [], 'settlePlan': 0, 'triggerProtect': '0.0500',
+                'liquidationFee': '0.012500', 'marketTakeBound': '0.05', 'maxMoveOrderLimit': 10000,
+                'filters': [
+                    {'filterType': 'PRICE_FILTER', 'minPrice': tick, 'maxPrice': '10000000', 'tickSize': tick},
+                    {'filterType': 'LOT_SIZE', 'stepSize': step, 'maxQty': '1000000',
+                     'minQty': format_decimal(spec['min_qty'])},
+                    {'filterType': 'MARKET_LOT_SIZE', 'stepSize': step, 'maxQty': '1000000',
+                     'minQty': format_decimal(spec['min_qty'])},
+                    {'filterType': 'MAX_NUM_ORDERS', 'limit': 200},
+                    {'filterType': 'MAX_NUM_ALGO_ORDERS', 'limit': 10},
+                    {'filterType': 'MIN_NOTIONAL', 'notional': format_decimal(spec['min_notional'])},
+                    {'filterType': 'PERCENT_PRICE', 'multiplierUp': '1.0500', 'multiplierDown': '0.9500',
+                     'multiplierDecimal': '4'},
+                ],
+                'orderTypes': ['LIMIT', 'MARKET', 'STOP', 'STOP_MARKET', 'TAKE_PROFIT', 'TAKE_PROFIT_MARKET',
+                               'TRAILING_STOP_MARKET'],
+                'timeInForce': ['GTC', 'IOC', 'FOK', 'GTX'],
+            })
+        return {
+            'timezone': 'UTC', 'serverTime': _now_ms(), 'futuresType': 'U_MARGINED',
+            'rateLimits': [], 'exchangeFilters': [],
+            'assets': [{'asset': 'USDT', 'marginAvailable': True, 'autoAssetExchange': '-10000'}],
+            'symbols': symbols,
+        }
+
+    def ticker(self, params):
+        symbol = params.get('symbol')
+        tickers = []
+        for name in ([symbol] if symbol else list(self.engine.symbols)):
+            self.engine._check_symbol(name)
+            bid, ask = self.engine.quotes.get(name, (0.0, 0.0))
+            last = (bid + ask) / 2
+            now = _now_ms()
+            tickers.append({
+                'symbol': name, 'priceChange': '0', 'priceChangePercent': '0', 'weightedAvgPrice': format_decimal(last),
+                'lastPrice': format_decimal(last), 'lastQty': '0', 'openPrice': format_decimal(last), 'highPrice': format_decimal(last),
+                'lowPrice': format_decimal(last), 'volume': '0', 'quoteVolume': '0', 'openTime': now - 86400000,
+                'closeTime': now, 'firstId': 0, 'lastId': 0, 'count': 0,
+                'bidPrice': format_decimal(bid), 'bidQty': '10', 'askPrice': format_decimal(ask), 'askQty': '10', 'time': now,
+            })
+        return tickers[0] if symbol else tickers
+
+    # ===== 账户 =====
+    def leverage_bracket(self, params):
+        symbol = params.get('symbol')
+        return [
+            {'symbol': name, 'brackets': [{'bracket': 1, 'initialLeverage': 125, 'notionalCap': 50000000,
+                                           'notionalFloor': 0, 'maintMarginRatio': 0.004, 'cum': 0.0}]}
+            for name in ([symbol] if symbol else self.engine.symbols)
+        ]
+
+    def _position_entries(self, symbol=None):
+        entries = []
+        for name in ([symbol] if symbol else self.engine.symbols):
+            bid, ask = self.engine.quotes.get(name, (0.0, 0.0))
+            mark = (bid + ask) / 2
+            for position_side in ('LONG', 'SHORT'):
+                quantity, entry = self.engine.position(name, position_side)
+                amount = quantity if position_side == 'LONG' else -quantity
+                entries.append({
+                    'symbol': name, 'positionAmt': format_decimal(amount), 'entryPrice': format_decimal(entry),
+                    'breakEvenPrice': format_decimal(entry), 'markPrice': format_decimal(mark),
+                    'unRealizedProfit': format_decimal(self.engine.unrealized_pnl(name, position_side)),
+                    'liquidationPrice': '0', 'leverage': str(self.leverage), 'maxNotionalValue': '50000000',
+                    'marginType': 'cross', 'isolatedMargin': '0', 'isAutoAddMargin': 'false',
+                    'positionSide': position_side, 'notional': format_decimal(amount * mark), 'isolatedWallet': '0',
+                    'updateTime': _now_ms(),
+                })
+        return entries
+
+    def position_risk(self, params):
+        with self.engine._lock:
+            return self._position_entries(params.get('symbol'))
+
+    def account(self, params):
+        with self.engine._lock:
+            unrealized = sum(self.engine.unrealized_pnl(symbol, side)
+                             for symbol in self.engine.symbols for side in ('LONG', 'SHORT'))
+            wallet = self.engine.wallet
+            positions = [dict(entry, initialMargin='0', maintMargin='0', positionInitialMargin='0',
+                              openOrderInitialMargin='0', isolated=False, maxNotional='50000000',
+                              unrealizedProfit=entry['unRealizedProfit'])
+                         for entry in self._position_entries()]
+        asset = {
+            'asset': 'USDT', 'walletBalance': format_decimal(wallet), 'unrealizedProfit': format_decimal(unrealized),
+            'marginBalance': format_decimal(wallet + unrealized), 'maintMargin': '0', 'initialMargin': '0',
+            'positionInitialMargin': '0', 'openOrderInitialMargin': '0', 'crossWalletBalance': format_decimal(wallet),
+            'crossUnPnl': format_decimal(unrealized), 'availableBalance': format_decimal(wallet + unrealized),
+            'maxWithdrawAmount': format_decimal(wallet), 'marginAvailable': True, 'updateTime': _now_ms(),
+        }
+        return {
+            'feeTier': 0, 'canTrade': True, 'canDeposit': True, 'canWithdraw': True, 'updateTime': 0,
+            'totalWalletBalance': format_decimal(wallet), 'totalUnrealizedProfit': format_decimal(unrealized),
+            'totalMarginBalance': format_decimal(wallet + unrealized), 'availableBalance': format_decimal(wallet + unrealized),
+            'maxWithdrawAmount': format_decimal(wallet), 'assets': [asset], 'positions': positions,
+        }
+
+    def balance(self, params):
+        wallet = format_decimal(self.engine.wallet)
+        return [{'accountAlias': 'sim', 'asset': 'USDT', 'balance': wallet, 'crossWalletBalance': wallet,
+                 'crossUnPnl': '0', 'availableBalance': wallet, 'maxWithdrawAmount': wallet,
+                 'marginAvailable': True, 'updateTime': _now_ms()}]
+
+    def get_position_mode(self, params):
+        return {'dualSidePosition': True}
+
+    def set_leverage(self, params):
+        return {'leverage': int(params.get('leverage', self.leverage)), 'maxNotionalValue': '50000000',
+                'symbol': params.get('symbol')}
+
+    def ok(self, params):
+        return {'code': 200, 'msg': 'success'}
+
+    def empty(self, params):
+        return {}
+
+    def new_listen_key(self, params):
+        listen_key = f"sim{random.getrandbits(128):032x}"
+        self.listen_keys.add(listen_key)
+        return {'listenKey': listen_key}
+
+    # ===== 订单 =====
+    def _place(self, params):
+        order = self.engine.place_order(
+            params['symbol'], params['side'], params.get('positionSide'), params['type'], params['quantity'],
+            params.get('price'), str(params.get('reduceOnly', 'false')).lower() == 'true',
+            params.get('newClientOrderId'), params.get('timeInForce', 'GTC'))
+        return order.to_rest()
+
+    def new_order(self, params):
+        return self._place(params)
+
+    def query_order(self, params):
+        return self.engine.get_order(params['symbol'], params.get('orderId'),
+                                     params.get('origClientOrderId')).to_rest()
+
+    def cancel_order(self, params):
+        return self.engine.cancel_order(params['symbol'], params.get('orderId'),
+                                        params.get('origClientOrderId')).to_rest()
+
+    def new_batch_orders(self, params):
+        results = []
+        for order in json.loads(params['batchOrders']):
+            try:
+                results.append(self._place(order))
+            except SimError as e:
+                results.append({'code': e.code, 'msg': e.msg})
+        return results
+
+    def cancel_batch_orders(self, params):
+        results = []
+        for order_id in json.loads(params.get('orderIdList', '[]')):
+            try:
+                results.append(self.engine.cancel_order(params['symbol'], order_id).to_rest())
+            except SimError as e:
+                results.append({'code': e.code, 'msg': e.msg})
+        return results
+
+    def open_orders(self, params):
+        return [order.to_rest() for order in self.engine.list_open_orders(params.get('symbol'))]
+
+    def cancel_all_orders(self, params):
+        self.engine.cancel_all(params['symbol'])
+        return {'code': 200, 'msg': 'The operation of cancel all open order is done.'}
+
+
+class GbmPricePath:
+    """几何布朗运动价格路径（可复现的合成行情）"""
+
+    def __init__(self, start_price, volatility=0.8, step_seconds=0.25, spread_bp=1.0, tick_size=None, seed=None):
+        """
+        Args:
+            volatility: 年化波动率
+            spread_bp: 买卖价差（基点）
+        """
+        self.price = float(start_price)
+        self.sigma = volatility * (step_seconds / (365 * 24 * 3600)) ** 0.5
+        self.half_spread = spread_bp / 20000
+        self.tick_size = tick_size
+        self.random = random.Random(seed)
+
+    def _round(self, value):
+        if not self.tick_size:
+            return value
+        return round(round(value / self.tick_size) * self.tick_size, 10)
+
+    def next_quote(self):
+        self.price *= 1.0 + self.random.gauss(0.0, self.sigma)
+        bid = self._round(self.price * (1 - self.half_spread))
+        ask = max(self._round(self.price * (1 + self.half_spread)), bid + (self.tick_size or 0))
+        return bid, ask
+
+
+class JournalPricePath:
+    """从 traffic_journal 录制的 bookTicker 推送中取出某个交易对的报价序列（循环使用）"""
+
+    def __init__(self, path, symbol):
+        self.quotes = []
+        for kind, _, payload in read_journal(path):
+            if kind != KIND_WS:
+                continue
+            data = fastjson.loads(payload)
+            if data.get('e') == 'bookTicker' and data.get('s') == symbol:
+                self.quotes.append((float(data['b']), float(data['a'])))
+        if not self.quotes:
+            raise ValueError(f"{path} 中没有 {symbol} 的 bookTicker")
+        self._index = 0
+
+    def next_quote(self):
+        quote = self.quotes[self._index % len(self.quotes)]
+        self._index += 1
+        return quote
@@ -0,0 +1,455 @@
+"""
+共享 WebSocket 数据中心
+
+多币种模式下所有机器人共用少量 WebSocket 连接：
+- MarketDataHub: 组合流（combined stream）订阅所有币种的 bookTicker，按 stream 名称分发给各机器人
+- UserDataHub: 整个账户只维护一个 listenKey 和一条用户数据流，按 symbol 把订单推送分发给对应机器人
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+
+import websockets
+
+from events import OrderUpdate, decode_event, decode_stream_event
+
+logger = logging.getLogger(__name__)
+
+# 设置 EXCHANGE_SIM_URL 时连接本地交易所模拟器
+_EXCHANGE_SIM_URL = os.getenv("EXCHANGE_SIM_URL", "").rstrip("/")
+_WS_BASE = _EXCHANGE_SIM_URL.replace('http', 'ws', 1) if _EXCHANGE_SIM_URL else "wss://fstream.binance.com"
+# 组合流地址，推送格式为 {"stream": "<name>", "data": {...}}
+COMBINED_STREAM_URL = f"{_WS_BASE}/stream"
+# 用户数据流地址，连接 {USER_STREAM_URL}/{listenKey}
+USER_STREAM_URL = f"{_WS_BASE}/ws"
+# 币安单连接最多订阅 200 个 stream
+MAX_STREAMS_PER_CONNECTION = 200
+# 单条 SUBSCRIBE 请求携带的 stream 数量（币安限制每秒最多 10 条入站消息）
+SUBSCRIBE_CHUNK_SIZE = 50
+# listenKey 有效期 60 分钟，每 30 分钟延长一次
+LISTEN_KEY_KEEPALIVE_INTERVAL = 1800
+RECONNECT_DELAY = 5
+
+
+class _StreamHub:
+    """数据中心公共部分：独立事件循环运行、订阅者登记与跨线程分发"""
+
+    name = "数据中心"
+    thread_name = "stream-hub"
+
+    def __init__(self):
+        self.loop = None
+        self.running = False
+        self.reconnects = 0
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._stopped = None
+        self._started = threading.Event()
+
+    def _call_in_hub_loop(self, fn, *args):
+        if self.loop is None:
+            # 数据中心尚未运行：直接登记，启动后统一处理
+            fn(*args)
+            return
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def _deliver(self, key, callback, loop, data):
+        """把消息投递到订阅者事件循环，返回协程回调对应的 future（普通函数返回 None）"""
+        if not asyncio.iscoroutinefunction(callback):
+            if loop is self.loop:
+                callback(data)
+            else:
+                loop.call_soon_threadsafe(callback, data)
+            return None
+
+        if loop is self.loop:
+            future = loop.create_task(callback(data))
+        else:
+            future = asyncio.run_coroutine_threadsafe(callback(data), loop)
+        future.add_done_callback(lambda f, k=key: self._log_callback_error(k, f))
+        return future
+
+    def _log_callback_error(self, key, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.error(f"[{self.name}] {key} 处理失败: {error}")
+
+    async def _on_start(self):
+        """run() 开始时调用，子类在此创建连接任务"""
+
+    async def _on_stop(self):
+        """run() 结束时调用，子类在此取消连接任务"""
+
+    async def run(self):
+        """在当前事件循环中运行数据中心，直到 stop() 被调用"""
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self.running = True
+        await self._on_start()
+        self._started.set()
+        try:
+            await self._stopped.wait()
+        finally:
+            self.running = False
+            await self._on_stop()
+            logger.info(f"[{self.name}] 已停止")
+
+    def start_in_thread(self):
+        """在独立线程和事件循环中运行数据中心，返回线程对象"""
+        def _runner():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.run())
+            finally:
+                loop.close()
+
+        thread = threading.Thread(target=_runner, name=self.thread_name, daemon=True)
+        thread.start()
+        self._started.wait(timeout=5)
+        return thread
+
+    def stop(self):
+        """停止数据中心（可在任意线程调用）"""
+        if self.loop is None or self._stopped is None:
+            self.running = False
+            return
+        self.loop.call_soon_threadsafe(self._stopped.set)
+
+
+class _Shard:
+    """单条组合流连接及其负责的 stream 集合"""
+
+    def __init__(self, index):
+        self.index = index
+        self.streams = set()
+        self.websocket = None
+        self.task = None
+        self.request_id = 0
+
+    def next_request_id(self):
+        self.request_id += 1
+        return self.request_id
+
+
+class MarketDataHub(_StreamHub):
+    """
+    共享行情数据中心
+
+    每个 stream 只对应一个订阅者 (callback, loop)。callback 可以是协程函数或普通函数：
+    - 协程函数：在订阅者所属事件循环中调度执行；上一条消息仍在处理时只保留最新一条，
+      处理完成后立即投递最新值（合并中间报价，但最后一条不会丢失）
+    - 普通函数：通过 call_soon_threadsafe 投递到订阅者事件循环
+    """
+
+    name = "行情中心"
+    thread_name = "market-data-hub"
+
+    def __init__(self, url=COMBINED_STREAM_URL, max_streams_per_connection=MAX_STREAMS_PER_CONNECTION):
+        super().__init__()
+        self.url = url
+        self.max_streams_per_connection = max_streams_per_connection
+        # 每个 stream 尚未投递的最新消息，以及已安排投递任务的 stream -> 该任务所属的订阅者
+        self._latest = {}
+        self._pending = {}
+        self._shards = []
+        self._stream_shard = {}
+
+    @staticmethod
+    def book_ticker_stream(coin_name, contract_type):
+        """生成 bookTicker stream 名称，如 btcusdt@bookTicker"""
+        return f"{coin_name.lower()}{contract_type.lower()}@bookTicker"
+
+    @property
+    def connection_count(self):
+        return sum(1 for shard in self._shards if shard.websocket is not None)
+
+    def subscribe(self, stream, callback, loop=None):
+        """登记订阅者并在对应分片上发送订阅请求（可在任意线程调用）"""
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        with self._lock:
+            self._subscribers[stream] = (callback, loop)
+            # 旧订阅者的投递任务会自行退出，新消息由新订阅者的投递任务处理
+            self._pending.pop(stream, None)
+        self._call_in_hub_loop(self._add_stream, stream)
+
+    def unsubscribe(self, stream):
+        """移除订阅者并取消对应 stream 的订阅（可在任意线程调用）"""
+        with self._lock:
+            self._subscribers.pop(stream, None)
+            self._latest.pop(stream, None)
+            self._pending.pop(stream, None)
+        self._call_in_hub_loop(self._remove_stream, stream)
+
+    def _add_stream(self, stream):
+        if stream in self._stream_shard:
+            return
+        shard = next((s for s in self._shards if len(s.streams) < self.max_streams_per_connection), None)
+        if shard is None:
+            shard = _Shard(len(self._shards))
+            self._shards.append(shard)
+        shard.streams.add(stream)
+        self._stream_shard[stream] = shard
+
+        if self.running:
+            if shard.task is None:
+                shard.task = self.loop.create_task(self._run_shard(shard))
+            elif shard.websocket is not None:
+                self.loop.create_task(self._send_method(shard, "SUBSCRIBE", [stream]))
+
+    def _remove_stream(self, stream):
+        shard = self._stream_shard.pop(stream, None)
+        if shard is None:
+            return
+        shard.streams.discard(stream)
+        if self.running and shard.websocket is not None:
+            self.loop.create_task(self._send_method(shard, "UNSUBSCRIBE", [stream]))
+
+    async def _send_method(self, shard, method, streams):
+        """分批发送 SUBSCRIBE/UNSUBSCRIBE 请求"""
+        streams = list(streams)
+        for i in range(0, len(streams), SUBSCRIBE_CHUNK_SIZE):
+            payload = {
+                "method": method,
+                "params": streams[i:i + SUBSCRIBE_CHUNK_SIZE],
+                "id": shard.next_request_id(),
+            }
+            try:
+                await shard.websocket.send(json.dumps(payload))
+            except Exception as e:
+                logger.warning(f"[{self.name}] 分片 {shard.index} 发送 {method} 失败: {e}")
+                return
+            await asyncio.sleep(0.2)
+        logger.info(f"[{self.name}] 分片 {shard.index} 已发送 {method}: {len(streams)} 个 stream")
+
+    async def _run_shard(self, shard):
+        """维护单条组合流连接：断线自动重连并重新订阅"""
+        while self.running:
+            try:
+                async with websockets.connect(self.url) as websocket:
+                    shard.websocket = websocket
+                    logger.info(f"[{self.name}] 分片 {shard.index} 连接成功，订阅 {len(shard.streams)} 个 stream")
+                    await self._send_method(shard, "SUBSCRIBE", shard.streams)
+                    while self.running:
+                        message = await websocket.recv()
+                        stream, event = decode_stream_event(message)
+                        if stream is not None:
+                            self._dispatch(stream, event)
+            except asyncio.CancelledError:
+                raise
+            except websockets.exceptions.ConnectionClosed:
+                logger.warning(f"[{self.name}] 分片 {shard.index} 连接已关闭，尝试重新连接...")
+            except Exception as e:
+                logger.error(f"[{self.name}] 分片 {shard.index} 连接异常: {e}")
+            finally:
+                shard.websocket = None
+            if self.running:
+                self.reconnects += 1
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    def _dispatch(self, stream, data):
+        """把一条行情推送给订阅者"""
+        subscriber = self._subscribers.get(stream)
+        if subscriber is None or data is None:
+            return
+        callback, loop = subscriber
+        if not asyncio.iscoroutinefunction(callback):
+            self._deliver(stream, callback, loop, data)
+            return
+
+        with self._lock:
+            self._latest[stream] = data
+            if stream in self._pending:
+                # 投递任务尚未取走上一条，由它读取最新值
+                return
+            self._pending[stream] = subscriber
+        try:
+            if loop is self.loop:
+                loop.create_task(self._drain(stream, subscriber))
+            else:
+                asyncio.run_coroutine_threadsafe(self._drain(stream, subscriber), loop)
+        except RuntimeError:
+            # 订阅者的事件循环已关闭
+            self._release_pending(stream, subscriber)
+
+    def _release_pending(self, stream, subscriber):
+        with self._lock:
+            if self._pending.get(stream) is subscriber:
+                del self._pending[stream]
+
+    async def _drain(self, stream, subscriber):
+        """在订阅者事件循环中依次处理最新消息，直到没有新消息或订阅者已变更"""
+        callback = subscriber[0]
+        while True:
+            with self._lock:
+                if self._subscribers.get(stream) is not subscriber:
+                    # 已退订或被新订阅者替换，剩余消息不再投递给旧回调
+                    if self._pending.get(stream) is subscriber:
+                        del self._pending[stream]
+                    return
+                data = self._latest.pop(stream, None)
+                if data is None:
+                    self._pending.pop(stream, None)
+                    return
+            try:
+                await callback(data)
+            except asyncio.CancelledError:
+                self._release_pending(stream, subscriber)
+                raise
+            except Exception as e:
+                logger.error(f"[{self.name}] {stream} 处理失败: {e}")
+
+    async def _on_start(self):
+        for shard in self._shards:
+            if shard.task is None and shard.streams:
+                shard.task = self.loop.create_task(self._run_shard(shard))
+
+    async def _on_stop(self):
+        for shard in self._shards:
+            if shard.task is not None:
+                shard.task.cancel()
+                shard.task = None
+
+
+class UserDataHub(_StreamHub):
+    """
+    账户级用户数据流
+
+    一个账户只获取一个 listenKey、只跑一个续期任务、只开一条连接。
+    每条事件只解析一次（解码为 OrderUpdate），ORDER_TRADE_UPDATE 按 o.s 查表分发给对应机器人，订单推送不丢弃、按到达顺序投递。
+    协程回调处理完（入队）后才读取下一条推送：订阅者队列满时接收随之暂停，形成背压，不会堆积投递任务。
+    """
+
+    name = "用户数据流"
+    thread_name = "user-data-hub"
+
+    def __init__(self, exchange, url=USER_STREAM_URL):
+        super().__init__()
+        self.exchange = exchange
+        self.url = url
+        self.listen_key = None
+        self.websocket = None
+        self._tasks = []
+
+    def subscribe(self, symbol, callback, loop=None):
+        """登记某个交易对（如 BTCUSDT）的订单推送处理函数（可在任意线程调用）"""
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        with self._lock:
+            self._subscribers[symbol.upper()] = (callback, loop)
+
+    def unsubscribe(self, symbol):
+        with self._lock:
+            self._subscribers.pop(symbol.upper(), None)
+
+    async def _refresh_listen_key(self):
+        """获取（或延长）listenKey，返回是否与当前 key 不同"""
+        response = await self.loop.run_in_executor(None, self.exchange.fapiPrivatePostListenKey)
+        listen_key = response.get("listenKey")
+        if not listen_key:
+            raise ValueError("获取的 listenKey 为空")
+        changed = listen_key != self.listen_key
+        self.listen_key = listen_key
+        if changed:
+            logger.info(f"[{self.name}] 成功获取 listenKey: {listen_key}")
+        return changed
+
+    async def _keep_listen_key_alive(self):
+        """定期延长 listenKey，整个账户只有这一个续期任务"""
+        while self.running:
+            try:
+                await asyncio.sleep(LISTEN_KEY_KEEPALIVE_INTERVAL)
+                await self.loop.run_in_executor(None, self.exchange.fapiPrivatePutListenKey)
+                if await self._refresh_listen_key():
+                    await self._close_websocket()
+                logger.info(f"[{self.name}] listenKey 已续期")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[{self.name}] 更新 listenKey 失败: {e}")
+                await asyncio.sleep(60)
+
+    async def _close_websocket(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+
+    async def _run_connection(self):
+        """维护用户数据流连接：断线或 listenKey 过期后重新获取并重连"""
+        while self.running:
+            try:
+                if self.listen_key is None:
+                    await self._refresh_listen_key()
+                async with websockets.connect(f"{self.url}/{self.listen_key}") as websocket:
+                    self.websocket = websocket
+                    logger.info(f"[{self.name}] 连接成功，开始接收订单推送")
+                    while self.running:
+                        message = await websocket.recv()
+                        event = decode_event(message)
+                        if isinstance(event, OrderUpdate):
+                            await self._dispatch(event)
+                        elif isinstance(event, dict) and event.get("e") == "listenKeyExpired":
+                            logger.warning(f"[{self.name}] listenKey 已过期，重新获取")
+                            self.listen_key = None
+                            break
+            except asyncio.CancelledError:
+                raise
+            except websockets.exceptions.ConnectionClosed:
+                logger.warning(f"[{self.name}] 连接已关闭，尝试重新连接...")
+            except Exception as e:
+                logger.error(f"[{self.name}] 连接异常: {e}")
+            finally:
+                self.websocket = None
+            if self.running:
+                self.reconnects += 1
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _dispatch(self, order):
+        """按交易对分发订单推送（OrderUpdate），非本进程管理的交易对直接忽略"""
+        subscriber = self._subscribers.get(order.symbol)
+        if subscriber is None:
+            return
+        callback, loop = subscriber
+        if not asyncio.iscoroutinefunction(callback):
+            self._deliver(order.symbol, callback, loop, order)
+            return
+        if loop.is_closed():
+            return
+
+        if loop is self.loop:
+            future = loop.create_task(callback(order))
+        else:
+            future = asyncio.wrap_future(asyncio.run_coroutine_threadsafe(callback(order), loop))
+        # 等待订阅者处理完成；订阅者已退订（机器人停止，队列不再消费）时放弃本条，避免阻塞其他交易对
+        while True:
+            done, _ = await asyncio.wait({future}, timeout=1)
+            if done:
+                break
+            if self._subscribers.get(order.symbol) is not subscriber:
+                future.cancel()
+                logger.warning(f"[{self.name}] {order.symbol} 已退订，放弃未投递的订单推送")
+                return
+        self._log_callback_error(order.symbol, future)
+
+    async def _on_start(self):
+        self._tasks = [
+            self.loop.create_task(self._run_connection()),
+            self.loop.create_task(self._keep_listen_key_alive()),
+        ]
+
+    async def _on_stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
@@ -0,0 +1,114 @@
+"""
+有界事件队列
+
+WebSocket 接收端只负责解析和入队，由独立的工作任务消费，避免慢处理拖住连接。
+每个队列有明确的溢出策略，并记录深度、丢弃数和排队延迟供状态汇总使用。
+"""
+
+import asyncio
+import time
+from collections import deque
+
+# 队列满时丢弃最早的一条（适合只关心最新状态的行情）
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+# 队列满时丢弃新到的一条
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+# 队列满时等待消费（适合不能丢失的订单推送）
+OVERFLOW_BLOCK = 'block'
+
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_BLOCK)
+
+
+class StreamQueue:
+    """单生产者/单消费者的有界队列，必须在所属事件循环内创建和使用"""
+
+    def __init__(self, name, maxsize, overflow=OVERFLOW_DROP_OLDEST):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"未知的溢出策略: {overflow}")
+        if maxsize < 1:
+            raise ValueError("队列长度必须大于 0")
+        self.name = name
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self._items = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._lag_total = 0.0
+
+    def __len__(self):
+        return len(self._items)
+
+    def _append(self, item):
+        self._items.append((time.time(), item))
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, len(self._items))
+        self._not_empty.set()
+        if len(self._items) >= self.maxsize:
+            self._not_full.clear()
+
+    def put_nowait(self, item):
+        """
+        入队，不等待。队列满时按溢出策略处理
+
+        Returns:
+            bool: 本条是否入队（drop_newest / block 策略在队列满时返回 False）
+        """
+        if len(self._items) >= self.maxsize:
+            if self.overflow != OVERFLOW_DROP_OLDEST:
+                self.dropped += 1
+                return False
+            self._items.popleft()
+            self.dropped += 1
+        self._append(item)
+        return True
+
+    async def put(self, item):
+        """入队；block 策略在队列满时等待消费者腾出空间"""
+        if self.overflow == OVERFLOW_BLOCK:
+            while len(self._items) >= self.maxsize:
+                await self._not_full.wait()
+            self._append(item)
+            return True
+        return self.put_nowait(item)
+
+    async def get(self):
+        """出队，队列为空时等待"""
+        while not self._items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        enqueued_at, item = self._items.popleft()
+        self._not_full.set()
+        if not self._items:
+            self._not_empty.clear()
+
+        lag = time.time() - enqueued_at
+        self.dequeued += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self._lag_total += lag
+        return item
+
+    def metrics(self):
+        """队列指标：深度、丢弃数和排队延迟（毫秒）"""
+        return {
+            'name': self.name,
+            'overflow': self.overflow,
+            'depth': len(self._items),
+            'maxsize': self.maxsize,
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'dequeued': self.dequeued,
+            'dropped': self.dropped,
+            'lag_ms': round(self.last_lag * 1000, 2),
+            'max_lag_ms': round(self.max_lag * 1000, 2),
+            'avg_lag_ms': round(self._lag_total / self.dequeued * 1000, 2) if self.dequeued else 0.0,
+        }
@@ -0,0 +1,185 @@
+"""
+WebSocket / REST 流量日志（录制与回放）
+
+二进制格式：文件头 ASGJ\\x01，之后每条记录为
+    <类型:uint8> <相对时间:float64 秒，单调时钟> <长度:uint32> <内容>
+类型最高位表示内容经过 zlib 压缩。内容：
+- META: JSON，交易对、配置、录制开始时间；之后可以追加 META 记录（如交易对的市场信息），读取时合并
+- WS:   收到的原始推送文本
+- REST: JSON，{m: 方法, path: 路径, params: 参数（去掉签名和时间戳）, resp: 响应 | err: [异常类名, 信息]}
+
+环境变量 CAPTURE_DIR 非空时，每个机器人把流量写入 <CAPTURE_DIR>/capture_<交易对>_<时间>.asgj，
+回放见 scripts/replay_journal.py。
+"""
+
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from contextvars import ContextVar
+from urllib.parse import parse_qsl, urlsplit
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "")
+
+MAGIC = b'ASGJ\x01'
+KIND_META = 0
+KIND_WS = 1
+KIND_REST = 2
+_COMPRESSED = 0x80
+_RECORD_HEADER = struct.Struct('<BdI')
+# 超过该长度的内容才压缩（行情推送通常只有 200 字节左右，压缩得不偿失）
+COMPRESS_MIN_BYTES = 512
+# 最长多久刷一次盘
+FLUSH_INTERVAL = 1.0
+
+# 不参与请求匹配的参数：签名、时间戳，以及每次运行都不同的 clientOrderId
+VOLATILE_PARAMS = {'signature', 'timestamp', 'recvWindow', 'newClientOrderId', 'origClientOrderId'}
+
+
+def request_params(url, body=None):
+    """从 URL 查询串和表单 body 中取出请求参数（不含签名和时间戳）"""
+    parts = urlsplit(url)
+    params = dict(parse_qsl(parts.query))
+    if isinstance(body, (str, bytes)) and body:
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', 'replace')
+        params.update(parse_qsl(body))
+    for name in ('signature', 'timestamp', 'recvWindow'):
+        params.pop(name, None)
+    return parts.path, params
+
+
+def request_key(method, path, params):
+    """回放时匹配请求的键：方法 + 路径 + 去掉易变字段后的参数"""
+    stable = {}
+    for name, value in params.items():
+        if name in VOLATILE_PARAMS:
+            continue
+        if name == 'batchOrders':
+            try:
+                orders = json.loads(value)
+                value = json.dumps([{k: v for k, v in order.items() if k not in VOLATILE_PARAMS}
+                                    for order in orders], sort_keys=True)
+            except (ValueError, AttributeError):
+                pass
+        stable[name] = value
+    return method.upper(), path, tuple(sorted(stable.items()))
+
+
+class JournalWriter:
+    """流量日志写入器，线程安全（REST 调用在线程池中执行）"""
+
+    def __init__(self, path, meta=None):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._last_flush = self._started
+        self.records = 0
+        self.write(KIND_META, json.dumps(dict(meta or {}, wall_time=time.time()), ensure_ascii=False))
+
+    def write(self, kind, payload):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        if len(payload) >= COMPRESS_MIN_BYTES:
+            payload = zlib.compress(payload)
+            kind |= _COMPRESSED
+        now = time.monotonic()
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(_RECORD_HEADER.pack(kind, now - self._started, len(payload)))
+            self._file.write(payload)
+            self.records += 1
+            if now - self._last_flush >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+
+    def write_meta(self, meta):
+        """追加元数据（读取时与之前的 META 合并）"""
+        self.write(KIND_META, json.dumps(meta, ensure_ascii=False, separators=(',', ':'), default=str))
+
+    def write_ws(self, message):
+        """记录一条推送（原始文本或已解析的 dict）"""
+        if isinstance(message, dict):
+            message = json.dumps(message, separators=(',', ':'))
+        self.write(KIND_WS, message)
+
+    def write_rest(self, method, url, body, response=None, error=None):
+        path, params = request_params(url, body)
+        entry = {'m': method.upper(), 'path': path, 'params': params}
+        if error is not None:
+            entry['err'] = [type(error).__name__, str(error)]
+        else:
+            entry['resp'] = response
+        self.write(KIND_REST, json.dumps(entry, separators=(',', ':'), default=str))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_journal(path):
+    """
+    逐条读取流量日志
+
+    Yields:
+        tuple: (类型, 相对时间, 内容)；META/REST 的内容为解析后的 dict，WS 为原始文本
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"不是流量日志文件: {path}")
+        while True:
+            header = f.read(_RECORD_HEADER.size)
+            if len(header) < _RECORD_HEADER.size:
+                return
+            kind, offset, length = _RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                # 录制进程异常退出时最后一条可能不完整
+                return
+            if kind & _COMPRESSED:
+                payload = zlib.decompress(payload)
+                kind &= ~_COMPRESSED
+            text = payload.decode('utf-8')
+            yield kind, offset, (text if kind == KIND_WS else json.loads(text))
+
+
+def open_capture(symbol, config):
+    """CAPTURE_DIR 已设置时为交易对创建流量日志，否则返回 None"""
+    if not CAPTURE_DIR:
+        return None
+    path = os.path.join(CAPTURE_DIR, f"capture_{symbol}_{time.strftime('%Y%m%d_%H%M%S')}.asgj")
+    try:
+        writer = JournalWriter(path, {'symbol': symbol, 'config': config})
+    except OSError as e:
+        logger.error(f"创建流量日志失败: {e}")
+        return None
+    logger.info(f"流量录制已开启: {path}")
+    return writer
+
+
+# 当前任务所属交易对的流量日志；REST 调用在线程池中执行时随 contextvars 一起传递
+_current_journal = ContextVar('traffic_journal', default=None)
+
+
+def use_journal(journal):
+    """把流量日志绑定到当前上下文，返回可用于 reset_journal 的 token"""
+    return _current_journal.set(journal)
+
+
+def reset_journal(token):
+    _current_journal.reset(token)
+
+
+def current_journal():
+    return _current_journal.get()
@@ -18,6 +18,9 @@ ENABLE_NOTIFICATIONS = os.getenv("ENABLE_NOTIFICATIONS", "true").lower() == "tru
 NOTIFICATION_INTERVAL = int(os.getenv("NOTIFICATION_INTERVAL", "3600"))  # 定时汇总通知间隔（秒）
 
 import aiohttp  # 添加这个导入用于发送HTTP请求
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'multi_bot'))
+import fastjson  # WebSocket 消息解码（优先使用 orjson/msgspec）
 
 # 加载环境变量
 load_dotenv()
@@ -538,23 +541,24 @@ class GridTradingBot:
             await self.subscribe_balances(websocket)  # 订阅余额
             while True:
                 try:
+                    # 每条消息只解码一次，解析结果直接传给各处理函数
                     message = await websocket.recv()
-                    data = json.loads(message)
+                    data = fastjson.loads(message)
                     
                     # 添加调试信息，记录所有收到的channel类型
                     channel = data.get("channel", "unknown")
                     event = data.get("event", "unknown")
                     
                     if data.get("channel") == "futures.tickers":
-                        await self.handle_ticker_update(message)
+                        await self.handle_ticker_update(data)
                     elif data.get("channel") == "futures.positions":
-                        await self.handle_position_update(message)
+                        await self.handle_position_update(data)
                     elif data.get("channel") == "futures.orders":  # 处理挂单更新
-                        await self.handle_order_update(message)
+                        await self.handle_order_update(data)
                     elif data.get("channel") == "futures.book_ticker":  # 处理 book_ticker 更新
-                        await self.handle_book_ticker_update(message)
+                        await self.handle_book_ticker_update(data)
                     elif data.get("channel") == "futures.balances":  # 处理余额更新
-                        await self.handle_balance_update(message)
+                        await self.handle_balance_update(data)
                     else:
                         # 记录未处理的消息类型（只记录前几次避免日志过多）
                         if not hasattr(self, '_unknown_channels'):
@@ -646,7 +650,7 @@ class GridTradingBot:
     async def handle_balance_update(self, message):
         """处理余额更新"""
         try:
-            data = json.loads(message)
+            data = message if isinstance(message, dict) else fastjson.loads(message)
             if data.get("channel") == "futures.balances" and data.get("event") == "update":
                 balances = data.get("result", [])
                 if not balances:
@@ -711,7 +715,7 @@ class GridTradingBot:
 
     async def handle_ticker_update(self, message):
         """处理 ticker 更新"""
-        data = json.loads(message)
+        data = message if isinstance(message, dict) else fastjson.loads(message)
         if data.get("event") == "update":
             self.latest_price = float(data["result"][0]["last"])
             print(f"最新价格: {self.latest_price:.8f}")
@@ -735,7 +739,7 @@ class GridTradingBot:
 
     async def handle_book_ticker_update(self, message):
         """处理 book_ticker 更新"""
-        data = json.loads(message)
+        data = message if isinstance(message, dict) else fastjson.loads(message)
         if data.get("event") == "update":
             ticker_data = data["result"]
             # print('book数据', ticker_data)
@@ -747,7 +751,7 @@ class GridTradingBot:
 
     async def handle_position_update(self, message):
         """处理持仓更新"""
-        data = json.loads(message)
+        data = message if isinstance(message, dict) else fastjson.loads(message)
         if data.get("event") == "update":
             position_data = data["result"]
             if isinstance(position_data, list) and len(position_data) > 0:
@@ -765,7 +769,7 @@ class GridTradingBot:
 
     async def handle_order_update(self, message):
         """处理挂单更新"""
-        data = json.loads(message)
+        data = message if isinstance(message, dict) else fastjson.loads(message)
         # print(data)
         if data.get("event") == "update":
             order_data = data["result"]